@@ -1,11 +1,26 @@
 import os
 import io
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+import csv
+import time
+import tempfile
+import re
+import hashlib
+import hmac
+import threading
+import bisect
+import click
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, stream_with_context, g, has_app_context
 from flask_mysqldb import MySQL
+import MySQLdb.cursors
+import MySQLdb.converters
+from MySQLdb.constants import FIELD_TYPE
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4, landscape
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -13,8 +28,9 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 import pandas as pd
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
 
 app = Flask(__name__)
@@ -27,7 +43,704 @@ app.config['MYSQL_PASSWORD'] = ''
 app.config['MYSQL_DB'] = 'inventaris_sppg'
 app.config['MYSQL_CURSORCLASS'] = 'DictCursor'
 
-mysql = MySQL(app)
+# Kolom DECIMAL langsung dibaca sebagai float oleh driver, jadi route tidak perlu
+# mengonversi Decimal baris per baris
+KONVERSI_MYSQL = MySQLdb.converters.conversions.copy()
+KONVERSI_MYSQL[FIELD_TYPE.DECIMAL] = float
+KONVERSI_MYSQL[FIELD_TYPE.NEWDECIMAL] = float
+app.config['MYSQL_CUSTOM_OPTIONS'] = {'conv': KONVERSI_MYSQL}
+
+# Batas umur snapshot dashboard (detik) sebelum dibangun ulang penuh
+app.config['DASHBOARD_SNAPSHOT_TTL'] = 300
+
+# Batas umur cache data referensi (kategori, satuan, bahan aktif) dalam detik
+app.config['REFERENSI_CACHE_TTL'] = 600
+
+# Pagination daftar transaksi dan laporan (baris per halaman)
+app.config['PAGE_SIZE'] = 50
+app.config['MAX_PAGE_SIZE'] = 500
+
+# Ukuran potongan (byte) saat mengirim file export yang sudah selesai dibuat
+app.config['EXPORT_CHUNK_SIZE'] = 64 * 1024
+
+# Jumlah baris yang diambil dan dikirim sekaligus pada export CSV/NDJSON
+app.config['EXPORT_BATCH_SIZE'] = 1000
+
+# Export job di latar belakang: jumlah thread, folder cache hasil, dan umur cache (detik)
+app.config['EXPORT_WORKERS'] = 2
+app.config['EXPORT_CACHE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'export_cache')
+app.config['EXPORT_CACHE_MAX_AGE'] = 24 * 60 * 60
+
+# Import penerimaan dari file: jumlah baris per INSERT dan batas ukuran upload
+app.config['IMPORT_BATCH_SIZE'] = 1000
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+
+# Server-Sent Events (/api/stream): jumlah event terakhir yang disimpan untuk
+# pelanggan yang tersambung ulang, interval heartbeat (detik), dan interval pengecekan
+# perubahan dari worker lain (detik)
+app.config['SSE_BUFFER_SIZE'] = 256
+app.config['SSE_HEARTBEAT'] = 15
+app.config['SSE_POLL_INTERVAL'] = 2
+
+# Pool koneksi database: ukuran minimum (dibuka saat warm-up) dan maksimum,
+# batas tunggu checkout (detik), umur maksimum koneksi (detik, 0 = tanpa batas),
+# dan ping sebelum koneksi dipinjamkan
+app.config['MYSQL_POOL_MIN_SIZE'] = 2
+app.config['MYSQL_POOL_MAX_SIZE'] = 10
+app.config['MYSQL_POOL_TIMEOUT'] = 5
+app.config['MYSQL_POOL_RECYCLE'] = 3600
+app.config['MYSQL_POOL_PRE_PING'] = True
+
+# Replika baca (read replica) untuk laporan, export, dan API daftar transaksi. Kosongkan
+# MYSQL_REPLICA_HOST untuk memakai primary saja. User/password kosong = sama dengan
+# primary; user replika butuh hak REPLICATION CLIENT untuk membaca lag. Replika dipakai
+# selama lag-nya <= MYSQL_REPLICA_MAX_LAG detik (dicek tiap MYSQL_REPLICA_CHECK_INTERVAL
+# detik); jika tidak bisa dihubungi, primary dipakai dan replika dicoba lagi setelah
+# MYSQL_REPLICA_RETRY detik. Sesi yang menulis dalam MYSQL_REPLICA_MAX_LAG detik
+# terakhir tetap membaca dari primary supaya perubahannya sendiri langsung terlihat.
+# Contoh dengan dua instance MySQL lokal: MYSQL_REPLICA_HOST=127.0.0.1 MYSQL_REPLICA_PORT=3307
+app.config['MYSQL_REPLICA_HOST'] = os.environ.get('MYSQL_REPLICA_HOST', '')
+app.config['MYSQL_REPLICA_PORT'] = int(os.environ.get('MYSQL_REPLICA_PORT', 3306))
+app.config['MYSQL_REPLICA_USER'] = os.environ.get('MYSQL_REPLICA_USER', '')
+app.config['MYSQL_REPLICA_PASSWORD'] = os.environ.get('MYSQL_REPLICA_PASSWORD', '')
+app.config['MYSQL_REPLICA_CONNECT_TIMEOUT'] = 2
+app.config['MYSQL_REPLICA_MAX_LAG'] = 5
+app.config['MYSQL_REPLICA_CHECK_INTERVAL'] = 5
+app.config['MYSQL_REPLICA_RETRY'] = 30
+
+# Metrik Prometheus (/metrics): batas bucket histogram latensi request (detik) dan
+# jumlah query per request, serta token Bearer untuk scraper. Tanpa token, /metrics
+# hanya bisa dibuka sesi admin.
+app.config['METRICS_LATENCY_BUCKETS'] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+app.config['METRICS_QUERY_BUCKETS'] = (1, 2, 5, 10, 20, 50, 100, 200)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+
+# Profiler SQL untuk development/staging (jangan dinyalakan di produksi): mencatat
+# setiap query per request, menandai query yang berulang (N+1) minimal
+# SQL_PROFILER_N_PLUS_1 kali, dan menyimpan EXPLAIN query yang lebih lambat dari
+# SQL_PROFILER_SLOW_MS. Hanya request dengan temuan yang disimpan (maks. SQL_PROFILER_MAX_LAPORAN).
+app.config['SQL_PROFILER'] = os.environ.get('SQL_PROFILER', '') == '1'
+app.config['SQL_PROFILER_N_PLUS_1'] = 3
+app.config['SQL_PROFILER_SLOW_MS'] = 100
+app.config['SQL_PROFILER_MAX_LAPORAN'] = 100
+
+# Pool Koneksi Database
+# flask_mysqldb membuka koneksi baru di setiap app context. MySQLPool meminjam
+# koneksi dari pool saat mysql.connection pertama dipakai, dan teardown app context
+# (yang memanggil close()) mengembalikannya ke pool, jadi kode route tidak berubah.
+class PoolHabis(Exception):
+    """Tidak ada koneksi yang bisa dipinjam sampai batas MYSQL_POOL_TIMEOUT"""
+
+class CursorTerukur:
+    """Cursor yang mencatat jumlah query, waktu SQL, dan baris yang diambil ke g.metrik_sql"""
+    def __init__(self, cursor):
+        self._cursor = cursor
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+    
+    @staticmethod
+    def _catat(query=0, detik=0.0, baris=0):
+        metrik = g.get('metrik_sql') if has_app_context() else None
+        if metrik is not None:
+            metrik[0] += query
+            metrik[1] += detik
+            metrik[2] += baris
+    
+    @staticmethod
+    def _rekam(query, args, detik, bisa_explain):
+        # Hanya aktif jika profiler SQL menyiapkan g.profil_sql untuk request ini
+        profil = g.get('profil_sql') if has_app_context() else None
+        if profil is not None:
+            profil.append((query, args, detik, bisa_explain))
+    
+    def execute(self, query, args=None):
+        mulai = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            detik = time.perf_counter() - mulai
+            self._catat(1, detik)
+            # EXPLAIN hanya untuk SELECT; statement lain bisa punya efek samping
+            self._rekam(query, args, detik, query.lstrip('( \n\t').lower().startswith(('select', 'with')))
+    
+    def executemany(self, query, args):
+        mulai = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            detik = time.perf_counter() - mulai
+            self._catat(1, detik)
+            # executemany membawa banyak set parameter, tidak ada satu rencana untuk di-EXPLAIN
+            self._rekam(query, None, detik, False)
+    
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._catat(baris=1)
+        return row
+    
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._catat(baris=len(rows))
+        return rows
+    
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._catat(baris=len(rows))
+        return rows
+    
+    def __iter__(self):
+        jumlah = 0
+        try:
+            for row in self._cursor:
+                jumlah += 1
+                yield row
+        finally:
+            self._catat(baris=jumlah)
+
+class KoneksiPool:
+    """Koneksi pinjaman dari pool; close() mengembalikan koneksi ke pool"""
+    def __init__(self, pool, koneksi, dibuat):
+        self._pool = pool
+        self._koneksi = koneksi
+        self._dibuat = dibuat
+    
+    def __getattr__(self, name):
+        return getattr(self._koneksi, name)
+    
+    def cursor(self, *args):
+        return CursorTerukur(self._koneksi.cursor(*args))
+    
+    def commit(self):
+        self._koneksi.commit()
+        # Dipakai @baca_replika: sesi yang baru menulis tetap membaca dari primary
+        if has_app_context():
+            g.ada_tulis = True
+    
+    def close(self):
+        if self._koneksi is not None:
+            self._pool.kembalikan(self._koneksi, self._dibuat)
+            self._koneksi = None
+
+class MySQLPool(MySQL):
+    def __init__(self, app=None):
+        self.replika = None
+        self._idle = deque()
+        self._kondisi = threading.Condition()
+        self._terbuka = 0
+        self._dipakai = 0
+        self._statistik = {'checkout': 0, 'tunggu_total': 0.0, 'tunggu_maks': 0.0,
+                           'timeout': 0, 'dibuat': 0, 'dibuang': 0}
+        super().__init__(app)
+    
+    def _buka_koneksi(self):
+        # Argumen koneksi dibaca dari app.config oleh MySQL.connect
+        with self.app.app_context():
+            koneksi = MySQL.connect.fget(self)
+        with self._kondisi:
+            self._statistik['dibuat'] += 1
+        return koneksi, time.monotonic()
+    
+    def _buang(self, koneksi):
+        try:
+            koneksi.close()
+        except Exception:
+            pass
+        with self._kondisi:
+            self._terbuka -= 1
+            self._statistik['dibuang'] += 1
+            self._kondisi.notify()
+    
+    def _masih_layak(self, koneksi, dibuat):
+        recycle = self.app.config['MYSQL_POOL_RECYCLE']
+        if recycle and time.monotonic() - dibuat > recycle:
+            return False
+        if self.app.config['MYSQL_POOL_PRE_PING']:
+            try:
+                koneksi.ping()
+            except MySQLdb.Error:
+                return False
+        return True
+    
+    def warm_up(self):
+        """Buka koneksi sampai MYSQL_POOL_MIN_SIZE sebelum request pertama"""
+        while True:
+            with self._kondisi:
+                if self._terbuka >= self.app.config['MYSQL_POOL_MIN_SIZE']:
+                    return
+                self._terbuka += 1
+            try:
+                koneksi, dibuat = self._buka_koneksi()
+            except Exception:
+                with self._kondisi:
+                    self._terbuka -= 1
+                raise
+            with self._kondisi:
+                self._idle.append((koneksi, dibuat))
+                self._kondisi.notify()
+    
+    def pinjam(self):
+        """Pinjam koneksi dari pool, tunggu paling lama MYSQL_POOL_TIMEOUT detik"""
+        mulai = time.monotonic()
+        batas = mulai + self.app.config['MYSQL_POOL_TIMEOUT']
+        
+        while True:
+            koneksi = None
+            with self._kondisi:
+                while not self._idle and self._terbuka >= self.app.config['MYSQL_POOL_MAX_SIZE']:
+                    sisa = batas - time.monotonic()
+                    if sisa <= 0:
+                        self._statistik['timeout'] += 1
+                        raise PoolHabis('Semua koneksi database sedang dipakai')
+                    self._kondisi.wait(sisa)
+                
+                if self._idle:
+                    koneksi, dibuat = self._idle.pop()
+                else:
+                    self._terbuka += 1
+                self._dipakai += 1
+            
+            if koneksi is None:
+                try:
+                    koneksi, dibuat = self._buka_koneksi()
+                except Exception:
+                    with self._kondisi:
+                        self._terbuka -= 1
+                        self._dipakai -= 1
+                        self._kondisi.notify()
+                    raise
+            elif not self._masih_layak(koneksi, dibuat):
+                # Koneksi basi/putus dibuang, lalu coba lagi (koneksi baru dibuka)
+                with self._kondisi:
+                    self._dipakai -= 1
+                self._buang(koneksi)
+                continue
+            
+            tunggu = time.monotonic() - mulai
+            with self._kondisi:
+                self._statistik['checkout'] += 1
+                self._statistik['tunggu_total'] += tunggu
+                self._statistik['tunggu_maks'] = max(self._statistik['tunggu_maks'], tunggu)
+            return KoneksiPool(self, koneksi, dibuat)
+    
+    def kembalikan(self, koneksi, dibuat):
+        # Transaksi yang belum di-commit dibatalkan sebelum koneksi dipakai request lain
+        try:
+            koneksi.rollback()
+        except MySQLdb.Error:
+            with self._kondisi:
+                self._dipakai -= 1
+            self._buang(koneksi)
+            return
+        
+        with self._kondisi:
+            self._dipakai -= 1
+            self._idle.append((koneksi, dibuat))
+            self._kondisi.notify()
+    
+    @property
+    def connect(self):
+        return self.pinjam()
+    
+    @property
+    def connection(self):
+        # Route yang ditandai @baca_replika memakai replika selama replika bisa dipakai;
+        # sekali jatuh ke primary, sisa request itu tetap di primary
+        if self.replika is not None and has_app_context() and g.get('pakai_replika'):
+            koneksi = self.replika.koneksi_baca()
+            if koneksi is not None:
+                return koneksi
+            g.pakai_replika = False
+        return MySQL.connection.fget(self)
+    
+    @property
+    def koneksi_primary(self):
+        """Koneksi primary untuk app context ini, walaupun route memakai replika"""
+        return MySQL.connection.fget(self)
+    
+    def statistik(self):
+        """Ukuran pool, koneksi yang dipakai, dan waktu tunggu checkout"""
+        with self._kondisi:
+            data = dict(self._statistik)
+            data.update({
+                'ukuran': self._terbuka,
+                'dipakai': self._dipakai,
+                'idle': len(self._idle),
+                'min': self.app.config['MYSQL_POOL_MIN_SIZE'],
+                'maks': self.app.config['MYSQL_POOL_MAX_SIZE'],
+            })
+        data['tunggu_rata'] = data['tunggu_total'] / data['checkout'] if data['checkout'] else 0.0
+        return data
+
+class MySQLReplika(MySQLPool):
+    """Pool koneksi ke replika baca (MYSQL_REPLICA_*), dengan pengecekan lag berkala"""
+    def __init__(self, app=None):
+        self._status = {'sehat': False, 'lag': None, 'error': None, 'dicek': None}
+        self._cek_berikutnya = 0.0
+        self._kunci_cek = threading.Lock()
+        super().__init__(app)
+    
+    @property
+    def aktif(self):
+        return bool(self.app.config['MYSQL_REPLICA_HOST'])
+    
+    def _buka_koneksi(self):
+        config = self.app.config
+        kwargs = {
+            'host': config['MYSQL_REPLICA_HOST'],
+            'port': config['MYSQL_REPLICA_PORT'],
+            'user': config['MYSQL_REPLICA_USER'] or config['MYSQL_USER'],
+            'passwd': config['MYSQL_REPLICA_PASSWORD'] or config['MYSQL_PASSWORD'] or '',
+            'db': config['MYSQL_DB'],
+            'connect_timeout': config['MYSQL_REPLICA_CONNECT_TIMEOUT'],
+            'charset': config['MYSQL_CHARSET'],
+            'use_unicode': True,
+            'cursorclass': getattr(MySQLdb.cursors, config['MYSQL_CURSORCLASS']),
+        }
+        kwargs.update(config['MYSQL_CUSTOM_OPTIONS'] or {})
+        koneksi = MySQLdb.connect(**kwargs)
+        with self._kondisi:
+            self._statistik['dibuat'] += 1
+        return koneksi, time.monotonic()
+    
+    @property
+    def connection(self):
+        return self.koneksi_baca()
+    
+    def teardown(self, exception):
+        koneksi = g.pop('koneksi_replika', None)
+        if koneksi is not None:
+            koneksi.close()
+    
+    def _tandai(self, sehat, lag=None, error=None, tunda=None):
+        self._status = {'sehat': sehat, 'lag': lag, 'error': error,
+                        'dicek': datetime.now().isoformat(timespec='seconds')}
+        self._cek_berikutnya = time.monotonic() + (tunda or self.app.config['MYSQL_REPLICA_CHECK_INTERVAL'])
+    
+    def cek_status(self):
+        """Status replika (sehat, lag), diperbarui paling sering tiap MYSQL_REPLICA_CHECK_INTERVAL detik"""
+        # Hanya satu thread yang mengecek; thread lain memakai status terakhir
+        if time.monotonic() < self._cek_berikutnya or not self._kunci_cek.acquire(blocking=False):
+            return self._status
+        try:
+            koneksi = self.pinjam()
+            try:
+                lag = baca_lag_replika(koneksi._koneksi.cursor())
+            finally:
+                koneksi.close()
+            
+            if lag is None:
+                self._tandai(False, error='Replikasi berhenti')
+            else:
+                self._tandai(lag <= self.app.config['MYSQL_REPLICA_MAX_LAG'], lag)
+        except (MySQLdb.Error, PoolHabis) as e:
+            self._tandai(False, error=str(e), tunda=self.app.config['MYSQL_REPLICA_RETRY'])
+        finally:
+            self._kunci_cek.release()
+        return self._status
+    
+    def koneksi_baca(self):
+        """Koneksi replika untuk app context ini, None jika replika tidak bisa dipakai"""
+        koneksi = g.get('koneksi_replika')
+        if koneksi is not None:
+            return koneksi
+        if not self.aktif or not self.cek_status()['sehat']:
+            return None
+        try:
+            koneksi = g.koneksi_replika = self.pinjam()
+        except (MySQLdb.Error, PoolHabis) as e:
+            self._tandai(False, error=str(e), tunda=self.app.config['MYSQL_REPLICA_RETRY'])
+            return None
+        return koneksi
+    
+    def statistik(self):
+        data = super().statistik()
+        data.update(aktif=self.aktif, **self._status)
+        return data
+
+def baca_lag_replika(cur):
+    """Lag replikasi (detik) dari SHOW REPLICA STATUS, None jika replikasi berhenti.
+    
+    Server yang bukan replika (mis. salinan read-only yang diisi manual) dianggap tanpa lag.
+    """
+    try:
+        try:
+            cur.execute("SHOW REPLICA STATUS")
+        except MySQLdb.ProgrammingError:
+            # MySQL < 8.0.22 dan MariaDB lama
+            cur.execute("SHOW SLAVE STATUS")
+        status = cur.fetchone()
+    finally:
+        cur.close()
+    if not status:
+        return 0
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return float(lag) if lag is not None else None
+
+mysql = MySQLPool(app)
+mysql_replika = MySQLReplika(app)
+mysql.replika = mysql_replika
+
+def baca_replika(view):
+    """Tandai route read-only supaya query-nya dijalankan di replika baca (jika tersedia)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        tulis_terakhir = session.get('tulis_terakhir', 0)
+        if request.method == 'GET' and time.time() - tulis_terakhir > app.config['MYSQL_REPLICA_MAX_LAG']:
+            g.pakai_replika = True
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.after_request
+def catat_waktu_tulis(response):
+    if g.get('ada_tulis'):
+        session['tulis_terakhir'] = time.time()
+    return response
+
+@app.errorhandler(PoolHabis)
+def pool_habis(e):
+    return jsonify({'error': 'Server sedang sibuk, silakan coba lagi'}), 503
+
+# Metrik Request per Endpoint
+# Dicatat di memori proses (per worker) dan dibaca Prometheus lewat /metrics.
+# Latensi diukur sampai response selesai dibuat; body yang di-stream (export,
+# SSE) tidak ikut dihitung, begitu juga byte-nya.
+_metrik = {'lock': threading.Lock(), 'endpoint': {}, 'status': {}}
+
+def _metrik_endpoint(endpoint):
+    data = _metrik['endpoint'].get(endpoint)
+    if data is None:
+        data = _metrik['endpoint'][endpoint] = {
+            'latensi': [0] * (len(app.config['METRICS_LATENCY_BUCKETS']) + 1),
+            'latensi_total': 0.0,
+            'query': [0] * (len(app.config['METRICS_QUERY_BUCKETS']) + 1),
+            'request': 0,
+            'sql_query': 0,
+            'sql_detik': 0.0,
+            'sql_baris': 0,
+            'bytes': 0,
+        }
+    return data
+
+@app.before_request
+def mulai_metrik():
+    g.metrik_mulai = time.perf_counter()
+    g.metrik_sql = [0, 0.0, 0]
+
+@app.after_request
+def catat_metrik(response):
+    mulai = g.get('metrik_mulai')
+    if mulai is None:
+        return response
+    
+    durasi = time.perf_counter() - mulai
+    query, sql_detik, baris = g.metrik_sql
+    endpoint = request.endpoint or 'tidak_ditemukan'
+    ukuran = 0 if response.is_streamed else (response.content_length or 0)
+    
+    with _metrik['lock']:
+        data = _metrik_endpoint(endpoint)
+        data['latensi'][bisect.bisect_left(app.config['METRICS_LATENCY_BUCKETS'], durasi)] += 1
+        data['latensi_total'] += durasi
+        data['query'][bisect.bisect_left(app.config['METRICS_QUERY_BUCKETS'], query)] += 1
+        data['request'] += 1
+        data['sql_query'] += query
+        data['sql_detik'] += sql_detik
+        data['sql_baris'] += baris
+        data['bytes'] += ukuran
+        kunci = (endpoint, request.method, response.status_code)
+        _metrik['status'][kunci] = _metrik['status'].get(kunci, 0) + 1
+    return response
+
+def _baris_histogram(nama, label, batas, jumlah, total):
+    baris, kumulatif = [], 0
+    for le, n in zip(batas, jumlah):
+        kumulatif += n
+        baris.append(f'{nama}_bucket{{{label},le="{le}"}} {kumulatif}')
+    kumulatif += jumlah[-1]
+    baris.append(f'{nama}_bucket{{{label},le="+Inf"}} {kumulatif}')
+    baris.append(f'{nama}_sum{{{label}}} {total}')
+    baris.append(f'{nama}_count{{{label}}} {kumulatif}')
+    return baris
+
+def format_metrik_prometheus():
+    """Semua metrik dalam format teks Prometheus (exposition format 0.0.4)"""
+    batas_latensi = app.config['METRICS_LATENCY_BUCKETS']
+    batas_query = app.config['METRICS_QUERY_BUCKETS']
+    with _metrik['lock']:
+        endpoint = {nama: dict(data, latensi=list(data['latensi']), query=list(data['query']))
+                    for nama, data in _metrik['endpoint'].items()}
+        status = dict(_metrik['status'])
+    
+    keluaran = [
+        '# HELP sppg_http_requests_total Jumlah request per endpoint, method, dan status.',
+        '# TYPE sppg_http_requests_total counter',
+    ]
+    for (nama, method, kode), n in sorted(status.items()):
+        keluaran.append(f'sppg_http_requests_total{{endpoint="{nama}",method="{method}",status="{kode}"}} {n}')
+    
+    keluaran += [
+        '# HELP sppg_http_request_duration_seconds Latensi request per endpoint.',
+        '# TYPE sppg_http_request_duration_seconds histogram',
+    ]
+    for nama, data in sorted(endpoint.items()):
+        keluaran += _baris_histogram('sppg_http_request_duration_seconds', f'endpoint="{nama}"',
+                                     batas_latensi, data['latensi'], data['latensi_total'])
+    
+    keluaran += [
+        '# HELP sppg_sql_queries_per_request Jumlah query SQL per request.',
+        '# TYPE sppg_sql_queries_per_request histogram',
+    ]
+    for nama, data in sorted(endpoint.items()):
+        keluaran += _baris_histogram('sppg_sql_queries_per_request', f'endpoint="{nama}"',
+                                     batas_query, data['query'], data['sql_query'])
+    
+    for metrik, kunci, tipe, keterangan in (
+        ('sppg_sql_queries_total', 'sql_query', 'counter', 'Jumlah query SQL per endpoint.'),
+        ('sppg_sql_duration_seconds_total', 'sql_detik', 'counter', 'Total waktu eksekusi SQL per endpoint.'),
+        ('sppg_sql_rows_fetched_total', 'sql_baris', 'counter', 'Jumlah baris yang diambil per endpoint.'),
+        ('sppg_http_response_bytes_total', 'bytes', 'counter', 'Total ukuran response (tanpa body streaming).'),
+    ):
+        keluaran += [f'# HELP {metrik} {keterangan}', f'# TYPE {metrik} {tipe}']
+        for nama, data in sorted(endpoint.items()):
+            keluaran.append(f'{metrik}{{endpoint="{nama}"}} {data[kunci]}')
+    
+    pool = mysql.statistik()
+    keluaran += [
+        '# HELP sppg_db_pool_connections Koneksi database di pool per keadaan.',
+        '# TYPE sppg_db_pool_connections gauge',
+        f'sppg_db_pool_connections{{state="dipakai"}} {pool["dipakai"]}',
+        f'sppg_db_pool_connections{{state="idle"}} {pool["idle"]}',
+        '# HELP sppg_db_pool_checkout_total Jumlah peminjaman koneksi dari pool.',
+        '# TYPE sppg_db_pool_checkout_total counter',
+        f'sppg_db_pool_checkout_total {pool["checkout"]}',
+        '# HELP sppg_db_pool_wait_seconds_total Total waktu menunggu koneksi pool.',
+        '# TYPE sppg_db_pool_wait_seconds_total counter',
+        f'sppg_db_pool_wait_seconds_total {pool["tunggu_total"]}',
+        '# HELP sppg_db_pool_timeout_total Jumlah checkout yang gagal karena pool habis.',
+        '# TYPE sppg_db_pool_timeout_total counter',
+        f'sppg_db_pool_timeout_total {pool["timeout"]}',
+        '# HELP sppg_sse_subscribers Pelanggan /api/stream yang sedang tersambung.',
+        '# TYPE sppg_sse_subscribers gauge',
+        f'sppg_sse_subscribers {_siaran["pelanggan"]}',
+    ]
+    if mysql_replika.aktif:
+        replika = mysql_replika.statistik()
+        keluaran += [
+            '# HELP sppg_db_replica_up Replika baca sedang dipakai (1) atau dialihkan ke primary (0).',
+            '# TYPE sppg_db_replica_up gauge',
+            f'sppg_db_replica_up {int(replika["sehat"])}',
+            '# HELP sppg_db_replica_lag_seconds Lag replikasi pada pengecekan terakhir.',
+            '# TYPE sppg_db_replica_lag_seconds gauge',
+            f'sppg_db_replica_lag_seconds {replika["lag"] if replika["lag"] is not None else "NaN"}',
+        ]
+    return '\n'.join(keluaran) + '\n'
+
+# Profiler SQL (N+1 dan Query Lambat)
+# Query dicatat dalam bentuk template (%s belum diisi), lalu dinormalisasi menjadi
+# sidik: literal dan placeholder jadi ?, daftar IN/VALUES/UNION ALL yang panjangnya
+# tergantung data diringkas, sehingga query yang sama dengan parameter berbeda
+# mendapat sidik yang sama. EXPLAIN dijalankan di teardown, setelah metrik dicatat.
+_profil_sql = deque()
+_profil_sql_lock = threading.Lock()
+
+_POLA_SIDIK = [
+    (re.compile(r'/\*.*?\*/', re.S), ' '),
+    (re.compile(r'--[^\n]*'), ' '),
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|%s'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),
+    (re.compile(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+'), '(?+)'),
+    (re.compile(r'(select \?(?: as \w+)?(?:\s*,\s*\?(?: as \w+)?)*)(?: union all select \?(?:\s*,\s*\?)*)+'),
+     r'\1 union all ...'),
+]
+
+def sidik_query(query):
+    """Normalisasi query menjadi sidik (fingerprint) untuk mengelompokkan query sejenis"""
+    sidik = query.lower()
+    for pola, ganti in _POLA_SIDIK:
+        sidik = pola.sub(ganti, sidik)
+    return sidik.strip()
+
+def _jalankan_explain(query, args):
+    cur = mysql.connection.cursor()
+    try:
+        cur.execute("EXPLAIN " + query, args)
+        return cur.fetchall()
+    except MySQLdb.Error as e:
+        return [{'error': str(e)}]
+    finally:
+        cur.close()
+
+def analisis_profil_sql(statement):
+    """Kelompokkan statement (query, args, detik, bisa_explain) per sidik, cari N+1 dan query lambat"""
+    batas_ulang = app.config['SQL_PROFILER_N_PLUS_1']
+    batas_lambat = app.config['SQL_PROFILER_SLOW_MS'] / 1000
+    
+    per_sidik = {}
+    lambat = {}
+    for query, args, detik, bisa_explain in statement:
+        sidik = sidik_query(query)
+        kelompok = per_sidik.setdefault(sidik, {'sidik': sidik, 'jumlah': 0, 'total_ms': 0.0})
+        kelompok['jumlah'] += 1
+        kelompok['total_ms'] += detik * 1000
+        
+        # Query lambat dengan sidik sama cukup diwakili yang paling lambat
+        if detik >= batas_lambat:
+            item = lambat.get(sidik)
+            if item is None or detik * 1000 > item['ms']:
+                lambat[sidik] = {'sidik': sidik, 'ms': round(detik * 1000, 2), 'jumlah': 0,
+                                 'query': ' '.join(query.split()), 'args': args,
+                                 'bisa_explain': bisa_explain, 'explain': None}
+            lambat[sidik]['jumlah'] += 1
+    
+    n_plus_1 = sorted((k for k in per_sidik.values() if k['jumlah'] >= batas_ulang),
+                      key=lambda k: k['jumlah'], reverse=True)
+    for kelompok in n_plus_1:
+        kelompok['total_ms'] = round(kelompok['total_ms'], 2)
+    return n_plus_1, sorted(lambat.values(), key=lambda k: k['ms'], reverse=True)
+
+@app.before_request
+def mulai_profil_sql():
+    if app.config['SQL_PROFILER']:
+        g.profil_sql = []
+
+@app.teardown_request
+def simpan_profil_sql(error=None):
+    statement = g.pop('profil_sql', None)
+    if not statement:
+        return
+    
+    n_plus_1, lambat = analisis_profil_sql(statement)
+    if not n_plus_1 and not lambat:
+        return
+    
+    for item in lambat:
+        if item['bisa_explain']:
+            # Teardown tidak boleh gagal karena profiler (mis. koneksi sudah putus)
+            try:
+                item['explain'] = _jalankan_explain(item['query'], item['args'])
+            except Exception as e:
+                app.logger.warning("Profiler SQL gagal menjalankan EXPLAIN: %s", e)
+                item['explain'] = [{'error': str(e)}]
+    
+    laporan = {
+        'waktu': datetime.now().isoformat(timespec='seconds'),
+        'endpoint': request.endpoint or 'tidak_ditemukan',
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'jumlah_query': len(statement),
+        'total_ms': round(sum(item[2] for item in statement) * 1000, 2),
+        'n_plus_1': n_plus_1,
+        'lambat': lambat,
+    }
+    with _profil_sql_lock:
+        _profil_sql.appendleft(laporan)
+        while len(_profil_sql) > app.config['SQL_PROFILER_MAX_LAPORAN']:
+            _profil_sql.pop()
 
 # Custom Filter untuk format angka (ribuan)
 @app.template_filter('format_number')
@@ -87,7 +800,7 @@ def is_logged_in():
 # Middleware untuk memeriksa autentikasi
 @app.before_request
 def require_login():
-    allowed_routes = ['login', 'static']
+    allowed_routes = ['login', 'static', 'metrics']
     if request.endpoint not in allowed_routes and not is_logged_in():
         return redirect(url_for('login'))
 
@@ -108,6 +821,760 @@ def calculate_total(jumlah, harga_satuan):
     # Sekarang bisa dikalikan
     return jumlah * harga_satuan
 
+# Fungsi helper untuk memperbarui harga rata-rata tertimbang bahan
+def catat_harga_penerimaan(cur, bahan_id, jumlah, harga_satuan):
+    # Dipanggil di dalam transaksi penerimaan, sebelum commit
+    if not jumlah or not harga_satuan or jumlah <= 0 or harga_satuan <= 0:
+        return
+    
+    # MySQL mengevaluasi assignment dari kiri ke kanan, jadi harga_rata
+    # dihitung dari total_jumlah dan total_nilai yang sudah diperbarui
+    cur.execute("""
+        INSERT INTO harga_rata_bahan (bahan_id, total_jumlah, total_nilai, harga_rata)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            total_jumlah = total_jumlah + VALUES(total_jumlah),
+            total_nilai = total_nilai + VALUES(total_nilai),
+            harga_rata = total_nilai / total_jumlah
+    """, (bahan_id, jumlah, jumlah * harga_satuan, harga_satuan))
+
+# Fungsi helper untuk rentang tanggal
+# Semua filter tanggal memakai rentang setengah terbuka [awal, akhir) dan
+# membandingkan kolom secara langsung (tanpa DATE()/YEAR()/DATE_FORMAT()),
+# supaya index pada kolom tanggal tetap bisa dipakai MySQL
+def parse_tanggal(value):
+    """Ubah string YYYY-MM-DD menjadi date, None jika kosong/tidak valid"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+def rentang_bulan(tanggal=None):
+    """Rentang [tanggal 1 bulan ini, tanggal 1 bulan berikutnya)"""
+    tanggal = tanggal or datetime.now().date()
+    awal = tanggal.replace(day=1)
+    akhir = (awal + timedelta(days=32)).replace(day=1)
+    return awal, akhir
+
+def rentang_tahun(tanggal=None):
+    """Rentang [1 Januari tahun ini, 1 Januari tahun berikutnya)"""
+    tanggal = tanggal or datetime.now().date()
+    return tanggal.replace(month=1, day=1), tanggal.replace(year=tanggal.year + 1, month=1, day=1)
+
+def filter_tanggal(query, params, kolom, start_date, end_date):
+    """Tambahkan filter kolom >= start_date AND kolom < end_date + 1 hari"""
+    awal = parse_tanggal(start_date)
+    akhir = parse_tanggal(end_date)
+    
+    if awal:
+        query += f" AND {kolom} >= %s"
+        params.append(awal)
+    
+    if akhir:
+        query += f" AND {kolom} < %s"
+        params.append(akhir + timedelta(days=1))
+    
+    return query
+
+# Fungsi helper untuk pagination keyset (cursor = "tanggal_id" baris terakhir)
+# Halaman berikutnya diambil dengan WHERE (tanggal, id) < cursor, bukan OFFSET,
+# sehingga biaya setiap halaman tetap kecil berapa pun panjang riwayatnya
+def encode_cursor(tanggal, id):
+    return f"{tanggal}_{id}"
+
+def decode_cursor(cursor):
+    """Ubah cursor menjadi (tanggal, id), None jika kosong/tidak valid"""
+    if not cursor or '_' not in cursor:
+        return None
+    tanggal, id = cursor.split('_', 1)
+    tanggal = parse_tanggal(tanggal)
+    # isdecimal, bukan isdigit: '²' lolos isdigit tetapi gagal di int()
+    if not tanggal or not id.isdecimal():
+        return None
+    return tanggal, int(id)
+
+def get_page_size():
+    """Jumlah baris per halaman dari parameter ?per_page, dibatasi MAX_PAGE_SIZE"""
+    try:
+        per_page = int(request.args.get('per_page', app.config['PAGE_SIZE']))
+    except ValueError:
+        per_page = app.config['PAGE_SIZE']
+    return max(1, min(per_page, app.config['MAX_PAGE_SIZE']))
+
+def filter_halaman(query, params, kolom_tanggal, kolom_id, cursor=None, limit=None):
+    """Tambahkan kondisi cursor, ORDER BY tanggal DESC, id DESC, dan LIMIT (limit + 1)"""
+    posisi = decode_cursor(cursor)
+    if posisi:
+        query += f" AND ({kolom_tanggal} < %s OR ({kolom_tanggal} = %s AND {kolom_id} < %s))"
+        params.extend([posisi[0], posisi[0], posisi[1]])
+    
+    query += f" ORDER BY {kolom_tanggal} DESC, {kolom_id} DESC"
+    
+    # Ambil satu baris lebih untuk mengetahui apakah masih ada halaman berikutnya
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    
+    return query
+
+def potong_halaman(data, limit, kolom_tanggal):
+    """Potong hasil query menjadi satu halaman dan cursor halaman berikutnya"""
+    data = list(data)
+    if len(data) <= limit:
+        return data, None
+    data = data[:limit]
+    return data, encode_cursor(data[-1][kolom_tanggal], data[-1]['id'])
+
+@app.template_global()
+def url_halaman(cursor=None):
+    """URL halaman yang sama dengan filter yang sama, untuk cursor tertentu"""
+    args = request.args.to_dict()
+    args.pop('cursor', None)
+    if cursor:
+        args['cursor'] = cursor
+    return url_for(request.endpoint, **args)
+
+# Fungsi helper untuk serialisasi baris database ke JSON
+def serialisasi_baris(row):
+    hasil = {}
+    for key, value in row.items():
+        if isinstance(value, Decimal):
+            value = float(value)
+        elif isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        hasil[key] = value
+    return hasil
+
+# Baris ringkas untuk export dan API
+# Cursor tuple (Cursor/SSCursor) tidak membuat dict untuk setiap baris; jika perlu
+# akses per nama kolom, baris dibungkus namedtuple (tanpa __dict__ per baris)
+def kolom_cursor(cur):
+    return [d[0] for d in cur.description]
+
+def iter_baris_tuple(cur, nama='Baris'):
+    """Iterasi hasil cursor tuple sebagai namedtuple dengan nama kolom sebagai atribut"""
+    Baris = namedtuple(nama, kolom_cursor(cur), rename=True)
+    return map(Baris._make, cur)
+
+def json_default(value):
+    """Konversi nilai yang tidak didukung json.dumps (tanggal, Decimal)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'{type(value).__name__} tidak bisa dijadikan JSON')
+
+# Query daftar transaksi dan laporan
+# Dipakai oleh route HTML, API, export, dan pengecekan EXPLAIN (`python migrate.py explain`)
+def _filter_penerimaan(start_date, end_date, status):
+    query = " WHERE 1=1"
+    params = []
+    
+    query = filter_tanggal(query, params, 'p.tanggal', start_date, end_date)
+    
+    if status:
+        query += " AND p.status = %s"
+        params.append(status)
+    
+    return query, params
+
+def query_penerimaan(start_date='', end_date='', status='', cursor=None, limit=None):
+    where, params = _filter_penerimaan(start_date, end_date, status)
+    query = """
+        SELECT p.*, b.nama_bahan, b.kode_bahan, s.nama_satuan
+        FROM penerimaan p
+        JOIN bahan b ON p.bahan_id = b.id
+        JOIN satuan s ON p.satuan_id = s.id
+    """ + where
+    query = filter_halaman(query, params, 'p.tanggal', 'p.id', cursor, limit)
+    return query, params
+
+def query_ringkasan_penerimaan(start_date='', end_date='', status=''):
+    where, params = _filter_penerimaan(start_date, end_date, status)
+    query = """
+        SELECT COUNT(*) as total_transaksi,
+               COALESCE(SUM(p.status = 'disetujui'), 0) as disetujui,
+               COALESCE(SUM(p.status = 'draft'), 0) as draft
+        FROM penerimaan p
+    """ + where
+    return query, params
+
+def _filter_pengeluaran(start_date, end_date, status, jenis_tujuan):
+    query = " WHERE 1=1"
+    params = []
+    
+    query = filter_tanggal(query, params, 'p.tanggal', start_date, end_date)
+    
+    if status:
+        query += " AND p.status = %s"
+        params.append(status)
+    
+    if jenis_tujuan:
+        query += " AND p.jenis_tujuan = %s"
+        params.append(jenis_tujuan)
+    
+    return query, params
+
+def query_pengeluaran(start_date='', end_date='', status='', jenis_tujuan='', cursor=None, limit=None):
+    where, params = _filter_pengeluaran(start_date, end_date, status, jenis_tujuan)
+    query = """
+        SELECT p.*, b.nama_bahan, b.kode_bahan, s.nama_satuan
+        FROM pengeluaran p
+        JOIN bahan b ON p.bahan_id = b.id
+        JOIN satuan s ON p.satuan_id = s.id
+    """ + where
+    query = filter_halaman(query, params, 'p.tanggal', 'p.id', cursor, limit)
+    return query, params
+
+def query_ringkasan_pengeluaran(start_date='', end_date='', status='', jenis_tujuan=''):
+    where, params = _filter_pengeluaran(start_date, end_date, status, jenis_tujuan)
+    query = """
+        SELECT COUNT(*) as total_transaksi,
+               COALESCE(SUM(p.status = 'dikirim'), 0) as dikirim,
+               COALESCE(SUM(p.jenis_tujuan = 'sekolah'), 0) as sekolah
+        FROM pengeluaran p
+    """ + where
+    return query, params
+
+def _filter_monitoring(start_date, end_date, bahan_id):
+    query = " WHERE 1=1"
+    params = []
+    
+    query = filter_tanggal(query, params, 'mk.tanggal_check', start_date, end_date)
+    
+    if bahan_id:
+        query += " AND mk.bahan_id = %s"
+        params.append(bahan_id)
+    
+    return query, params
+
+def query_monitoring(start_date='', end_date='', bahan_id='', cursor=None, limit=None):
+    where, params = _filter_monitoring(start_date, end_date, bahan_id)
+    query = """
+        SELECT mk.*, b.nama_bahan, b.kode_bahan
+        FROM monitoring_kualitas mk
+        JOIN bahan b ON mk.bahan_id = b.id
+    """ + where
+    query = filter_halaman(query, params, 'mk.tanggal_check', 'mk.id', cursor, limit)
+    return query, params
+
+def query_ringkasan_monitoring(start_date='', end_date='', bahan_id=''):
+    where, params = _filter_monitoring(start_date, end_date, bahan_id)
+    query = """
+        SELECT COUNT(*) as total_transaksi,
+               COALESCE(SUM(mk.status_kadaluarsa = 'aman'), 0) as aman,
+               COALESCE(SUM(mk.status_kadaluarsa = 'mendekati'), 0) as mendekati,
+               COALESCE(SUM(mk.status_kadaluarsa = 'kadaluarsa'), 0) as kadaluarsa
+        FROM monitoring_kualitas mk
+    """ + where
+    return query, params
+
+def query_laporan_stok(kategori_id='', stok_minimum=''):
+    query = """
+        SELECT b.*, kb.nama_kategori, s.nama_satuan, COALESCE(st.jumlah, 0) as stok_sekarang,
+               COALESCE(hr.harga_rata, 0) as harga_rata,
+               COALESCE(st.jumlah, 0) * COALESCE(hr.harga_rata, 0) as nilai_stok,
+               CASE 
+                   WHEN COALESCE(st.jumlah, 0) <= b.stok_minimum THEN 'kritis'
+                   WHEN COALESCE(st.jumlah, 0) <= b.stok_minimum * 1.5 THEN 'rendah'
+                   ELSE 'aman'
+               END as status_stok
+        FROM bahan b
+        LEFT JOIN kategori_bahan kb ON b.kategori_id = kb.id
+        LEFT JOIN satuan s ON b.satuan_id = s.id
+        LEFT JOIN stok st ON b.id = st.bahan_id
+        LEFT JOIN harga_rata_bahan hr ON b.id = hr.bahan_id
+        WHERE b.status = 'aktif'
+    """
+    params = []
+    
+    if kategori_id:
+        query += " AND b.kategori_id = %s"
+        params.append(kategori_id)
+    
+    if stok_minimum == 'ya':
+        query += " AND COALESCE(st.jumlah, 0) <= b.stok_minimum"
+    
+    query += " ORDER BY status_stok, b.nama_bahan"
+    
+    return query, params
+
+# Kolom untuk laporan distribusi (HTML) dan export Excel
+KOLOM_DISTRIBUSI_LAPORAN = """
+        p.*, b.nama_bahan, b.kode_bahan, s.nama_satuan,
+        CASE p.jenis_tujuan
+            WHEN 'sekolah' THEN 'Sekolah'
+            WHEN 'posyandu' THEN 'Posyandu'
+            WHEN 'puskesmas' THEN 'Puskesmas'
+            WHEN 'rumah_sakit' THEN 'Rumah Sakit'
+            ELSE 'Lainnya'
+        END as nama_jenis_tujuan
+"""
+
+KOLOM_DISTRIBUSI_EXPORT = """
+        p.tanggal, p.no_pengeluaran, b.kode_bahan, b.nama_bahan,
+        p.jumlah, s.nama_satuan, p.jenis_tujuan, p.nama_tujuan,
+        p.alamat_tujuan, p.penerima, p.catatan, p.status
+"""
+
+def _filter_distribusi(start_date, end_date, jenis_tujuan):
+    query = " WHERE p.status != 'draft'"
+    params = []
+    
+    query = filter_tanggal(query, params, 'p.tanggal', start_date, end_date)
+    
+    if jenis_tujuan:
+        query += " AND p.jenis_tujuan = %s"
+        params.append(jenis_tujuan)
+    
+    return query, params
+
+def query_distribusi(kolom, start_date='', end_date='', jenis_tujuan='', cursor=None, limit=None):
+    where, params = _filter_distribusi(start_date, end_date, jenis_tujuan)
+    query = f"""
+        SELECT {kolom}
+        FROM pengeluaran p
+        JOIN bahan b ON p.bahan_id = b.id
+        JOIN satuan s ON p.satuan_id = s.id
+    """ + where
+    query = filter_halaman(query, params, 'p.tanggal', 'p.id', cursor, limit)
+    return query, params
+
+# Ringkasan distribusi dibaca dari rekap harian, bukan dari tabel pengeluaran
+def _filter_rekap_distribusi(start_date, end_date, jenis_tujuan=''):
+    query = " WHERE r.jenis = 'pengeluaran'"
+    params = []
+    
+    query = filter_tanggal(query, params, 'r.tanggal', start_date, end_date)
+    
+    if jenis_tujuan:
+        query += " AND r.jenis_tujuan = %s"
+        params.append(jenis_tujuan)
+    
+    return query, params
+
+def query_ringkasan_distribusi(start_date='', end_date='', jenis_tujuan=''):
+    where, params = _filter_rekap_distribusi(start_date, end_date, jenis_tujuan)
+    query = """
+        SELECT CAST(COALESCE(SUM(r.jumlah_transaksi), 0) AS UNSIGNED) as total_transaksi,
+               COALESCE(SUM(r.jumlah), 0) as total_jumlah,
+               CAST(COALESCE(SUM(IF(r.jenis_tujuan = 'sekolah', r.jumlah_transaksi, 0)), 0) AS UNSIGNED) as sekolah
+        FROM rekap_harian r
+    """ + where
+    return query, params
+
+def query_distribusi_per_tujuan(start_date='', end_date=''):
+    where, params = _filter_rekap_distribusi(start_date, end_date)
+    query = """
+        SELECT r.jenis_tujuan, CAST(SUM(r.jumlah_transaksi) AS UNSIGNED) as jumlah_transaksi,
+               SUM(r.jumlah) as total_jumlah
+        FROM rekap_harian r
+    """ + where + " GROUP BY r.jenis_tujuan"
+    return query, params
+
+# Layanan pergerakan stok
+# Semua perubahan stok lewat fungsi ini, dipanggil di dalam transaksi pemanggil.
+# Setiap perubahan juga dicatat di kartu stok (mutasi_stok). Baris mutasi berupa
+# tuple (bahan_id, jumlah, tanggal, referensi) dengan jumlah positif.
+def catat_mutasi_stok(cur, jenis, mutasi):
+    """Catat mutasi ke kartu stok; jumlah disimpan negatif untuk barang keluar"""
+    tanda = -1 if jenis == 'keluar' else 1
+    cur.executemany("""
+        INSERT INTO mutasi_stok (bahan_id, tanggal, jenis, jumlah, referensi)
+        VALUES (%s, %s, %s, %s, %s)
+    """, [(bahan_id, tanggal, jenis, tanda * jumlah, referensi)
+          for bahan_id, jumlah, tanggal, referensi in mutasi])
+    
+    # Mutasi bertanggal mundur ikut memperbarui snapshot yang sudah dibuat setelahnya
+    cur.executemany("""
+        UPDATE snapshot_stok SET saldo = saldo + %s
+        WHERE bahan_id = %s AND tanggal >= %s
+    """, [(tanda * jumlah, bahan_id, tanggal) for bahan_id, jumlah, tanggal, _ in mutasi])
+
+def total_per_bahan(mutasi):
+    """Total jumlah mutasi per bahan ({bahan_id: jumlah})"""
+    total = {}
+    for bahan_id, jumlah, _, _ in mutasi:
+        total[bahan_id] = total.get(bahan_id, 0) + jumlah
+    return total
+
+def tambah_stok(cur, bahan_id, jumlah, tanggal, referensi=None):
+    cur.execute("""
+        UPDATE stok 
+        SET jumlah = jumlah + %s,
+            last_update = CURRENT_TIMESTAMP
+        WHERE bahan_id = %s
+    """, (jumlah, bahan_id))
+    catat_mutasi_stok(cur, 'masuk', [(bahan_id, jumlah, tanggal, referensi)])
+
+def tambah_stok_banyak(cur, mutasi):
+    """Tambah stok beberapa bahan, satu UPDATE per bahan"""
+    cur.executemany("""
+        UPDATE stok 
+        SET jumlah = jumlah + %s,
+            last_update = CURRENT_TIMESTAMP
+        WHERE bahan_id = %s
+    """, [(jumlah, bahan_id) for bahan_id, jumlah in total_per_bahan(mutasi).items()])
+    catat_mutasi_stok(cur, 'masuk', mutasi)
+
+def kurangi_stok(cur, bahan_id, jumlah, tanggal, referensi=None):
+    """Kurangi stok hanya jika mencukupi, dengan satu UPDATE bersyarat.
+    
+    Kondisi `jumlah >= %s` dicek oleh MySQL sambil mengunci baris stok, jadi dua
+    pengeluaran bersamaan tidak bisa membuat stok negatif. Mengembalikan True jika
+    stok berhasil dikurangi (satu baris terpengaruh), False jika stok tidak cukup.
+    """
+    if jumlah <= 0:
+        return False
+    
+    cur.execute("""
+        UPDATE stok 
+        SET jumlah = jumlah - %s,
+            last_update = CURRENT_TIMESTAMP
+        WHERE bahan_id = %s AND jumlah >= %s
+    """, (jumlah, bahan_id, jumlah))
+    if cur.rowcount != 1:
+        return False
+    
+    catat_mutasi_stok(cur, 'keluar', [(bahan_id, jumlah, tanggal, referensi)])
+    kurangi_lot_fefo(cur, {bahan_id: jumlah})
+    return True
+
+def kurangi_stok_banyak(cur, mutasi):
+    """Kurangi stok beberapa bahan sekaligus dengan satu UPDATE bersyarat.
+    
+    Mengembalikan True hanya jika stok semua bahan cukup. Jika False, sebagian
+    bahan mungkin sudah dikurangi, jadi pemanggil wajib melakukan rollback.
+    """
+    total = total_per_bahan(mutasi)
+    if not total or min(total.values()) <= 0:
+        return False
+    
+    permintaan = ' UNION ALL '.join(['SELECT %s AS bahan_id, %s AS jumlah'] * len(total))
+    params = [nilai for item in total.items() for nilai in item]
+    cur.execute("""
+        UPDATE stok s
+        JOIN ({}) k ON s.bahan_id = k.bahan_id
+        SET s.jumlah = s.jumlah - k.jumlah,
+            s.last_update = CURRENT_TIMESTAMP
+        WHERE s.jumlah >= k.jumlah
+    """.format(permintaan), params)
+    if cur.rowcount != len(total):
+        return False
+    
+    catat_mutasi_stok(cur, 'keluar', mutasi)
+    kurangi_lot_fefo(cur, total)
+    return True
+
+def cari_stok_kurang(cur, total):
+    """Bahan di {bahan_id: jumlah diminta} yang stoknya kurang, sebagai {bahan_id: stok tersedia}.
+    
+    Panggil setelah rollback kurangi_stok_banyak yang gagal: sebelum rollback sebagian
+    bahan sudah dikurangi, jadi stoknya tidak bisa dibandingkan dengan permintaan.
+    """
+    cur.execute("SELECT bahan_id, jumlah FROM stok WHERE bahan_id IN ({})".format(
+        ', '.join(['%s'] * len(total))), list(total))
+    stok = {row['bahan_id']: float(row['jumlah']) for row in cur.fetchall()}
+    return {bahan_id: stok.get(bahan_id, 0.0) for bahan_id, jumlah in total.items()
+            if stok.get(bahan_id, 0.0) < jumlah}
+
+# Stok per lot (no_batch + kadaluarsa), dikeluarkan FEFO (first expired, first out)
+# lot_stok hanya berisi lot yang masih bersisa; lot yang habis langsung dihapus.
+# Baris lot berupa tuple (bahan_id, jumlah, no_penerimaan, no_batch, tanggal_kadaluarsa).
+QUERY_LOT_FEFO = """
+    SELECT id, bahan_id, no_penerimaan, no_batch, tanggal_kadaluarsa, sisa
+    FROM lot_stok
+    WHERE bahan_id IN ({})
+    ORDER BY bahan_id, tanggal_kadaluarsa IS NULL, tanggal_kadaluarsa, id
+"""
+
+def tambah_lot_stok(cur, lot):
+    cur.executemany("""
+        INSERT INTO lot_stok (bahan_id, no_penerimaan, no_batch, tanggal_kadaluarsa, jumlah_awal, sisa)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, [(bahan_id, no_penerimaan, no_batch or None, tanggal_kadaluarsa or None, jumlah, jumlah)
+          for bahan_id, jumlah, no_penerimaan, no_batch, tanggal_kadaluarsa in lot])
+
+def pilih_lot_fefo(lot_list, jumlah):
+    """Daftar (lot, jumlah diambil) dari lot urut FEFO sampai jumlah terpenuhi"""
+    pilihan = []
+    for lot in lot_list:
+        if jumlah <= 0:
+            break
+        ambil = min(lot['sisa'], jumlah)
+        pilihan.append((lot, ambil))
+        jumlah -= ambil
+    return pilihan
+
+def saran_lot_fefo(cur, bahan_id, jumlah):
+    """Saran lot yang diambil untuk pengeluaran (tanpa mengubah data)"""
+    cur.execute(QUERY_LOT_FEFO.format('%s'), (bahan_id,))
+    return pilih_lot_fefo(cur.fetchall(), jumlah)
+
+def kurangi_lot_fefo(cur, jumlah_per_bahan):
+    """Kurangi sisa lot FEFO untuk setiap bahan ({bahan_id: jumlah}).
+    
+    Dipanggil setelah baris stok bahan terkunci oleh UPDATE bersyarat, jadi dua
+    pengeluaran bahan yang sama tidak memilih lot yang sama secara bersamaan.
+    """
+    jumlah_per_bahan = {int(bahan_id): jumlah for bahan_id, jumlah in jumlah_per_bahan.items()}
+    cur.execute(QUERY_LOT_FEFO.format(', '.join(['%s'] * len(jumlah_per_bahan))) + " FOR UPDATE",
+                list(jumlah_per_bahan))
+    
+    lot_per_bahan = {}
+    for lot in cur.fetchall():
+        lot_per_bahan.setdefault(lot['bahan_id'], []).append(lot)
+    
+    habis, dikurangi = [], []
+    for bahan_id, jumlah in jumlah_per_bahan.items():
+        for lot, ambil in pilih_lot_fefo(lot_per_bahan.get(bahan_id, []), jumlah):
+            if ambil >= lot['sisa']:
+                habis.append((lot['id'],))
+            else:
+                dikurangi.append((ambil, lot['id']))
+    
+    if dikurangi:
+        cur.executemany("UPDATE lot_stok SET sisa = sisa - %s WHERE id = %s", dikurangi)
+    if habis:
+        cur.executemany("DELETE FROM lot_stok WHERE id = %s", habis)
+
+# Kartu stok: stok pada tanggal tertentu
+# Satu lookup snapshot terakhir (PRIMARY KEY bahan_id, tanggal) ditambah jumlah
+# mutasi sesudahnya s/d tanggal tersebut (index bahan_id, tanggal). Karena snapshot
+# dibuat berkala (`flask --app app snapshot-stok`), rentang mutasi yang dijumlahkan
+# tetap pendek berapa pun panjang riwayatnya.
+def stok_pada_tanggal(cur, bahan_id, tanggal):
+    """Saldo stok bahan pada akhir tanggal (date)"""
+    cur.execute("""
+        SELECT tanggal, saldo FROM snapshot_stok
+        WHERE bahan_id = %s AND tanggal <= %s
+        ORDER BY tanggal DESC
+        LIMIT 1
+    """, (bahan_id, tanggal))
+    snapshot = cur.fetchone()
+    
+    query = "SELECT COALESCE(SUM(jumlah), 0) as total FROM mutasi_stok WHERE bahan_id = %s AND tanggal <= %s"
+    params = [bahan_id, tanggal]
+    if snapshot:
+        query += " AND tanggal > %s"
+        params.append(snapshot['tanggal'])
+    cur.execute(query, params)
+    
+    return (snapshot['saldo'] if snapshot else 0) + cur.fetchone()['total']
+
+def buat_snapshot_stok(cur, tanggal):
+    """Simpan saldo semua bahan pada akhir tanggal ke snapshot_stok (tanpa commit)"""
+    cur.execute("""
+        INSERT INTO snapshot_stok (bahan_id, tanggal, saldo)
+        SELECT b.id, %s,
+               COALESCE(sn.saldo, 0) + COALESCE((
+                   SELECT SUM(m.jumlah) FROM mutasi_stok m
+                   WHERE m.bahan_id = b.id AND m.tanggal <= %s
+                     AND m.tanggal > COALESCE(sn.tanggal, '1000-01-01')
+               ), 0)
+        FROM bahan b
+        LEFT JOIN (
+            SELECT s.bahan_id, s.tanggal, s.saldo
+            FROM snapshot_stok s
+            JOIN (
+                SELECT bahan_id, MAX(tanggal) as tanggal
+                FROM snapshot_stok
+                WHERE tanggal < %s
+                GROUP BY bahan_id
+            ) t ON s.bahan_id = t.bahan_id AND s.tanggal = t.tanggal
+        ) sn ON b.id = sn.bahan_id
+        ON DUPLICATE KEY UPDATE saldo = VALUES(saldo)
+    """, (tanggal, tanggal, tanggal))
+    return cur.rowcount
+
+# Rekap harian/bulanan penerimaan dan pengeluaran (tabel rekap_harian, rekap_bulanan)
+# Diperbarui di dalam transaksi yang sama dengan transaksinya. Baris rekap berupa
+# tuple (tanggal, bahan_id, jenis_tujuan, jumlah); jenis_tujuan '' untuk penerimaan.
+def catat_rekap(cur, jenis, baris):
+    """Tambahkan transaksi ke rekap harian dan bulanan (satu upsert per kunci rekap)"""
+    harian, bulanan = {}, {}
+    for tanggal, bahan_id, jenis_tujuan, jumlah in baris:
+        tanggal = tanggal if isinstance(tanggal, date) else parse_tanggal(tanggal)
+        for rekap, kunci in ((harian, tanggal), (bulanan, tanggal.replace(day=1))):
+            total = rekap.setdefault((kunci, int(bahan_id), jenis_tujuan or ''), [0, 0])
+            total[0] += jumlah
+            total[1] += 1
+    
+    # Urutan kunci tetap supaya transaksi bersamaan mengunci baris rekap dengan urutan sama
+    for tabel, kolom, rekap in (('rekap_harian', 'tanggal', harian), ('rekap_bulanan', 'bulan', bulanan)):
+        cur.executemany(f"""
+            INSERT INTO {tabel} (jenis, {kolom}, bahan_id, jenis_tujuan, jumlah, jumlah_transaksi)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE jumlah = jumlah + VALUES(jumlah),
+                                    jumlah_transaksi = jumlah_transaksi + VALUES(jumlah_transaksi)
+        """, [(jenis, *kunci, *total) for kunci, total in sorted(rekap.items())])
+
+def bangun_ulang_rekap(cur, dari=None):
+    """Hitung ulang rekap dari tabel transaksi mulai awal bulan `dari` (tanpa commit)"""
+    dari = (dari or date(1000, 1, 1)).replace(day=1)
+    cur.execute("DELETE FROM rekap_harian WHERE tanggal >= %s", (dari,))
+    cur.execute("DELETE FROM rekap_bulanan WHERE bulan >= %s", (dari,))
+    cur.execute("""
+        INSERT INTO rekap_harian (jenis, tanggal, bahan_id, jenis_tujuan, jumlah, jumlah_transaksi)
+        SELECT 'penerimaan', tanggal, bahan_id, '', SUM(jumlah), COUNT(*)
+        FROM penerimaan
+        WHERE status = 'disetujui' AND tanggal >= %s
+        GROUP BY tanggal, bahan_id
+    """, (dari,))
+    cur.execute("""
+        INSERT INTO rekap_harian (jenis, tanggal, bahan_id, jenis_tujuan, jumlah, jumlah_transaksi)
+        SELECT 'pengeluaran', tanggal, bahan_id, COALESCE(jenis_tujuan, ''), SUM(jumlah), COUNT(*)
+        FROM pengeluaran
+        WHERE status != 'draft' AND tanggal >= %s
+        GROUP BY tanggal, bahan_id, COALESCE(jenis_tujuan, '')
+    """, (dari,))
+    cur.execute("""
+        INSERT INTO rekap_bulanan (jenis, bulan, bahan_id, jenis_tujuan, jumlah, jumlah_transaksi)
+        SELECT jenis, tanggal - INTERVAL (DAY(tanggal) - 1) DAY, bahan_id, jenis_tujuan,
+               SUM(jumlah), SUM(jumlah_transaksi)
+        FROM rekap_harian
+        WHERE tanggal >= %s
+        GROUP BY jenis, tanggal - INTERVAL (DAY(tanggal) - 1) DAY, bahan_id, jenis_tujuan
+    """, (dari,))
+
+# Fungsi helper untuk versi data (tabel versi_data)
+# Dinaikkan di dalam transaksi penulisan, sebelum commit
+def naikkan_versi_data(cur, *nama):
+    cur.execute("UPDATE versi_data SET versi = versi + 1 WHERE nama IN ({})".format(
+        ', '.join(['%s'] * len(nama))), nama)
+
+def ambil_versi_data(cur, nama):
+    """Ambil versi data sebagai dict {nama: versi}"""
+    cur.execute("SELECT nama, versi FROM versi_data WHERE nama IN ({})".format(
+        ', '.join(['%s'] * len(nama))), list(nama))
+    return {row['nama']: row['versi'] for row in cur.fetchall()}
+
+# Alokasi nomor dokumen (TRM-YYYYMMDD-NNN / KLR-YYYYMMDD-NNN) dari tabel nomor_urut
+def format_nomor(prefix, tanggal, nomor):
+    return f"{prefix}-{tanggal.strftime('%Y%m%d')}-{nomor:03d}"
+
+def alokasi_nomor(cur, prefix, jumlah=1, tanggal=None):
+    """Alokasikan `jumlah` nomor berurutan untuk prefix dan tanggal.
+    
+    Satu INSERT ... ON DUPLICATE KEY UPDATE menaikkan penghitung secara atomik dan
+    LAST_INSERT_ID(expr) mengembalikan nilai barunya, jadi tidak ada dua transaksi
+    yang mendapat nomor sama. Panggil di dalam transaksi penyimpanan: jika transaksi
+    di-rollback, nomornya ikut dikembalikan.
+    """
+    tanggal = tanggal or datetime.now().date()
+    cur.execute("""
+        INSERT INTO nomor_urut (prefix, tanggal, nomor_terakhir)
+        VALUES (%s, %s, LAST_INSERT_ID(%s))
+        ON DUPLICATE KEY UPDATE nomor_terakhir = LAST_INSERT_ID(nomor_terakhir + %s)
+    """, (prefix, tanggal, jumlah, jumlah))
+    
+    terakhir = cur.lastrowid
+    return [format_nomor(prefix, tanggal, nomor) for nomor in range(terakhir - jumlah + 1, terakhir + 1)]
+
+def lihat_nomor_berikutnya(cur, prefix, tanggal=None):
+    """Perkiraan nomor berikutnya untuk ditampilkan di form (tidak mengalokasikan)"""
+    tanggal = tanggal or datetime.now().date()
+    cur.execute("SELECT nomor_terakhir FROM nomor_urut WHERE prefix = %s AND tanggal = %s",
+                (prefix, tanggal))
+    row = cur.fetchone()
+    return format_nomor(prefix, tanggal, (row['nomor_terakhir'] if row else 0) + 1)
+
+# Cache data referensi
+# Kategori, satuan, dan daftar bahan aktif dipakai hampir di setiap form/filter tetapi
+# jarang berubah, jadi disimpan di memori proses. Cache dikosongkan saat data bahan
+# berubah di proses ini; worker lain memakai data lama paling lama REFERENSI_CACHE_TTL.
+# Baris dari cache dipakai bersama, jangan diubah oleh pemanggil.
+REFERENSI_QUERIES = {
+    'kategori': "SELECT * FROM kategori_bahan ORDER BY nama_kategori",
+    'satuan': "SELECT * FROM satuan ORDER BY nama_satuan",
+    'bahan_aktif': "SELECT * FROM bahan WHERE status = 'aktif' ORDER BY nama_bahan",
+}
+
+_referensi_cache = {}
+_referensi_lock = threading.Lock()
+
+def ambil_referensi(nama):
+    """Ambil data referensi dari cache, query ulang jika belum ada atau kadaluarsa"""
+    with _referensi_lock:
+        entry = _referensi_cache.get(nama)
+        if entry and time.monotonic() - entry[0] < app.config['REFERENSI_CACHE_TTL']:
+            return entry[1]
+    
+    # Cache dipakai semua request, jadi selalu dimuat dari primary (bukan replika yang bisa tertinggal)
+    cur = mysql.koneksi_primary.cursor()
+    cur.execute(REFERENSI_QUERIES[nama])
+    data = tuple(cur.fetchall())
+    cur.close()
+    
+    with _referensi_lock:
+        _referensi_cache[nama] = (time.monotonic(), data)
+    return data
+
+def invalidasi_referensi(*nama):
+    """Kosongkan cache referensi (semua jika nama tidak diberikan)"""
+    with _referensi_lock:
+        for key in nama or list(_referensi_cache):
+            _referensi_cache.pop(key, None)
+
+# Pencarian bahan (indeks trigram di memori)
+# Indeks dibangun dari cache referensi 'bahan_aktif' dan otomatis dibangun ulang
+# saat cache tersebut dimuat ulang (mis. setelah tambah/import bahan). Hasilnya sama
+# dengan LIKE '%kata%' pada nama/kode bahan, tetapi tanpa full scan tabel bahan.
+_indeks_bahan = {'sumber': None, 'entri': [], 'trigram': {}}
+_indeks_bahan_lock = threading.Lock()
+
+def normalisasi_teks(teks):
+    return ' '.join(str(teks or '').lower().split())
+
+def trigram(teks):
+    return {teks[i:i + 3] for i in range(len(teks) - 2)}
+
+def indeks_bahan():
+    """Ambil (entri, indeks trigram) bahan aktif, bangun ulang jika sumbernya berubah"""
+    data = ambil_referensi('bahan_aktif')
+    with _indeks_bahan_lock:
+        if _indeks_bahan['sumber'] is not data:
+            entri, indeks = [], {}
+            for posisi, row in enumerate(data):
+                kode = normalisasi_teks(row['kode_bahan'])
+                nama = normalisasi_teks(row['nama_bahan'])
+                entri.append((row, kode, nama))
+                for tri in trigram(kode) | trigram(nama):
+                    indeks.setdefault(tri, set()).add(posisi)
+            _indeks_bahan.update(sumber=data, entri=entri, trigram=indeks)
+        return _indeks_bahan['entri'], _indeks_bahan['trigram']
+
+def cari_bahan(keyword, limit=None):
+    """Cari bahan aktif berdasarkan potongan nama/kode, urut dari yang paling cocok"""
+    kata = normalisasi_teks(keyword)
+    entri, indeks = indeks_bahan()
+    if not kata:
+        return [row for row, _, _ in entri[:limit]]
+    
+    # Kata >= 3 huruf: kandidat = irisan posisi semua trigram-nya
+    kandidat = range(len(entri))
+    if len(kata) >= 3:
+        himpunan = sorted((indeks.get(tri, set()) for tri in trigram(kata)), key=len)
+        kandidat = sorted(set.intersection(*himpunan)) if himpunan[0] else []
+    
+    hasil = []
+    for posisi in kandidat:
+        row, kode, nama = entri[posisi]
+        if kata not in kode and kata not in nama:
+            continue
+        if kode == kata:
+            peringkat = 0
+        elif kode.startswith(kata) or nama.startswith(kata):
+            peringkat = 1
+        elif (' ' + kata) in (' ' + nama):
+            peringkat = 2
+        else:
+            peringkat = 3
+        hasil.append((peringkat, posisi, row))
+    
+    hasil.sort(key=lambda item: item[:2])
+    return [row for _, _, row in hasil[:limit]]
+
 # Halaman Login
 @app.route('/', methods=['GET', 'POST'])
 @app.route('/login', methods=['GET', 'POST'])
@@ -148,31 +1615,40 @@ def logout():
     flash('Anda telah logout', 'info')
     return redirect(url_for('login'))
 
-# Dashboard
-@app.route('/dashboard')
-def dashboard():
-    cur = mysql.connection.cursor()
-    
-    # Total bahan
+# Snapshot Dashboard
+# Agregat dashboard disimpan di memori proses dan diperbarui oleh setiap transaksi,
+# sehingga render dashboard cukup membaca snapshot. Setiap worker punya snapshot
+# sendiri; DASHBOARD_SNAPSHOT_TTL membatasi seberapa lama snapshot boleh basi.
+def _dashboard_total_bahan(cur):
     cur.execute("SELECT COUNT(*) as total FROM bahan WHERE status = 'aktif'")
-    total_bahan = cur.fetchone()['total']
-    
-    # Total stok
+    return cur.fetchone()['total']
+
+def _dashboard_total_stok(cur):
     cur.execute("SELECT SUM(jumlah) as total FROM stok")
-    total_stok_result = cur.fetchone()['total']
-    total_stok = float(total_stok_result) if total_stok_result else 0.0
-    
-    # Total penerimaan bulan ini
-    bulan_ini = datetime.now().strftime('%Y-%m')
-    cur.execute("SELECT SUM(jumlah) as total FROM penerimaan WHERE DATE_FORMAT(tanggal, '%%Y-%%m') = %s AND status = 'disetujui'", [bulan_ini])
-    total_penerimaan_result = cur.fetchone()['total']
-    total_penerimaan = float(total_penerimaan_result) if total_penerimaan_result else 0.0
-    
-    # Total pengeluaran bulan ini
-    cur.execute("SELECT SUM(jumlah) as total FROM pengeluaran WHERE DATE_FORMAT(tanggal, '%%Y-%%m') = %s AND status != 'draft'", [bulan_ini])
-    total_pengeluaran_result = cur.fetchone()['total']
-    total_pengeluaran = float(total_pengeluaran_result) if total_pengeluaran_result else 0.0
-    
+    total = cur.fetchone()['total']
+    return float(total) if total else 0.0
+
+QUERY_TOTAL_PENERIMAAN_BULAN = """
+    SELECT SUM(jumlah) as total FROM rekap_bulanan
+    WHERE jenis = 'penerimaan' AND bulan >= %s AND bulan < %s
+"""
+
+QUERY_TOTAL_PENGELUARAN_BULAN = """
+    SELECT SUM(jumlah) as total FROM rekap_bulanan
+    WHERE jenis = 'pengeluaran' AND bulan >= %s AND bulan < %s
+"""
+
+def _dashboard_total_penerimaan(cur):
+    cur.execute(QUERY_TOTAL_PENERIMAAN_BULAN, rentang_bulan())
+    total = cur.fetchone()['total']
+    return float(total) if total else 0.0
+
+def _dashboard_total_pengeluaran(cur):
+    cur.execute(QUERY_TOTAL_PENGELUARAN_BULAN, rentang_bulan())
+    total = cur.fetchone()['total']
+    return float(total) if total else 0.0
+
+def _dashboard_bahan_hampir_habis(cur):
     # Bahan hampir habis (stok < stok_minimum)
     cur.execute("""
         SELECT b.nama_bahan, s.jumlah, b.stok_minimum, sat.nama_satuan
@@ -183,30 +1659,43 @@ def dashboard():
         ORDER BY s.jumlah ASC
         LIMIT 5
     """)
-    bahan_hampir_habis = cur.fetchall()
-    
-    # Konversi Decimal ke float
-    for item in bahan_hampir_habis:
-        for key in ['jumlah', 'stok_minimum']:
-            if isinstance(item.get(key), Decimal):
-                item[key] = float(item[key])
-    
+    return cur.fetchall()
+
+# Kadaluarsa dihitung dari lot yang masih bersisa (barang yang sudah keluar tidak ikut)
+QUERY_BAHAN_MENDEKATI_KADALUARSA = """
+    SELECT l.no_penerimaan, l.no_batch, b.nama_bahan, l.sisa as jumlah, s.nama_satuan,
+           l.tanggal_kadaluarsa, DATEDIFF(l.tanggal_kadaluarsa, CURDATE()) as hari_menuju_kadaluarsa
+    FROM lot_stok l
+    JOIN bahan b ON l.bahan_id = b.id
+    LEFT JOIN satuan s ON b.satuan_id = s.id
+    WHERE l.tanggal_kadaluarsa >= %s AND l.tanggal_kadaluarsa < %s
+    ORDER BY l.tanggal_kadaluarsa ASC
+    LIMIT 5
+"""
+
+QUERY_STOK_KADALUARSA = """
+    SELECT l.no_penerimaan, l.no_batch, b.nama_bahan, l.sisa as jumlah, s.nama_satuan,
+           l.tanggal_kadaluarsa, DATEDIFF(CURDATE(), l.tanggal_kadaluarsa) as hari_lewat_kadaluarsa
+    FROM lot_stok l
+    JOIN bahan b ON l.bahan_id = b.id
+    LEFT JOIN satuan s ON b.satuan_id = s.id
+    WHERE l.tanggal_kadaluarsa < %s
+    ORDER BY l.tanggal_kadaluarsa ASC
+    LIMIT 5
+"""
+
+def _dashboard_bahan_mendekati_kadaluarsa(cur):
     # Bahan mendekati kadaluarsa (30 hari ke depan)
     hari_ini = datetime.now().date()
-    tiga_puluh_hari = (datetime.now() + timedelta(days=30)).date()
-    cur.execute("""
-        SELECT p.no_penerimaan, b.nama_bahan, p.jumlah, s.nama_satuan, p.tanggal_kadaluarsa,
-               DATEDIFF(p.tanggal_kadaluarsa, CURDATE()) as hari_menuju_kadaluarsa
-        FROM penerimaan p
-        JOIN bahan b ON p.bahan_id = b.id
-        JOIN satuan s ON p.satuan_id = s.id
-        WHERE p.tanggal_kadaluarsa BETWEEN %s AND %s
-        AND p.status = 'disetujui'
-        ORDER BY p.tanggal_kadaluarsa ASC
-        LIMIT 5
-    """, [hari_ini, tiga_puluh_hari])
-    bahan_mendekati_kadaluarsa = cur.fetchall()
-    
+    cur.execute(QUERY_BAHAN_MENDEKATI_KADALUARSA, [hari_ini, hari_ini + timedelta(days=31)])
+    return cur.fetchall()
+
+def _dashboard_stok_kadaluarsa(cur):
+    # Lot yang sudah lewat kadaluarsa tapi masih ada di gudang
+    cur.execute(QUERY_STOK_KADALUARSA, [datetime.now().date()])
+    return cur.fetchall()
+
+def _dashboard_stok_per_kategori(cur):
     # Data untuk grafik stok per kategori
     cur.execute("""
         SELECT kb.nama_kategori, SUM(s.jumlah) as total_stok
@@ -216,58 +1705,349 @@ def dashboard():
         GROUP BY kb.id, kb.nama_kategori
         ORDER BY total_stok DESC
     """)
-    stok_per_kategori = cur.fetchall()
+    data = cur.fetchall()
+    for item in data:
+        item['total_stok'] = float(item['total_stok']) if item['total_stok'] else 0.0
+    return data
+
+def _dashboard_distribusi_per_tujuan(cur):
+    # Data untuk grafik distribusi per tujuan
+    cur.execute("""
+        SELECT jenis_tujuan, CAST(SUM(jumlah_transaksi) AS UNSIGNED) as jumlah
+        FROM rekap_bulanan
+        WHERE jenis = 'pengeluaran'
+        GROUP BY jenis_tujuan
+        ORDER BY jumlah DESC
+    """)
+    return cur.fetchall()
+
+QUERY_PENERIMAAN_PER_BULAN = """
+    SELECT MONTH(r.bulan) as bulan, SUM(r.jumlah) as total 
+    FROM rekap_bulanan r
+    WHERE r.jenis = 'penerimaan' AND r.bulan >= %s AND r.bulan < %s
+    GROUP BY MONTH(r.bulan) 
+    ORDER BY MONTH(r.bulan)
+"""
+
+def _dashboard_penerimaan_per_bulan(cur):
+    # Total penerimaan per bulan tahun ini (index 0 = Januari)
+    cur.execute(QUERY_PENERIMAAN_PER_BULAN, rentang_tahun())
+    values = [0.0] * 12
+    for item in cur.fetchall():
+        if 1 <= item['bulan'] <= 12:
+            values[item['bulan'] - 1] = float(item['total']) if item['total'] else 0.0
+    return values
+
+def _dashboard_monitoring_terbaru(cur):
+    # Monitoring kualitas terbaru
+    cur.execute("""
+        SELECT mk.tanggal_check, b.nama_bahan, mk.kondisi_fisik, mk.status_kadaluarsa, mk.petugas
+        FROM monitoring_kualitas mk
+        JOIN bahan b ON mk.bahan_id = b.id
+        ORDER BY mk.tanggal_check DESC
+        LIMIT 5
+    """)
+    return cur.fetchall()
+
+DASHBOARD_SECTIONS = {
+    'total_bahan': _dashboard_total_bahan,
+    'total_stok': _dashboard_total_stok,
+    'total_penerimaan': _dashboard_total_penerimaan,
+    'total_pengeluaran': _dashboard_total_pengeluaran,
+    'bahan_hampir_habis': _dashboard_bahan_hampir_habis,
+    'bahan_mendekati_kadaluarsa': _dashboard_bahan_mendekati_kadaluarsa,
+    'stok_kadaluarsa': _dashboard_stok_kadaluarsa,
+    'stok_per_kategori': _dashboard_stok_per_kategori,
+    'distribusi_per_tujuan': _dashboard_distribusi_per_tujuan,
+    'penerimaan_per_bulan': _dashboard_penerimaan_per_bulan,
+    'monitoring_terbaru': _dashboard_monitoring_terbaru,
+}
+
+# Bagian dashboard yang berubah jika versi_data domain tersebut naik. Dipakai untuk
+# menyegarkan snapshot worker ini saat worker lain menulis data.
+SECTIONS_PER_VERSI = {
+    'bahan': ['total_bahan', 'bahan_hampir_habis', 'stok_per_kategori'],
+    'penerimaan': ['total_stok', 'total_penerimaan', 'bahan_hampir_habis', 'bahan_mendekati_kadaluarsa',
+                   'stok_kadaluarsa', 'stok_per_kategori', 'penerimaan_per_bulan'],
+    'pengeluaran': ['total_stok', 'total_pengeluaran', 'bahan_hampir_habis', 'bahan_mendekati_kadaluarsa',
+                    'stok_kadaluarsa', 'stok_per_kategori', 'distribusi_per_tujuan'],
+    'monitoring': ['monitoring_terbaru'],
+}
+
+_dashboard_lock = threading.Lock()
+_dashboard_snapshot = {'data': {}, 'built_at': None, 'tanggal': None, 'dirty': set(), 'versi': {},
+                       'membangun': 0}
+
+def ambil_versi_dashboard():
+    """Versi data semua domain yang ditampilkan di dashboard ({nama: versi})"""
+    cur = mysql.connection.cursor()
+    versi = ambil_versi_data(cur, list(SECTIONS_PER_VERSI))
+    cur.close()
+    return versi
+
+def get_dashboard_snapshot(force=False, versi=None):
+    """Ambil snapshot dashboard, bangun ulang bagian yang kadaluarsa.
+    
+    versi (hasil ambil_versi_dashboard) menandai bagian yang datanya sudah diubah
+    worker lain sejak snapshot ini dibangun. Query dijalankan di luar _dashboard_lock;
+    lock hanya dipegang saat memilih bagian dan saat memasang hasilnya.
+    """
+    with _dashboard_lock:
+        snapshot = _dashboard_snapshot
+        hari_ini = datetime.now().date()
+        
+        if versi is not None:
+            for nama, nilai in versi.items():
+                if snapshot['versi'].get(nama) != nilai:
+                    snapshot['dirty'].update(SECTIONS_PER_VERSI[nama])
+            snapshot['versi'] = dict(versi)
+        
+        # Bangun ulang penuh jika dipaksa, melewati TTL, atau tanggal sudah berganti
+        # (total bulanan dan daftar kadaluarsa bergantung pada tanggal hari ini)
+        expired = (snapshot['built_at'] is None
+                   or time.monotonic() - snapshot['built_at'] > app.config['DASHBOARD_SNAPSHOT_TTL']
+                   or snapshot['tanggal'] != hari_ini)
+        
+        if force or expired:
+            sections = list(DASHBOARD_SECTIONS)
+        else:
+            sections = [name for name in DASHBOARD_SECTIONS if name in snapshot['dirty']]
+        
+        if not sections:
+            return dict(snapshot['data'])
+        
+        # Bagian yang ditandai dirty lagi selama query berjalan tetap dirty setelah dipasang
+        snapshot['dirty'].difference_update(sections)
+        snapshot['membangun'] += 1
+    
+    try:
+        cur = mysql.connection.cursor()
+        try:
+            hasil = {name: DASHBOARD_SECTIONS[name](cur) for name in sections}
+        finally:
+            cur.close()
+    except Exception:
+        with _dashboard_lock:
+            snapshot['membangun'] -= 1
+            snapshot['dirty'].update(sections)
+        raise
+    
+    with _dashboard_lock:
+        snapshot['membangun'] -= 1
+        snapshot['data'].update(hasil)
+        if len(sections) == len(DASHBOARD_SECTIONS):
+            snapshot['built_at'] = time.monotonic()
+            snapshot['tanggal'] = hari_ini
+        return dict(snapshot['data'])
+
+def perbarui_snapshot_dashboard(delta=None, sections=()):
+    """Terapkan perubahan dari transaksi yang sudah di-commit ke snapshot dashboard.
+    
+    delta berisi selisih untuk angka agregat (mis. total_stok), sections berisi
+    bagian daftar yang akan dihitung ulang saat dashboard dibuka berikutnya.
+    """
+    with _dashboard_lock:
+        data = _dashboard_snapshot['data']
+        for key, nilai in (delta or {}).items():
+            if key in data:
+                data[key] += nilai
+        _dashboard_snapshot['dirty'].update(sections)
+        # Snapshot yang sedang dibangun bisa menimpa delta ini, jadi angkanya dihitung ulang
+        if _dashboard_snapshot['membangun']:
+            _dashboard_snapshot['dirty'].update(key for key in (delta or {}) if key in DASHBOARD_SECTIONS)
+    
+    siarkan('kpi', {'delta': delta or {}, 'sections': list(sections)})
+
+# Siaran perubahan data lewat Server-Sent Events
+# Event disimpan di ring buffer per proses. Pelanggan hanya menunggu Condition dan
+# tidak memegang koneksi database. Satu thread pemantau per proses membaca
+# perubahan dari worker lain (versi_data dan mutasi_stok) lewat pool, dan hanya
+# berjalan selama ada pelanggan.
+_siaran = {'events': deque(), 'id': 0, 'pelanggan': 0, 'pemantau': None}
+_siaran_kondisi = threading.Condition()
+
+def siarkan(jenis, data):
+    """Kirim event ke semua pelanggan SSE di proses ini"""
+    with _siaran_kondisi:
+        _siaran['id'] += 1
+        _siaran['events'].append((_siaran['id'], jenis, json.dumps(data, default=json_default)))
+        while len(_siaran['events']) > app.config['SSE_BUFFER_SIZE']:
+            _siaran['events'].popleft()
+        _siaran_kondisi.notify_all()
+
+def _pantau_perubahan():
+    """Thread pemantau: ubah perubahan versi_data dan mutasi_stok menjadi event"""
+    versi_terakhir, mutasi_terakhir = None, None
+    while True:
+        with _siaran_kondisi:
+            while not _siaran['pelanggan']:
+                versi_terakhir, mutasi_terakhir = None, None
+                _siaran_kondisi.wait()
+        
+        try:
+            with app.app_context():
+                cur = mysql.connection.cursor()
+                versi = ambil_versi_data(cur, list(SECTIONS_PER_VERSI))
+                
+                if mutasi_terakhir is None:
+                    cur.execute("SELECT COALESCE(MAX(id), 0) as id FROM mutasi_stok")
+                    mutasi_terakhir = cur.fetchone()['id']
+                
+                # Stok terbaru per bahan yang berubah sejak pengecekan sebelumnya
+                cur.execute("""
+                    SELECT m.id, m.bahan_id, m.jumlah as delta, s.jumlah
+                    FROM mutasi_stok m
+                    JOIN stok s ON m.bahan_id = s.bahan_id
+                    WHERE m.id > %s
+                    ORDER BY m.id
+                    LIMIT 1000
+                """, (mutasi_terakhir,))
+                perubahan = {}
+                for row in cur.fetchall():
+                    mutasi_terakhir = row['id']
+                    item = perubahan.setdefault(row['bahan_id'], {'bahan_id': row['bahan_id'], 'delta': 0})
+                    item['delta'] += row['delta']
+                    item['jumlah'] = row['jumlah']
+                cur.close()
+            
+            for item in perubahan.values():
+                siarkan('stok', item)
+            if versi_terakhir is not None and versi != versi_terakhir:
+                siarkan('versi', versi)
+            versi_terakhir = versi
+        except Exception as e:
+            app.logger.warning("Pemantau SSE gagal membaca perubahan: %s", e)
+        
+        time.sleep(app.config['SSE_POLL_INTERVAL'])
+
+def langganan_siaran(event_terakhir=0):
+    """Generator format text/event-stream untuk satu pelanggan"""
+    with _siaran_kondisi:
+        _siaran['pelanggan'] += 1
+        if _siaran['pemantau'] is None:
+            _siaran['pemantau'] = threading.Thread(target=_pantau_perubahan, daemon=True)
+            _siaran['pemantau'].start()
+        _siaran_kondisi.notify_all()
+        # Pelanggan baru mulai dari event terbaru; tersambung ulang melanjutkan dari Last-Event-ID.
+        # Nomor event hanya berlaku di proses ini (mulai dari 0 lagi setelah restart, berbeda
+        # antar worker), jadi Last-Event-ID yang tidak dikenal atau sudah keluar dari buffer
+        # tidak bisa dilanjutkan: pelanggan diminta memuat ulang data lewat event versi.
+        terlewat = bool(event_terakhir) and (
+            event_terakhir > _siaran['id'] or
+            (bool(_siaran['events']) and event_terakhir < _siaran['events'][0][0] - 1))
+        if terlewat or not event_terakhir:
+            event_terakhir = _siaran['id']
     
-    # Data untuk grafik distribusi per tujuan
-    cur.execute("""
-        SELECT jenis_tujuan, COUNT(*) as jumlah
-        FROM pengeluaran
-        WHERE status != 'draft'
-        GROUP BY jenis_tujuan
-        ORDER BY jumlah DESC
-    """)
-    distribusi_per_tujuan = cur.fetchall()
+    try:
+        yield "retry: 5000\n\n"
+        if terlewat:
+            yield f"id: {event_terakhir}\nevent: versi\ndata: {json.dumps({'muat_ulang': True})}\n\n"
+        while True:
+            with _siaran_kondisi:
+                if _siaran['id'] <= event_terakhir:
+                    _siaran_kondisi.wait(app.config['SSE_HEARTBEAT'])
+                baru = [event for event in _siaran['events'] if event[0] > event_terakhir]
+            
+            if not baru:
+                yield ": ping\n\n"
+                continue
+            
+            for event_id, jenis, data in baru:
+                yield f"id: {event_id}\nevent: {jenis}\ndata: {data}\n\n"
+            event_terakhir = baru[-1][0]
+    finally:
+        with _siaran_kondisi:
+            _siaran['pelanggan'] -= 1
+
+def is_bulan_ini(tanggal):
+    """Cek apakah tanggal (string YYYY-MM-DD) berada di bulan berjalan"""
+    return str(tanggal)[:7] == datetime.now().strftime('%Y-%m')
+
+# Dashboard
+@app.route('/dashboard')
+def dashboard():
+    snapshot = get_dashboard_snapshot(versi=ambil_versi_dashboard())
     
-    # Monitoring kualitas terbaru
-    cur.execute("""
-        SELECT mk.tanggal_check, b.nama_bahan, mk.kondisi_fisik, mk.status_kadaluarsa, mk.petugas
-        FROM monitoring_kualitas mk
-        JOIN bahan b ON mk.bahan_id = b.id
-        ORDER BY mk.tanggal_check DESC
-        LIMIT 5
-    """)
-    monitoring_terbaru = cur.fetchall()
+    return render_template('dashboard.html', **snapshot)
+
+LABEL_BULAN = ['Jan', 'Feb', 'Mar', 'Apr', 'Mei', 'Jun', 'Jul', 'Agu', 'Sep', 'Okt', 'Nov', 'Des']
+
+LABEL_JENIS_TUJUAN = {
+    'sekolah': 'Sekolah',
+    'posyandu': 'Posyandu',
+    'puskesmas': 'Puskesmas',
+    'rumah_sakit': 'Rumah Sakit',
+    'lainnya': 'Lainnya',
+}
+
+# API data dashboard (KPI dan semua chart) dalam satu respons
+# ETag dibentuk dari versi_data dan tanggal hari ini, jadi polling yang datanya belum
+# berubah dijawab 304 hanya dengan satu query ke versi_data.
+@app.route('/api/dashboard')
+def api_dashboard():
+    if not is_logged_in():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    versi = ambil_versi_dashboard()
+    etag = 'dashboard-{}-{}'.format(datetime.now().date().isoformat(),
+                                    '-'.join(str(versi.get(nama, 0)) for nama in SECTIONS_PER_VERSI))
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        data = get_dashboard_snapshot(versi=versi)
+        response = Response(json.dumps({
+            'versi': etag,
+            'kpi': {nama: data[nama] for nama in ('total_bahan', 'total_stok', 'total_penerimaan',
+                                                  'total_pengeluaran')},
+            'stok_per_kategori': {'labels': [item['nama_kategori'] for item in data['stok_per_kategori']],
+                                  'values': [item['total_stok'] for item in data['stok_per_kategori']]},
+            'penerimaan_per_bulan': {'labels': LABEL_BULAN, 'values': data['penerimaan_per_bulan']},
+            'distribusi_per_tujuan': {
+                'labels': [LABEL_JENIS_TUJUAN.get(item['jenis_tujuan'], item['jenis_tujuan'])
+                           for item in data['distribusi_per_tujuan']],
+                'values': [item['jumlah'] for item in data['distribusi_per_tujuan']]},
+            'bahan_hampir_habis': data['bahan_hampir_habis'],
+            'bahan_mendekati_kadaluarsa': data['bahan_mendekati_kadaluarsa'],
+            'stok_kadaluarsa': data['stok_kadaluarsa'],
+            'monitoring_terbaru': data['monitoring_terbaru'],
+        }, default=json_default), mimetype='application/json')
+    
+    # no-cache: browser boleh menyimpan respons tapi wajib revalidasi dengan If-None-Match
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Bangun ulang snapshot dashboard secara paksa
+@app.route('/dashboard/refresh', methods=['POST'])
+def refresh_dashboard():
+    if not check_role(['admin']):
+        flash('Akses ditolak!', 'danger')
+        return redirect(url_for('dashboard'))
     
-    cur.close()
+    get_dashboard_snapshot(force=True)
+    flash('Data dashboard berhasil diperbarui!', 'success')
+    return redirect(url_for('dashboard'))
+
+# Stream perubahan stok dan KPI (Server-Sent Events)
+# Setiap pelanggan memakai satu thread worker selama tersambung, jadi jalankan
+# dengan server threaded/gevent; koneksi database tidak dipegang selama streaming.
+@app.route('/api/stream')
+def api_stream():
+    if not is_logged_in():
+        return jsonify({'error': 'Unauthorized'}), 401
     
-    return render_template('dashboard.html', 
-                         total_bahan=total_bahan,
-                         total_stok=total_stok,
-                         total_penerimaan=total_penerimaan,
-                         total_pengeluaran=total_pengeluaran,
-                         bahan_hampir_habis=bahan_hampir_habis,
-                         bahan_mendekati_kadaluarsa=bahan_mendekati_kadaluarsa,
-                         stok_per_kategori=stok_per_kategori,
-                         distribusi_per_tujuan=distribusi_per_tujuan,
-                         monitoring_terbaru=monitoring_terbaru)
+    event_terakhir = request.headers.get('Last-Event-ID', 0, type=int)
+    return Response(langganan_siaran(event_terakhir), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # API untuk data chart
 @app.route('/api/stok-per-kategori')
 def api_stok_per_kategori():
-    cur = mysql.connection.cursor()
-    cur.execute("""
-        SELECT kb.nama_kategori, SUM(s.jumlah) as total_stok
-        FROM stok s
-        JOIN bahan b ON s.bahan_id = b.id
-        JOIN kategori_bahan kb ON b.kategori_id = kb.id
-        GROUP BY kb.id, kb.nama_kategori
-        ORDER BY total_stok DESC
-    """)
-    data = cur.fetchall()
-    cur.close()
+    data = get_dashboard_snapshot()['stok_per_kategori']
     
     labels = [item['nama_kategori'] for item in data]
-    values = [float(item['total_stok']) if item['total_stok'] else 0.0 for item in data]
+    values = [item['total_stok'] for item in data]
     
     return jsonify({
         'labels': labels,
@@ -276,29 +2056,130 @@ def api_stok_per_kategori():
 
 @app.route('/api/penerimaan-per-bulan')
 def api_penerimaan_per_bulan():
+    return jsonify({
+        'labels': LABEL_BULAN,
+        'values': get_dashboard_snapshot()['penerimaan_per_bulan']
+    })
+
+# API pencarian bahan untuk autocomplete form (q = potongan nama/kode bahan)
+# stok=1 menambahkan stok saat ini (satu query untuk hasil yang ditampilkan saja)
+@app.route('/api/bahan/cari')
+def api_cari_bahan():
+    limit = max(1, min(request.args.get('limit', 20, type=int) or 20, 100))
+    hasil = cari_bahan(request.args.get('q', ''), limit)
+    satuan_map = {row['id']: row['nama_satuan'] for row in ambil_referensi('satuan')}
+    
+    stok_map = {}
+    if request.args.get('stok') and hasil:
+        cur = mysql.connection.cursor()
+        cur.execute("SELECT bahan_id, jumlah FROM stok WHERE bahan_id IN ({})".format(
+            ', '.join(['%s'] * len(hasil))), [row['id'] for row in hasil])
+        stok_map = {row['bahan_id']: row['jumlah'] for row in cur.fetchall()}
+        cur.close()
+    
+    data = []
+    for row in hasil:
+        item = {'id': row['id'], 'kode_bahan': row['kode_bahan'], 'nama_bahan': row['nama_bahan'],
+                'satuan_id': row['satuan_id'], 'nama_satuan': satuan_map.get(row['satuan_id'], '')}
+        if request.args.get('stok'):
+            item['stok_sekarang'] = stok_map.get(row['id'], 0)
+        data.append(item)
+    
+    return jsonify({'data': data})
+
+# API saran lot untuk pengeluaran (urut FEFO); tanpa jumlah, semua lot bahan ditampilkan
+@app.route('/api/bahan/<int:bahan_id>/lot')
+def api_lot_bahan(bahan_id):
+    jumlah = request.args.get('jumlah', type=float)
+    
     cur = mysql.connection.cursor()
-    cur.execute("""
-        SELECT MONTH(tanggal) as bulan, SUM(jumlah) as total 
-        FROM penerimaan 
-        WHERE YEAR(tanggal) = YEAR(CURDATE()) AND status = 'disetujui'
-        GROUP BY MONTH(tanggal) 
-        ORDER BY bulan
-    """)
-    data = cur.fetchall()
+    pilihan = saran_lot_fefo(cur, bahan_id, jumlah if jumlah else float('inf'))
     cur.close()
     
-    labels = ['Jan', 'Feb', 'Mar', 'Apr', 'Mei', 'Jun', 'Jul', 'Agu', 'Sep', 'Okt', 'Nov', 'Des']
-    values = [0] * 12
+    data = [{'no_penerimaan': lot['no_penerimaan'], 'no_batch': lot['no_batch'],
+             'tanggal_kadaluarsa': lot['tanggal_kadaluarsa'].isoformat() if lot['tanggal_kadaluarsa'] else None,
+             'sisa': lot['sisa'], 'ambil': ambil}
+            for lot, ambil in pilihan]
+    return jsonify({'data': data, 'kurang': max((jumlah or 0) - sum(item['ambil'] for item in data), 0)})
+
+# API daftar transaksi (pagination keyset, parameter filter sama dengan halaman HTML)
+# format=rows mengembalikan {columns, rows} dengan baris berupa array (lebih ringkas)
+def api_halaman(query, params, per_page, kolom_tanggal):
+    if request.args.get('format') == 'rows':
+        cur = mysql.connection.cursor(MySQLdb.cursors.Cursor)
+        cur.execute(query, params)
+        kolom = kolom_cursor(cur)
+        rows = cur.fetchall()
+        cur.close()
+        
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = encode_cursor(rows[-1][kolom.index(kolom_tanggal)], rows[-1][kolom.index('id')])
+        
+        return Response(json.dumps({'columns': kolom, 'rows': rows, 'next_cursor': next_cursor,
+                                    'per_page': per_page}, default=json_default),
+                        mimetype='application/json')
     
-    for item in data:
-        if 1 <= item['bulan'] <= 12:
-            values[item['bulan'] - 1] = float(item['total']) if item['total'] else 0.0
+    cur = mysql.connection.cursor()
+    cur.execute(query, params)
+    data, next_cursor = potong_halaman(cur.fetchall(), per_page, kolom_tanggal)
+    cur.close()
     
     return jsonify({
-        'labels': labels,
-        'values': values
+        'data': [serialisasi_baris(item) for item in data],
+        'next_cursor': next_cursor,
+        'per_page': per_page
     })
 
+@app.route('/api/penerimaan')
+@baca_replika
+def api_penerimaan():
+    if not check_role(['admin', 'gudang']):
+        return jsonify({'error': 'Akses ditolak'}), 403
+    
+    per_page = get_page_size()
+    query, params = query_penerimaan(request.args.get('start_date', ''),
+                                     request.args.get('end_date', ''),
+                                     request.args.get('status', ''),
+                                     cursor=request.args.get('cursor'), limit=per_page)
+    return api_halaman(query, params, per_page, 'tanggal')
+
+@app.route('/api/pengeluaran')
+@baca_replika
+def api_pengeluaran():
+    if not check_role(['admin', 'gudang', 'distribusi']):
+        return jsonify({'error': 'Akses ditolak'}), 403
+    
+    per_page = get_page_size()
+    query, params = query_pengeluaran(request.args.get('start_date', ''),
+                                      request.args.get('end_date', ''),
+                                      request.args.get('status', ''),
+                                      request.args.get('jenis_tujuan', ''),
+                                      cursor=request.args.get('cursor'), limit=per_page)
+    return api_halaman(query, params, per_page, 'tanggal')
+
+@app.route('/api/monitoring')
+@baca_replika
+def api_monitoring():
+    per_page = get_page_size()
+    query, params = query_monitoring(request.args.get('start_date', ''),
+                                     request.args.get('end_date', ''),
+                                     request.args.get('bahan_id', ''),
+                                     cursor=request.args.get('cursor'), limit=per_page)
+    return api_halaman(query, params, per_page, 'tanggal_check')
+
+@app.route('/api/distribusi')
+@baca_replika
+def api_distribusi():
+    per_page = get_page_size()
+    query, params = query_distribusi(KOLOM_DISTRIBUSI_LAPORAN,
+                                     request.args.get('start_date', ''),
+                                     request.args.get('end_date', ''),
+                                     request.args.get('jenis_tujuan', ''),
+                                     cursor=request.args.get('cursor'), limit=per_page)
+    return api_halaman(query, params, per_page, 'tanggal')
+
 # Master Data - Bahan
 @app.route('/master-bahan')
 def master_bahan():
@@ -322,9 +2203,14 @@ def master_bahan():
     """
     params = []
     
-    if keyword:
-        query += " AND (b.nama_bahan LIKE %s OR b.kode_bahan LIKE %s)"
-        params.extend([f"%{keyword}%", f"%{keyword}%"])
+    # Kata kunci dicari di indeks bahan, query hanya mengambil ID yang cocok (paling banyak
+    # MAX_PAGE_SIZE yang paling relevan). Kata kunci berisi spasi saja berarti tanpa filter.
+    bahan_ids = None
+    if normalisasi_teks(keyword):
+        bahan_ids = [row['id'] for row in cari_bahan(keyword, app.config['MAX_PAGE_SIZE'])]
+    if bahan_ids:
+        query += " AND b.id IN ({})".format(', '.join(['%s'] * len(bahan_ids)))
+        params.extend(bahan_ids)
     
     if filter_kategori:
         query += " AND b.kategori_id = %s"
@@ -332,19 +2218,16 @@ def master_bahan():
     
     query += " ORDER BY b.nama_bahan"
     
-    cur.execute(query, params)
-    data = cur.fetchall()
+    data = []
+    if bahan_ids != []:
+        cur.execute(query, params)
+        data = cur.fetchall()
     
-    # Konversi Decimal ke float untuk field tertentu dan hitung statistik
+    # Hitung stok kritis dan total stok (kolom DECIMAL sudah float dari driver)
     stok_kritis = 0
     total_stok = 0
     
     for item in data:
-        for key in ['stok_sekarang', 'stok_minimum', 'stok_maksimum', 'berat_per_unit', 'kalori_per_unit', 'protein_per_unit']:
-            if item.get(key) is not None and isinstance(item[key], Decimal):
-                item[key] = float(item[key])
-        
-        # Hitung stok kritis dan total stok
         stok_sekarang = item.get('stok_sekarang', 0) or 0
         stok_minimum = item.get('stok_minimum', 0) or 0
         
@@ -353,12 +2236,11 @@ def master_bahan():
             if stok_sekarang <= stok_minimum:
                 stok_kritis += 1
     
-    # Ambil list kategori unik untuk filter
-    cur.execute("SELECT * FROM kategori_bahan ORDER BY nama_kategori")
-    kategori_list = cur.fetchall()
-    
     cur.close()
     
+    # Ambil list kategori unik untuk filter
+    kategori_list = ambil_referensi('kategori')
+    
     return render_template('master_bahan.html', 
                          bahan=data, 
                          keyword=keyword,
@@ -374,9 +2256,8 @@ def tambah_bahan():
         flash('Akses ditolak!', 'danger')
         return redirect(url_for('dashboard'))
     
-    cur = mysql.connection.cursor()
-    
     if request.method == 'POST':
+        cur = mysql.connection.cursor()
         kode_bahan = request.form['kode_bahan']
         nama_bahan = request.form['nama_bahan']
         kategori_id = request.form['kategori_id']
@@ -404,25 +2285,182 @@ def tambah_bahan():
             cur.execute("INSERT INTO stok (bahan_id, jumlah, satuan_id) VALUES (%s, 0, %s)", 
                        (bahan_id, satuan_id))
             
+            naikkan_versi_data(cur, 'bahan')
             mysql.connection.commit()
+            invalidasi_referensi('bahan_aktif')
+            perbarui_snapshot_dashboard({'total_bahan': 1},
+                                        ['bahan_hampir_habis', 'stok_per_kategori'])
             flash('Data bahan berhasil ditambahkan!', 'success')
             return redirect(url_for('master_bahan'))
         except Exception as e:
             mysql.connection.rollback()
             flash(f'Error: {str(e)}', 'danger')
+        finally:
+            cur.close()
+    
+    # Ambil data untuk dropdown (dari cache referensi)
+    return render_template('tambah_bahan.html', 
+                         kategori_list=ambil_referensi('kategori'),
+                         satuan_list=ambil_referensi('satuan'))
+
+# Import / Upsert Master Bahan (CSV/XLSX)
+# Baris dicocokkan berdasarkan kode_bahan: bahan baru ditambahkan, bahan yang sudah
+# ada diperbarui. Nama kategori/satuan diterjemahkan ke ID dengan peta yang dimuat
+# sekali. Penulisan memakai INSERT ... ON DUPLICATE KEY UPDATE per potongan, lalu
+# baris stok yang belum ada dibuat dengan satu INSERT ... SELECT.
+KOLOM_IMPORT_BAHAN = ['kode_bahan', 'nama_bahan', 'kategori', 'satuan', 'stok_minimum', 'stok_maksimum',
+                      'berat_per_unit', 'kalori_per_unit', 'protein_per_unit', 'status', 'keterangan']
+ANGKA_IMPORT_BAHAN = {'stok_minimum': 0, 'stok_maksimum': 0, 'berat_per_unit': 1,
+                      'kalori_per_unit': 0, 'protein_per_unit': 0}
+
+def validasi_import_bahan(rows, kategori_map, satuan_map):
+    """Validasi baris import bahan, mengembalikan (baris valid, daftar (no baris, pesan))"""
+    valid, errors, kode_dipakai = [], [], {}
     
-    # Ambil data untuk dropdown
-    cur.execute("SELECT * FROM kategori_bahan ORDER BY nama_kategori")
-    kategori_list = cur.fetchall()
+    for nomor, row in enumerate(rows, start=2):
+        pesan = []
+        
+        kode_bahan = nilai_import(row.get('kode_bahan')).upper()
+        if not kode_bahan or len(kode_bahan) > 20:
+            pesan.append('kode_bahan wajib diisi (maksimal 20 karakter)')
+        elif kode_bahan in kode_dipakai:
+            pesan.append(f'kode_bahan duplikat dengan baris {kode_dipakai[kode_bahan]}')
+        else:
+            kode_dipakai[kode_bahan] = nomor
+        
+        nama_bahan = nilai_import(row.get('nama_bahan'))
+        if not nama_bahan:
+            pesan.append('nama_bahan wajib diisi')
+        
+        kategori_id = kategori_map.get(nilai_import(row.get('kategori')).lower())
+        if not kategori_id:
+            pesan.append(f"kategori '{nilai_import(row.get('kategori'))}' tidak ditemukan")
+        
+        satuan_id = satuan_map.get(nilai_import(row.get('satuan')).lower())
+        if not satuan_id:
+            pesan.append(f"satuan '{nilai_import(row.get('satuan'))}' tidak ditemukan")
+        
+        angka = {}
+        for kolom, default in ANGKA_IMPORT_BAHAN.items():
+            try:
+                angka[kolom] = float(nilai_import(row.get(kolom)) or default)
+            except ValueError:
+                pesan.append(f'{kolom} harus berupa angka')
+        
+        status = nilai_import(row.get('status')).lower() or 'aktif'
+        if status not in ('aktif', 'nonaktif'):
+            pesan.append('status harus aktif atau nonaktif')
+        
+        if pesan:
+            errors.append((nomor, '; '.join(pesan)))
+            continue
+        
+        valid.append((kode_bahan, nama_bahan, kategori_id, satuan_id,
+                      angka['stok_minimum'], angka['stok_maksimum'], angka['berat_per_unit'],
+                      angka['kalori_per_unit'], angka['protein_per_unit'], status,
+                      nilai_import(row.get('keterangan'))))
     
-    cur.execute("SELECT * FROM satuan ORDER BY nama_satuan")
-    satuan_list = cur.fetchall()
+    return valid, errors
+
+def upsert_bahan(cur, baris):
+    """Tambah/perbarui bahan berdasarkan kode_bahan (tanpa commit).
     
-    cur.close()
+    Mengembalikan jumlah bahan baru, dihitung dari baris stok awal yang dibuat.
+    """
+    batch = app.config['IMPORT_BATCH_SIZE']
+    baru = 0
+    for awal in range(0, len(baris), batch):
+        bagian = baris[awal:awal + batch]
+        cur.executemany("""
+            INSERT INTO bahan (kode_bahan, nama_bahan, kategori_id, satuan_id, 
+                             stok_minimum, stok_maksimum, berat_per_unit,
+                             kalori_per_unit, protein_per_unit, status, keterangan)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                nama_bahan = VALUES(nama_bahan),
+                kategori_id = VALUES(kategori_id),
+                satuan_id = VALUES(satuan_id),
+                stok_minimum = VALUES(stok_minimum),
+                stok_maksimum = VALUES(stok_maksimum),
+                berat_per_unit = VALUES(berat_per_unit),
+                kalori_per_unit = VALUES(kalori_per_unit),
+                protein_per_unit = VALUES(protein_per_unit),
+                status = VALUES(status),
+                keterangan = VALUES(keterangan)
+        """, bagian)
+        
+        kode = [row[0] for row in bagian]
+        placeholder = ', '.join(['%s'] * len(kode))
+        
+        # Satuan stok mengikuti satuan bahan yang diperbarui
+        cur.execute("""
+            UPDATE stok s
+            JOIN bahan b ON s.bahan_id = b.id
+            SET s.satuan_id = b.satuan_id
+            WHERE b.kode_bahan IN ({}) AND NOT s.satuan_id <=> b.satuan_id
+        """.format(placeholder), kode)
+        
+        # Stok awal 0 untuk bahan yang diimport dan belum punya baris stok
+        cur.execute("""
+            INSERT INTO stok (bahan_id, jumlah, satuan_id)
+            SELECT b.id, 0, b.satuan_id
+            FROM bahan b
+            LEFT JOIN stok s ON b.id = s.bahan_id
+            WHERE b.kode_bahan IN ({}) AND s.id IS NULL AND b.satuan_id IS NOT NULL
+        """.format(placeholder), kode)
+        baru += cur.rowcount
+    return baru
+
+@app.route('/import-bahan', methods=['GET', 'POST'])
+def import_bahan():
+    if not check_role(['admin', 'gudang']):
+        flash('Akses ditolak!', 'danger')
+        return redirect(url_for('dashboard'))
     
-    return render_template('tambah_bahan.html', 
-                         kategori_list=kategori_list,
-                         satuan_list=satuan_list)
+    errors = []
+    if request.method == 'POST':
+        file = request.files.get('file')
+        rows = []
+        if not file or not file.filename:
+            flash('Pilih file CSV/XLSX yang berisi data bahan.', 'warning')
+        else:
+            try:
+                rows = baca_file_import(file)
+                if not rows:
+                    flash('File tidak berisi data bahan.', 'warning')
+            except Exception as e:
+                flash(f'File tidak dapat dibaca: {str(e)}', 'danger')
+        
+        if rows:
+            cur = mysql.connection.cursor()
+            
+            # Peta nama -> ID dibuat sekali untuk seluruh baris
+            kategori_map = {row['nama_kategori'].lower(): row['id'] for row in ambil_referensi('kategori')}
+            satuan_map = {row['nama_satuan'].lower(): row['id'] for row in ambil_referensi('satuan')}
+            
+            baris, errors = validasi_import_bahan(rows, kategori_map, satuan_map)
+            
+            if errors:
+                flash(f'{len(errors)} dari {len(rows)} baris tidak valid, tidak ada data yang disimpan.', 'danger')
+            else:
+                try:
+                    baru = upsert_bahan(cur, baris)
+                    naikkan_versi_data(cur, 'bahan')
+                    mysql.connection.commit()
+                    invalidasi_referensi('bahan_aktif')
+                    perbarui_snapshot_dashboard(sections=['total_bahan', 'bahan_hampir_habis', 'stok_per_kategori'])
+                    flash(f'{len(baris)} bahan berhasil diimport, {baru} bahan baru dibuatkan stok awal.',
+                          'success')
+                    cur.close()
+                    return redirect(url_for('master_bahan'))
+                except Exception as e:
+                    mysql.connection.rollback()
+                    flash(f'Error: {str(e)}', 'danger')
+            cur.close()
+    
+    return render_template('import_bahan.html',
+                         kolom=KOLOM_IMPORT_BAHAN,
+                         errors=errors)
 
 # Penerimaan Barang
 @app.route('/penerimaan')
@@ -438,38 +2476,17 @@ def penerimaan():
     
     cur = mysql.connection.cursor()
     
-    query = """
-        SELECT p.*, b.nama_bahan, b.kode_bahan, s.nama_satuan,
-               COALESCE(p.total_harga, p.jumlah * p.harga_satuan) as total_harga
-        FROM penerimaan p
-        JOIN bahan b ON p.bahan_id = b.id
-        JOIN satuan s ON p.satuan_id = s.id
-        WHERE 1=1
-    """
-    params = []
-    
-    if start_date:
-        query += " AND p.tanggal >= %s"
-        params.append(start_date)
-    
-    if end_date:
-        query += " AND p.tanggal <= %s"
-        params.append(end_date)
-    
-    if status:
-        query += " AND p.status = %s"
-        params.append(status)
-    
-    query += " ORDER BY p.tanggal DESC"
+    per_page = get_page_size()
+    query, params = query_penerimaan(start_date, end_date, status,
+                                     cursor=request.args.get('cursor'), limit=per_page)
     
     cur.execute(query, params)
-    data = cur.fetchall()
+    data, next_cursor = potong_halaman(cur.fetchall(), per_page, 'tanggal')
     
-    # Konversi Decimal ke float untuk field tertentu
-    for item in data:
-        for key in ['jumlah', 'harga_satuan', 'total_harga']:
-            if item.get(key) is not None and isinstance(item[key], Decimal):
-                item[key] = float(item[key])
+    # Ringkasan dihitung dari seluruh data yang difilter, bukan hanya halaman ini
+    query, params = query_ringkasan_penerimaan(start_date, end_date, status)
+    cur.execute(query, params)
+    ringkasan = cur.fetchone()
     
     cur.close()
     
@@ -478,6 +2495,8 @@ def penerimaan():
     
     return render_template('penerimaan.html', 
                          penerimaan=data,
+                         ringkasan=ringkasan,
+                         next_cursor=next_cursor,
                          start_date=start_date,
                          end_date=end_date,
                          status=status,
@@ -493,13 +2512,11 @@ def tambah_penerimaan():
     cur = mysql.connection.cursor()
     
     if request.method == 'POST':
-        no_penerimaan = request.form['no_penerimaan']
         tanggal = request.form['tanggal']
         bahan_id = request.form['bahan_id']
         jumlah = float(request.form['jumlah'])
         satuan_id = request.form['satuan_id']
         harga_satuan = float(request.form.get('harga_satuan', 0) or 0)
-        total_harga = jumlah * harga_satuan  # Hitung total
         supplier = request.form.get('supplier', '')
         no_batch = request.form.get('no_batch', '')
         tanggal_produksi = request.form.get('tanggal_produksi', None)
@@ -509,52 +2526,243 @@ def tambah_penerimaan():
         catatan = request.form.get('catatan', '')
         
         try:
-            # Simpan penerimaan dengan total_harga
+            # Nomor penerimaan dialokasikan saat disimpan (nomor di form hanya perkiraan)
+            no_penerimaan = alokasi_nomor(cur, 'TRM')[0]
+            
+            # Simpan penerimaan (total_harga kolom generated, dihitung MySQL)
             cur.execute("""
                 INSERT INTO penerimaan 
                 (no_penerimaan, tanggal, bahan_id, jumlah, satuan_id, harga_satuan,
-                 total_harga, supplier, no_batch, tanggal_produksi, tanggal_kadaluarsa,
+                 supplier, no_batch, tanggal_produksi, tanggal_kadaluarsa,
                  kondisi, penerima, catatan, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'disetujui')
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'disetujui')
             """, (no_penerimaan, tanggal, bahan_id, jumlah, satuan_id, harga_satuan,
-                  total_harga, supplier, no_batch, tanggal_produksi, tanggal_kadaluarsa,
+                  supplier, no_batch, tanggal_produksi, tanggal_kadaluarsa,
                   kondisi, penerima, catatan))
             
             # Update stok
-            cur.execute("""
-                UPDATE stok 
-                SET jumlah = jumlah + %s,
-                    last_update = CURRENT_TIMESTAMP
-                WHERE bahan_id = %s
-            """, (jumlah, bahan_id))
+            tambah_stok(cur, bahan_id, jumlah, tanggal, no_penerimaan)
+            tambah_lot_stok(cur, [(bahan_id, jumlah, no_penerimaan, no_batch, tanggal_kadaluarsa)])
+            catat_rekap(cur, 'penerimaan', [(tanggal, bahan_id, '', jumlah)])
+            
+            # Update harga rata-rata untuk valuasi stok
+            catat_harga_penerimaan(cur, bahan_id, jumlah, harga_satuan)
             
+            naikkan_versi_data(cur, 'penerimaan')
             mysql.connection.commit()
-            flash('Penerimaan berhasil dicatat dan stok diperbarui!', 'success')
+            perbarui_snapshot_dashboard({'total_stok': jumlah,
+                                         'total_penerimaan': jumlah if is_bulan_ini(tanggal) else 0},
+                                        ['bahan_hampir_habis', 'bahan_mendekati_kadaluarsa', 'stok_kadaluarsa',
+                                         'stok_per_kategori', 'penerimaan_per_bulan'])
+            flash(f'Penerimaan {no_penerimaan} berhasil dicatat dan stok diperbarui!', 'success')
             return redirect(url_for('penerimaan'))
         except Exception as e:
             mysql.connection.rollback()
             flash(f'Error: {str(e)}', 'danger')
     
-    # Ambil data untuk dropdown
-    cur.execute("SELECT * FROM bahan WHERE status = 'aktif' ORDER BY nama_bahan")
-    bahan_list = cur.fetchall()
-    
-    cur.execute("SELECT * FROM satuan ORDER BY nama_satuan")
-    satuan_list = cur.fetchall()
-    
-    # Generate nomor penerimaan otomatis
-    today = datetime.now().strftime('%Y%m%d')
-    cur.execute("SELECT COUNT(*) as count FROM penerimaan WHERE DATE(created_at) = CURDATE()")
-    count = cur.fetchone()['count']
-    no_penerimaan_otomatis = f"TRM-{today}-{count+1:03d}"
+    # Perkiraan nomor penerimaan berikutnya
+    no_penerimaan_otomatis = lihat_nomor_berikutnya(cur, 'TRM')
     
     cur.close()
     
+    # Ambil data untuk dropdown (dari cache referensi)
     return render_template('tambah_penerimaan.html', 
-                         bahan_list=bahan_list,
-                         satuan_list=satuan_list,
+                         satuan_list=ambil_referensi('satuan'),
                          no_penerimaan_otomatis=no_penerimaan_otomatis)
 
+# Import Penerimaan (CSV/XLSX manifest supplier)
+# Semua baris divalidasi di memori memakai peta kode_bahan/nama_satuan yang dimuat
+# sekali di awal. Jika ada baris yang salah, tidak ada yang disimpan dan laporan
+# error per baris ditampilkan. Jika semua valid, penerimaan disimpan dengan
+# executemany dan stok ditambah sekali per bahan, dalam satu transaksi.
+KOLOM_IMPORT_PENERIMAAN = ['tanggal', 'kode_bahan', 'jumlah', 'satuan', 'harga_satuan', 'supplier',
+                           'no_batch', 'tanggal_produksi', 'tanggal_kadaluarsa', 'kondisi', 'catatan']
+KONDISI_PENERIMAAN = ('baik', 'rusak_sebagian', 'rusak_total')
+
+def baca_file_import(file):
+    """Baca file CSV/XLSX yang diupload sebagai daftar dict per baris"""
+    nama = (file.filename or '').lower()
+    
+    if nama.endswith('.xlsx'):
+        workbook = load_workbook(file.stream, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(kolom or '').strip().lower() for kolom in next(rows, ())]
+        data = [dict(zip(header, row)) for row in rows if any(nilai not in (None, '') for nilai in row)]
+        workbook.close()
+        return data
+    
+    if nama.endswith('.csv'):
+        reader = csv.DictReader(io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline=''))
+        reader.fieldnames = [kolom.strip().lower() for kolom in reader.fieldnames or []]
+        return [row for row in reader if any((nilai or '').strip() for nilai in row.values() if isinstance(nilai, str))]
+    
+    raise ValueError('Format file harus .csv atau .xlsx')
+
+def nilai_import(value):
+    """Nilai sel sebagai string tanpa spasi ('' jika kosong)"""
+    return '' if value is None else str(value).strip()
+
+def tanggal_import(value):
+    """Tanggal dari sel Excel (datetime/date) atau string YYYY-MM-DD"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return parse_tanggal(nilai_import(value))
+
+def validasi_import_penerimaan(rows, bahan_map, satuan_map):
+    """Validasi baris import, mengembalikan (baris valid, daftar (no baris, pesan))"""
+    valid, errors = [], []
+    
+    # Baris 1 adalah header, jadi data dimulai dari baris 2
+    for nomor, row in enumerate(rows, start=2):
+        pesan = []
+        
+        tanggal = tanggal_import(row.get('tanggal'))
+        if not tanggal:
+            pesan.append('tanggal kosong/tidak valid (format YYYY-MM-DD)')
+        
+        bahan = bahan_map.get(nilai_import(row.get('kode_bahan')).upper())
+        if not bahan:
+            pesan.append(f"kode_bahan '{nilai_import(row.get('kode_bahan'))}' tidak ditemukan")
+        
+        try:
+            jumlah = float(nilai_import(row.get('jumlah')))
+            if jumlah <= 0:
+                pesan.append('jumlah harus lebih dari 0')
+        except ValueError:
+            pesan.append('jumlah harus berupa angka')
+        
+        try:
+            harga_satuan = float(nilai_import(row.get('harga_satuan')) or 0)
+            if harga_satuan < 0:
+                pesan.append('harga_satuan tidak boleh negatif')
+        except ValueError:
+            pesan.append('harga_satuan harus berupa angka')
+        
+        nama_satuan = nilai_import(row.get('satuan')).lower()
+        satuan_id = satuan_map.get(nama_satuan) if nama_satuan else (bahan or {}).get('satuan_id')
+        if not satuan_id and (bahan or nama_satuan):
+            pesan.append(f"satuan '{nilai_import(row.get('satuan'))}' tidak ditemukan")
+        
+        tanggal_produksi = tanggal_import(row.get('tanggal_produksi'))
+        tanggal_kadaluarsa = tanggal_import(row.get('tanggal_kadaluarsa'))
+        if nilai_import(row.get('tanggal_produksi')) and not tanggal_produksi:
+            pesan.append('tanggal_produksi tidak valid')
+        if nilai_import(row.get('tanggal_kadaluarsa')) and not tanggal_kadaluarsa:
+            pesan.append('tanggal_kadaluarsa tidak valid')
+        
+        kondisi = nilai_import(row.get('kondisi')).lower() or 'baik'
+        if kondisi not in KONDISI_PENERIMAAN:
+            pesan.append(f"kondisi harus salah satu dari {', '.join(KONDISI_PENERIMAAN)}")
+        
+        if pesan:
+            errors.append((nomor, '; '.join(pesan)))
+            continue
+        
+        valid.append({'tanggal': tanggal, 'bahan_id': bahan['id'], 'jumlah': jumlah,
+                      'satuan_id': satuan_id, 'harga_satuan': harga_satuan,
+                      'supplier': nilai_import(row.get('supplier')),
+                      'no_batch': nilai_import(row.get('no_batch')),
+                      'tanggal_produksi': tanggal_produksi, 'tanggal_kadaluarsa': tanggal_kadaluarsa,
+                      'kondisi': kondisi, 'catatan': nilai_import(row.get('catatan'))})
+    
+    return valid, errors
+
+def simpan_import_penerimaan(cur, baris, penerima):
+    """Simpan baris penerimaan yang sudah valid (tanpa commit), kembalikan daftar nomor"""
+    nomor = alokasi_nomor(cur, 'TRM', len(baris))
+    data = [(no_penerimaan, item['tanggal'], item['bahan_id'], item['jumlah'], item['satuan_id'],
+             item['harga_satuan'], item['supplier'],
+             item['no_batch'], item['tanggal_produksi'], item['tanggal_kadaluarsa'],
+             item['kondisi'], penerima, item['catatan'])
+            for no_penerimaan, item in zip(nomor, baris)]
+    
+    batch = app.config['IMPORT_BATCH_SIZE']
+    for awal in range(0, len(data), batch):
+        cur.executemany("""
+            INSERT INTO penerimaan 
+            (no_penerimaan, tanggal, bahan_id, jumlah, satuan_id, harga_satuan,
+             supplier, no_batch, tanggal_produksi, tanggal_kadaluarsa,
+             kondisi, penerima, catatan, status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'disetujui')
+        """, data[awal:awal + batch])
+    
+    # Stok dan harga rata-rata diperbarui sekali per bahan, bukan per baris
+    tambah_stok_banyak(cur, [(item['bahan_id'], item['jumlah'], item['tanggal'], no_penerimaan)
+                             for no_penerimaan, item in zip(nomor, baris)])
+    tambah_lot_stok(cur, [(item['bahan_id'], item['jumlah'], no_penerimaan, item['no_batch'],
+                           item['tanggal_kadaluarsa'])
+                          for no_penerimaan, item in zip(nomor, baris)])
+    catat_rekap(cur, 'penerimaan', [(item['tanggal'], item['bahan_id'], '', item['jumlah']) for item in baris])
+    
+    nilai_per_bahan, jumlah_berharga = {}, {}
+    for item in baris:
+        bahan_id = item['bahan_id']
+        if item['harga_satuan'] > 0:
+            jumlah_berharga[bahan_id] = jumlah_berharga.get(bahan_id, 0) + item['jumlah']
+            nilai_per_bahan[bahan_id] = nilai_per_bahan.get(bahan_id, 0) + item['jumlah'] * item['harga_satuan']
+    
+    for bahan_id, jumlah in jumlah_berharga.items():
+        catat_harga_penerimaan(cur, bahan_id, jumlah, nilai_per_bahan[bahan_id] / jumlah)
+    
+    return nomor
+
+@app.route('/import-penerimaan', methods=['GET', 'POST'])
+def import_penerimaan():
+    if not check_role(['admin', 'gudang']):
+        flash('Akses ditolak!', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    errors = []
+    if request.method == 'POST':
+        file = request.files.get('file')
+        rows = []
+        if not file or not file.filename:
+            flash('Pilih file CSV/XLSX yang berisi data penerimaan.', 'warning')
+        else:
+            try:
+                rows = baca_file_import(file)
+                if not rows:
+                    flash('File tidak berisi data penerimaan.', 'warning')
+            except Exception as e:
+                flash(f'File tidak dapat dibaca: {str(e)}', 'danger')
+        
+        if rows:
+            cur = mysql.connection.cursor()
+            
+            # Peta lookup dibuat sekali untuk validasi seluruh baris
+            bahan_map = {row['kode_bahan'].upper(): row for row in ambil_referensi('bahan_aktif')}
+            satuan_map = {row['nama_satuan'].lower(): row['id'] for row in ambil_referensi('satuan')}
+            
+            baris, errors = validasi_import_penerimaan(rows, bahan_map, satuan_map)
+            
+            if errors:
+                flash(f'{len(errors)} dari {len(rows)} baris tidak valid, tidak ada data yang disimpan.', 'danger')
+            else:
+                try:
+                    nomor = simpan_import_penerimaan(cur, baris, session.get('nama_lengkap', ''))
+                    naikkan_versi_data(cur, 'penerimaan')
+                    mysql.connection.commit()
+                    
+                    total = sum(item['jumlah'] for item in baris)
+                    total_bulan_ini = sum(item['jumlah'] for item in baris if is_bulan_ini(item['tanggal']))
+                    perbarui_snapshot_dashboard({'total_stok': total, 'total_penerimaan': total_bulan_ini},
+                                                ['bahan_hampir_habis', 'bahan_mendekati_kadaluarsa',
+                                                 'stok_kadaluarsa', 'stok_per_kategori', 'penerimaan_per_bulan'])
+                    flash(f'{len(baris)} penerimaan ({nomor[0]} s/d {nomor[-1]}) berhasil diimport '
+                          'dan stok diperbarui!', 'success')
+                    cur.close()
+                    return redirect(url_for('penerimaan'))
+                except Exception as e:
+                    mysql.connection.rollback()
+                    flash(f'Error: {str(e)}', 'danger')
+            cur.close()
+    
+    return render_template('import_penerimaan.html',
+                         kolom=KOLOM_IMPORT_PENERIMAAN,
+                         errors=errors)
+
 # Pengeluaran Barang
 @app.route('/pengeluaran')
 def pengeluaran():
@@ -570,46 +2778,24 @@ def pengeluaran():
     
     cur = mysql.connection.cursor()
     
-    query = """
-        SELECT p.*, b.nama_bahan, b.kode_bahan, s.nama_satuan
-        FROM pengeluaran p
-        JOIN bahan b ON p.bahan_id = b.id
-        JOIN satuan s ON p.satuan_id = s.id
-        WHERE 1=1
-    """
-    params = []
-    
-    if start_date:
-        query += " AND p.tanggal >= %s"
-        params.append(start_date)
-    
-    if end_date:
-        query += " AND p.tanggal <= %s"
-        params.append(end_date)
-    
-    if status:
-        query += " AND p.status = %s"
-        params.append(status)
-    
-    if jenis_tujuan:
-        query += " AND p.jenis_tujuan = %s"
-        params.append(jenis_tujuan)
-    
-    query += " ORDER BY p.tanggal DESC"
+    per_page = get_page_size()
+    query, params = query_pengeluaran(start_date, end_date, status, jenis_tujuan,
+                                      cursor=request.args.get('cursor'), limit=per_page)
     
     cur.execute(query, params)
-    data = cur.fetchall()
+    data, next_cursor = potong_halaman(cur.fetchall(), per_page, 'tanggal')
     
-    # Konversi Decimal ke float untuk field tertentu
-    for item in data:
-        for key in ['jumlah']:
-            if item.get(key) is not None and isinstance(item[key], Decimal):
-                item[key] = float(item[key])
+    # Ringkasan dihitung dari seluruh data yang difilter, bukan hanya halaman ini
+    query, params = query_ringkasan_pengeluaran(start_date, end_date, status, jenis_tujuan)
+    cur.execute(query, params)
+    ringkasan = cur.fetchone()
     
     cur.close()
     
     return render_template('pengeluaran.html', 
                          pengeluaran=data,
+                         ringkasan=ringkasan,
+                         next_cursor=next_cursor,
                          start_date=start_date,
                          end_date=end_date,
                          status=status,
@@ -625,7 +2811,6 @@ def tambah_pengeluaran():
     cur = mysql.connection.cursor()
     
     if request.method == 'POST':
-        no_pengeluaran = request.form['no_pengeluaran']
         tanggal = request.form['tanggal']
         bahan_id = request.form['bahan_id']
         jumlah = float(request.form['jumlah'])
@@ -638,11 +2823,13 @@ def tambah_pengeluaran():
         catatan = request.form.get('catatan', '')
         
         try:
-            # Cek stok cukup
-            cur.execute("SELECT jumlah FROM stok WHERE bahan_id = %s", [bahan_id])
-            stok = cur.fetchone()
+            # Nomor pengeluaran dialokasikan saat disimpan (nomor di form hanya perkiraan)
+            no_pengeluaran = alokasi_nomor(cur, 'KLR')[0]
             
-            if not stok or float(stok['jumlah']) < float(jumlah):
+            # Kurangi stok hanya jika cukup (cek dan update dalam satu perintah);
+            # rollback juga mengembalikan nomor yang sudah dialokasikan
+            if not kurangi_stok(cur, bahan_id, jumlah, tanggal, no_pengeluaran):
+                mysql.connection.rollback()
                 flash('Stok tidak mencukupi!', 'danger')
             else:
                 # Simpan pengeluaran
@@ -653,47 +2840,206 @@ def tambah_pengeluaran():
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'dikirim')
                 """, (no_pengeluaran, tanggal, bahan_id, jumlah, satuan_id, tujuan,
                       jenis_tujuan, nama_tujuan, alamat_tujuan, penerima, catatan))
+                catat_rekap(cur, 'pengeluaran', [(tanggal, bahan_id, jenis_tujuan, jumlah)])
                 
-                # Update stok (kurangi)
-                cur.execute("""
-                    UPDATE stok 
-                    SET jumlah = jumlah - %s,
-                        last_update = CURRENT_TIMESTAMP
-                    WHERE bahan_id = %s
-                """, (jumlah, bahan_id))
-                
+                naikkan_versi_data(cur, 'pengeluaran')
                 mysql.connection.commit()
-                flash('Pengeluaran berhasil dicatat dan stok diperbarui!', 'success')
+                perbarui_snapshot_dashboard({'total_stok': -jumlah,
+                                             'total_pengeluaran': jumlah if is_bulan_ini(tanggal) else 0},
+                                            ['bahan_hampir_habis', 'bahan_mendekati_kadaluarsa', 'stok_kadaluarsa',
+                                             'stok_per_kategori', 'distribusi_per_tujuan'])
+                flash(f'Pengeluaran {no_pengeluaran} berhasil dicatat dan stok diperbarui!', 'success')
                 return redirect(url_for('pengeluaran'))
         except Exception as e:
             mysql.connection.rollback()
             flash(f'Error: {str(e)}', 'danger')
     
-    # Ambil data untuk dropdown
-    cur.execute("SELECT b.*, COALESCE(s.jumlah, 0) as stok_sekarang FROM bahan b LEFT JOIN stok s ON b.id = s.bahan_id WHERE b.status = 'aktif' ORDER BY b.nama_bahan")
-    bahan_list = cur.fetchall()
-    
-    # Konversi Decimal ke float untuk stok
-    for item in bahan_list:
-        if isinstance(item.get('stok_sekarang'), Decimal):
-            item['stok_sekarang'] = float(item['stok_sekarang'])
-    
-    cur.execute("SELECT * FROM satuan ORDER BY nama_satuan")
-    satuan_list = cur.fetchall()
-    
-    # Generate nomor pengeluaran otomatis
-    today = datetime.now().strftime('%Y%m%d')
-    cur.execute("SELECT COUNT(*) as count FROM pengeluaran WHERE DATE(created_at) = CURDATE()")
-    count = cur.fetchone()['count']
-    no_pengeluaran_otomatis = f"KLR-{today}-{count+1:03d}"
+    # Perkiraan nomor pengeluaran berikutnya (pilihan bahan dimuat lewat /api/bahan/cari)
+    no_pengeluaran_otomatis = lihat_nomor_berikutnya(cur, 'KLR')
     
     cur.close()
     
     return render_template('tambah_pengeluaran.html', 
-                         bahan_list=bahan_list,
-                         satuan_list=satuan_list,
+                         satuan_list=ambil_referensi('satuan'),
                          no_pengeluaran_otomatis=no_pengeluaran_otomatis)
 
+# Surat Jalan (pengeluaran banyak bahan untuk satu tujuan)
+# Semua baris disimpan dalam satu transaksi: stok dikurangi dengan satu UPDATE,
+# nomor dialokasikan sebagai satu blok, dan baris pengeluaran disimpan dengan
+# executemany. Jika stok salah satu bahan tidak cukup, tidak ada yang disimpan.
+KOLOM_SURAT_JALAN = ['tanggal', 'tujuan', 'jenis_tujuan', 'nama_tujuan', 'alamat_tujuan', 'penerima', 'catatan']
+
+def baca_header_surat_jalan(data):
+    """Validasi header surat jalan, mengembalikan (header, daftar error)"""
+    header, errors = {}, []
+    for kolom in KOLOM_SURAT_JALAN:
+        nilai = data.get(kolom) or ''
+        if not isinstance(nilai, str):
+            errors.append(f'{kolom} harus berupa teks')
+            nilai = ''
+        header[kolom] = nilai.strip()
+    
+    if not parse_tanggal(header['tanggal']):
+        errors.append('tanggal wajib diisi dengan format YYYY-MM-DD')
+    # tujuan dan nama_tujuan disimpan di kolom VARCHAR(200)
+    for kolom in ('tujuan', 'jenis_tujuan', 'nama_tujuan'):
+        if not header[kolom]:
+            errors.append(f'{kolom} wajib diisi')
+        elif len(header[kolom]) > 200:
+            errors.append(f'{kolom} maksimal 200 karakter')
+    if header['jenis_tujuan'] and header['jenis_tujuan'] not in LABEL_JENIS_TUJUAN:
+        errors.append(f"jenis_tujuan harus salah satu dari {', '.join(LABEL_JENIS_TUJUAN)}")
+    return header, errors
+
+def baca_baris_surat_jalan(items):
+    """Validasi baris surat jalan, mengembalikan (baris, daftar error)"""
+    baris, errors = [], []
+    for nomor, item in enumerate(items, start=1):
+        try:
+            bahan_id = int(item.get('bahan_id'))
+            jumlah = float(item.get('jumlah'))
+            satuan_id = int(item['satuan_id']) if item.get('satuan_id') else None
+        except (TypeError, ValueError):
+            errors.append(f'Baris {nomor}: bahan dan jumlah wajib diisi dengan benar')
+            continue
+        
+        if jumlah <= 0:
+            errors.append(f'Baris {nomor}: jumlah harus lebih dari 0')
+            continue
+        baris.append({'bahan_id': bahan_id, 'jumlah': jumlah, 'satuan_id': satuan_id})
+    
+    if not baris and not errors:
+        errors.append('Surat jalan minimal berisi satu bahan')
+    return baris, errors
+
+def simpan_surat_jalan(header, baris):
+    """Simpan surat jalan dan kembalikan hasil gabungan.
+    
+    Hasil berisi 'nomor' (daftar no_pengeluaran) jika berhasil, atau 'errors'
+    (mis. daftar bahan yang stoknya kurang) jika tidak ada yang disimpan.
+    """
+    jumlah_per_bahan = {}
+    for item in baris:
+        jumlah_per_bahan[item['bahan_id']] = jumlah_per_bahan.get(item['bahan_id'], 0) + item['jumlah']
+    
+    cur = mysql.connection.cursor()
+    try:
+        # Data bahan untuk validasi dan satuan default, diambil dengan satu query
+        cur.execute("""
+            SELECT id, nama_bahan, satuan_id
+            FROM bahan
+            WHERE id IN ({})
+        """.format(', '.join(['%s'] * len(jumlah_per_bahan))), list(jumlah_per_bahan))
+        bahan_map = {row['id']: row for row in cur.fetchall()}
+        
+        tidak_dikenal = [str(bahan_id) for bahan_id in jumlah_per_bahan if bahan_id not in bahan_map]
+        if tidak_dikenal:
+            return {'errors': [f"Bahan tidak ditemukan: {', '.join(tidak_dikenal)}"]}
+        
+        nomor = alokasi_nomor(cur, 'KLR', len(baris))
+        if not kurangi_stok_banyak(cur, [(item['bahan_id'], item['jumlah'], header['tanggal'], no_pengeluaran)
+                                         for no_pengeluaran, item in zip(nomor, baris)]):
+            mysql.connection.rollback()
+            return {'errors': [
+                f"Stok {bahan_map[bahan_id]['nama_bahan']} tidak mencukupi "
+                f"(tersedia {tersedia:g}, diminta {jumlah_per_bahan[bahan_id]:g})"
+                for bahan_id, tersedia in cari_stok_kurang(cur, jumlah_per_bahan).items()
+            ] or ['Stok tidak mencukupi!']}
+        
+        cur.executemany("""
+            INSERT INTO pengeluaran 
+            (no_pengeluaran, tanggal, bahan_id, jumlah, satuan_id, tujuan,
+             jenis_tujuan, nama_tujuan, alamat_tujuan, penerima, catatan, status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'dikirim')
+        """, [(no_pengeluaran, header['tanggal'], item['bahan_id'], item['jumlah'],
+               item['satuan_id'] or bahan_map[item['bahan_id']]['satuan_id'], header['tujuan'],
+               header['jenis_tujuan'], header['nama_tujuan'], header['alamat_tujuan'],
+               header['penerima'], header['catatan'])
+              for no_pengeluaran, item in zip(nomor, baris)])
+        catat_rekap(cur, 'pengeluaran', [(header['tanggal'], item['bahan_id'], header['jenis_tujuan'], item['jumlah'])
+                                         for item in baris])
+        
+        naikkan_versi_data(cur, 'pengeluaran')
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cur.close()
+    
+    total = sum(jumlah_per_bahan.values())
+    perbarui_snapshot_dashboard({'total_stok': -total,
+                                 'total_pengeluaran': total if is_bulan_ini(header['tanggal']) else 0},
+                                ['bahan_hampir_habis', 'bahan_mendekati_kadaluarsa', 'stok_kadaluarsa',
+                                 'stok_per_kategori', 'distribusi_per_tujuan'])
+    return {'nomor': nomor, 'total_baris': len(baris), 'total_jumlah': total}
+
+# Tambah Surat Jalan (form)
+@app.route('/tambah-surat-jalan', methods=['GET', 'POST'])
+def tambah_surat_jalan():
+    if not check_role(['admin', 'gudang', 'distribusi']):
+        flash('Akses ditolak!', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        header, errors_header = baca_header_surat_jalan(request.form)
+        items = [{'bahan_id': bahan_id, 'jumlah': jumlah, 'satuan_id': satuan_id}
+                 for bahan_id, jumlah, satuan_id in zip(request.form.getlist('bahan_id'),
+                                                        request.form.getlist('jumlah'),
+                                                        request.form.getlist('satuan_id'))
+                 if bahan_id or jumlah]
+        baris, errors = baca_baris_surat_jalan(items)
+        errors = errors_header + errors
+        
+        try:
+            hasil = {'errors': errors} if errors else simpan_surat_jalan(header, baris)
+        except Exception as e:
+            hasil = {'errors': [f'Error: {str(e)}']}
+        
+        if 'nomor' in hasil:
+            flash(f"Surat jalan {hasil['nomor'][0]} s/d {hasil['nomor'][-1]} "
+                  f"({hasil['total_baris']} bahan) berhasil dicatat dan stok diperbarui!", 'success')
+            return redirect(url_for('pengeluaran'))
+        for error in hasil['errors']:
+            flash(error, 'danger')
+    
+    # Pilihan bahan dimuat lewat /api/bahan/cari
+    return render_template('tambah_surat_jalan.html',
+                         satuan_list=ambil_referensi('satuan'))
+
+# API Surat Jalan (JSON)
+# Body: {tanggal, tujuan, jenis_tujuan, nama_tujuan, alamat_tujuan, penerima, catatan,
+#        items: [{bahan_id, jumlah, satuan_id (opsional, default satuan bahan)}]}
+@app.route('/api/surat-jalan', methods=['POST'])
+def api_surat_jalan():
+    if not check_role(['admin', 'gudang', 'distribusi']):
+        return jsonify({'error': 'Akses ditolak'}), 403
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body harus berupa objek JSON'}), 400
+    
+    header, errors = baca_header_surat_jalan({**data, 'tanggal': data.get('tanggal') or
+                                              datetime.now().date().isoformat()})
+    items = data.get('items')
+    if errors or not isinstance(items, list):
+        return jsonify({'error': 'Data tidak lengkap',
+                        'errors': errors + ([] if isinstance(items, list) else ['items harus berupa daftar'])}), 400
+    
+    baris, errors = baca_baris_surat_jalan(items)
+    if errors:
+        return jsonify({'error': 'Data tidak valid', 'errors': errors}), 400
+    
+    # simpan_surat_jalan sudah me-rollback transaksinya sebelum melempar error
+    try:
+        hasil = simpan_surat_jalan(header, baris)
+    except Exception as e:
+        app.logger.exception("Gagal menyimpan surat jalan: %s", e)
+        return jsonify({'error': 'Surat jalan tidak disimpan', 'errors': [f'Error: {str(e)}']}), 500
+    if 'errors' in hasil:
+        return jsonify({'error': 'Surat jalan tidak disimpan', 'errors': hasil['errors']}), 409
+    return jsonify(hasil), 201
+
 # Monitoring Kualitas
 @app.route('/monitoring')
 def monitoring():
@@ -708,39 +3054,27 @@ def monitoring():
     
     cur = mysql.connection.cursor()
     
-    query = """
-        SELECT mk.*, b.nama_bahan, b.kode_bahan
-        FROM monitoring_kualitas mk
-        JOIN bahan b ON mk.bahan_id = b.id
-        WHERE 1=1
-    """
-    params = []
-    
-    if start_date:
-        query += " AND mk.tanggal_check >= %s"
-        params.append(start_date)
-    
-    if end_date:
-        query += " AND mk.tanggal_check <= %s"
-        params.append(end_date)
-    
-    if bahan_id:
-        query += " AND mk.bahan_id = %s"
-        params.append(bahan_id)
-    
-    query += " ORDER BY mk.tanggal_check DESC"
+    per_page = get_page_size()
+    query, params = query_monitoring(start_date, end_date, bahan_id,
+                                     cursor=request.args.get('cursor'), limit=per_page)
     
     cur.execute(query, params)
-    data = cur.fetchall()
+    data, next_cursor = potong_halaman(cur.fetchall(), per_page, 'tanggal_check')
     
-    # Ambil list bahan untuk filter
-    cur.execute("SELECT * FROM bahan WHERE status = 'aktif' ORDER BY nama_bahan")
-    bahan_list = cur.fetchall()
+    # Ringkasan dihitung dari seluruh data yang difilter, bukan hanya halaman ini
+    query, params = query_ringkasan_monitoring(start_date, end_date, bahan_id)
+    cur.execute(query, params)
+    ringkasan = cur.fetchone()
     
     cur.close()
     
+    # Ambil list bahan untuk filter
+    bahan_list = ambil_referensi('bahan_aktif')
+    
     return render_template('monitoring.html', 
                          monitoring=data,
+                         ringkasan=ringkasan,
+                         next_cursor=next_cursor,
                          start_date=start_date,
                          end_date=end_date,
                          bahan_id=bahan_id,
@@ -753,9 +3087,8 @@ def tambah_monitoring():
         flash('Akses ditolak!', 'danger')
         return redirect(url_for('dashboard'))
     
-    cur = mysql.connection.cursor()
-    
     if request.method == 'POST':
+        cur = mysql.connection.cursor()
         bahan_id = request.form['bahan_id']
         tanggal_check = request.form['tanggal_check']
         suhu_gudang = float(request.form.get('suhu_gudang', 0)) if request.form.get('suhu_gudang') else None
@@ -775,24 +3108,28 @@ def tambah_monitoring():
             """, (bahan_id, tanggal_check, suhu_gudang, kelembaban_gudang,
                   kondisi_fisik, kondisi_kemasan, status_kadaluarsa, petugas, catatan))
             
+            naikkan_versi_data(cur, 'monitoring')
             mysql.connection.commit()
+            perbarui_snapshot_dashboard(sections=['monitoring_terbaru'])
+            bahan = next((item for item in ambil_referensi('bahan_aktif') if str(item['id']) == str(bahan_id)), {})
+            siarkan('monitoring', {'tanggal_check': tanggal_check, 'nama_bahan': bahan.get('nama_bahan', ''),
+                                   'kondisi_fisik': kondisi_fisik, 'status_kadaluarsa': status_kadaluarsa,
+                                   'petugas': petugas})
             flash('Monitoring kualitas berhasil dicatat!', 'success')
             return redirect(url_for('monitoring'))
         except Exception as e:
             mysql.connection.rollback()
             flash(f'Error: {str(e)}', 'danger')
+        finally:
+            cur.close()
     
-    # Ambil data untuk dropdown
-    cur.execute("SELECT * FROM bahan WHERE status = 'aktif' ORDER BY nama_bahan")
-    bahan_list = cur.fetchall()
-    
-    cur.close()
-    
+    # Ambil data untuk dropdown (dari cache referensi)
     return render_template('tambah_monitoring.html', 
-                         bahan_list=bahan_list)
+                         bahan_list=ambil_referensi('bahan_aktif'))
 
 # Laporan Stok
 @app.route('/laporan-stok')
+@baca_replika
 def laporan_stok():
     if not is_logged_in():
         flash('Akses ditolak!', 'danger')
@@ -804,57 +3141,18 @@ def laporan_stok():
     
     cur = mysql.connection.cursor()
     
-    query = """
-        SELECT b.*, kb.nama_kategori, s.nama_satuan, COALESCE(st.jumlah, 0) as stok_sekarang,
-               CASE 
-                   WHEN COALESCE(st.jumlah, 0) <= b.stok_minimum THEN 'kritis'
-                   WHEN COALESCE(st.jumlah, 0) <= b.stok_minimum * 1.5 THEN 'rendah'
-                   ELSE 'aman'
-               END as status_stok
-        FROM bahan b
-        LEFT JOIN kategori_bahan kb ON b.kategori_id = kb.id
-        LEFT JOIN satuan s ON b.satuan_id = s.id
-        LEFT JOIN stok st ON b.id = st.bahan_id
-        WHERE b.status = 'aktif'
-    """
-    params = []
-    
-    if kategori_id:
-        query += " AND b.kategori_id = %s"
-        params.append(kategori_id)
-    
-    if stok_minimum == 'ya':
-        query += " AND COALESCE(st.jumlah, 0) <= b.stok_minimum"
-    
-    query += " ORDER BY status_stok, b.nama_bahan"
+    query, params = query_laporan_stok(kategori_id, stok_minimum)
     
     cur.execute(query, params)
     data = cur.fetchall()
     
-    # Konversi Decimal ke float untuk field tertentu
-    for item in data:
-        for key in ['stok_sekarang', 'stok_minimum', 'stok_maksimum']:
-            if item.get(key) is not None and isinstance(item[key], Decimal):
-                item[key] = float(item[key])
+    # Hitung total nilai stok (harga rata-rata tertimbang x stok)
+    total_nilai = sum(item['nilai_stok'] for item in data)
     
-    # Hitung total nilai stok
-    total_nilai = 0
-    for item in data:
-        # Ambil harga rata-rata dari penerimaan
-        cur.execute("""
-            SELECT AVG(harga_satuan) as harga_rata 
-            FROM penerimaan 
-            WHERE bahan_id = %s AND harga_satuan > 0
-        """, [item['id']])
-        harga = cur.fetchone()
-        if harga and harga['harga_rata']:
-            total_nilai += float(harga['harga_rata']) * float(item['stok_sekarang'] if item['stok_sekarang'] else 0)
+    cur.close()
     
     # Ambil list kategori untuk filter
-    cur.execute("SELECT * FROM kategori_bahan ORDER BY nama_kategori")
-    kategori_list = cur.fetchall()
-    
-    cur.close()
+    kategori_list = ambil_referensi('kategori')
     
     return render_template('laporan_stok.html', 
                          stok=data,
@@ -863,8 +3161,88 @@ def laporan_stok():
                          kategori_list=kategori_list,
                          total_nilai=total_nilai)
 
+# Kartu Stok (mutasi per bahan dengan saldo berjalan)
+@app.route('/kartu-stok')
+@baca_replika
+def kartu_stok():
+    if not is_logged_in():
+        flash('Akses ditolak!', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    # Filter (default: bulan berjalan)
+    awal_bulan, akhir_bulan = rentang_bulan()
+    bahan_id = request.args.get('bahan_id', '')
+    mulai = awal_bulan
+    selesai = akhir_bulan - timedelta(days=1)
+    start_arg = request.args.get('start_date', '')
+    end_arg = request.args.get('end_date', '')
+    if start_arg or end_arg:
+        mulai_arg = parse_tanggal(start_arg) if start_arg else mulai
+        selesai_arg = parse_tanggal(end_arg) if end_arg else selesai
+        if mulai_arg and selesai_arg and mulai_arg <= selesai_arg:
+            mulai, selesai = mulai_arg, selesai_arg
+        else:
+            flash('Rentang tanggal tidak valid, menampilkan bulan berjalan', 'warning')
+    start_date, end_date = mulai.isoformat(), selesai.isoformat()
+    
+    bahan, mutasi, saldo_awal = None, [], 0
+    if bahan_id:
+        cur = mysql.connection.cursor()
+        cur.execute("""
+            SELECT b.id, b.kode_bahan, b.nama_bahan, sat.nama_satuan
+            FROM bahan b
+            LEFT JOIN satuan sat ON b.satuan_id = sat.id
+            WHERE b.id = %s
+        """, (bahan_id,))
+        bahan = cur.fetchone()
+        
+        if bahan:
+            # Saldo awal = stok pada akhir hari sebelum periode
+            saldo_awal = stok_pada_tanggal(cur, bahan_id, mulai - timedelta(days=1))
+            
+            cur.execute("""
+                SELECT tanggal, jenis, jumlah, referensi
+                FROM mutasi_stok
+                WHERE bahan_id = %s AND tanggal BETWEEN %s AND %s
+                ORDER BY tanggal, id
+            """, (bahan_id, mulai, selesai))
+            mutasi = cur.fetchall()
+            
+            saldo = saldo_awal
+            for item in mutasi:
+                saldo += item['jumlah']
+                item['saldo'] = saldo
+        cur.close()
+    
+    return render_template('kartu_stok.html',
+                         bahan=bahan,
+                         mutasi=mutasi,
+                         saldo_awal=saldo_awal,
+                         bahan_id=bahan_id,
+                         start_date=start_date,
+                         end_date=end_date,
+                         bahan_list=ambil_referensi('bahan_aktif'))
+
+# API stok pada tanggal tertentu
+@app.route('/api/stok-pada-tanggal/<int:bahan_id>')
+@baca_replika
+def api_stok_pada_tanggal(bahan_id):
+    if not is_logged_in():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    tanggal = parse_tanggal(request.args.get('tanggal'))
+    if not tanggal:
+        return jsonify({'error': 'Parameter tanggal wajib (YYYY-MM-DD)'}), 400
+    
+    cur = mysql.connection.cursor()
+    saldo = stok_pada_tanggal(cur, bahan_id, tanggal)
+    cur.close()
+    
+    return jsonify({'bahan_id': bahan_id, 'tanggal': tanggal.isoformat(), 'saldo': saldo})
+
 # Laporan Distribusi
 @app.route('/laporan-distribusi')
+@baca_replika
 def laporan_distribusi():
     if not is_logged_in():
         flash('Akses ditolak!', 'danger')
@@ -877,82 +3255,38 @@ def laporan_distribusi():
     
     cur = mysql.connection.cursor()
     
-    query = """
-        SELECT p.*, b.nama_bahan, b.kode_bahan, s.nama_satuan,
-               CASE p.jenis_tujuan
-                   WHEN 'sekolah' THEN 'Sekolah'
-                   WHEN 'posyandu' THEN 'Posyandu'
-                   WHEN 'puskesmas' THEN 'Puskesmas'
-                   WHEN 'rumah_sakit' THEN 'Rumah Sakit'
-                   ELSE 'Lainnya'
-               END as nama_jenis_tujuan
-        FROM pengeluaran p
-        JOIN bahan b ON p.bahan_id = b.id
-        JOIN satuan s ON p.satuan_id = s.id
-        WHERE p.status != 'draft'
-    """
-    params = []
-    
-    if start_date:
-        query += " AND p.tanggal >= %s"
-        params.append(start_date)
-    
-    if end_date:
-        query += " AND p.tanggal <= %s"
-        params.append(end_date)
-    
-    if jenis_tujuan:
-        query += " AND p.jenis_tujuan = %s"
-        params.append(jenis_tujuan)
-    
-    query += " ORDER BY p.tanggal DESC"
+    per_page = get_page_size()
+    query, params = query_distribusi(KOLOM_DISTRIBUSI_LAPORAN, start_date, end_date, jenis_tujuan,
+                                     cursor=request.args.get('cursor'), limit=per_page)
     
     cur.execute(query, params)
-    data = cur.fetchall()
-    
-    # Konversi Decimal ke float untuk field tertentu
-    for item in data:
-        for key in ['jumlah']:
-            if item.get(key) is not None and isinstance(item[key], Decimal):
-                item[key] = float(item[key])
+    data, next_cursor = potong_halaman(cur.fetchall(), per_page, 'tanggal')
     
-    # Hitung total distribusi
-    total_jumlah = sum(float(item['jumlah']) for item in data) if data else 0
+    # Hitung total distribusi dengan query agregat (seluruh data yang difilter)
+    query, params = query_ringkasan_distribusi(start_date, end_date, jenis_tujuan)
+    cur.execute(query, params)
+    ringkasan = cur.fetchone()
+    total_jumlah = float(ringkasan['total_jumlah'])
     
-    # Hitung distribusi per tujuan
-    cur.execute("""
-        SELECT jenis_tujuan, COUNT(*) as jumlah_transaksi, SUM(jumlah) as total_jumlah
-        FROM pengeluaran
-        WHERE status != 'draft'
-        GROUP BY jenis_tujuan
-    """)
+    # Hitung distribusi per tujuan (periode yang difilter)
+    query, params = query_distribusi_per_tujuan(start_date, end_date)
+    cur.execute(query, params)
     distribusi_per_tujuan = cur.fetchall()
     
-    # Konversi Decimal ke float untuk distribusi_per_tujuan
-    for item in distribusi_per_tujuan:
-        if isinstance(item.get('total_jumlah'), Decimal):
-            item['total_jumlah'] = float(item['total_jumlah'])
-    
     cur.close()
     
     return render_template('laporan_distribusi.html', 
                          distribusi=data,
+                         ringkasan=ringkasan,
+                         next_cursor=next_cursor,
                          start_date=start_date,
                          end_date=end_date,
                          jenis_tujuan=jenis_tujuan,
                          total_jumlah=total_jumlah,
                          distribusi_per_tujuan=distribusi_per_tujuan)
 
-# Export Laporan Stok ke PDF
-@app.route('/export-stok-pdf')
-def export_stok_pdf():
-    if not is_logged_in():
-        return redirect(url_for('login'))
-    
-    # Filter
-    kategori_id = request.args.get('kategori_id', '')
-    stok_minimum = request.args.get('stok_minimum', '')
-    
+# Buat PDF laporan stok ke file/buffer (dipakai route export dan export job)
+def buat_pdf_stok(buffer, kategori_id='', stok_minimum=''):
     cur = mysql.connection.cursor()
     
     query = """
@@ -983,15 +3317,6 @@ def export_stok_pdf():
     cur.execute(query, params)
     data = cur.fetchall()
     
-    # Konversi Decimal ke float untuk field tertentu
-    for item in data:
-        for key in ['stok_sekarang', 'stok_minimum']:
-            if item.get(key) is not None and isinstance(item[key], Decimal):
-                item[key] = float(item[key])
-    
-    # Buat buffer untuk PDF
-    buffer = io.BytesIO()
-    
     # Buat dokumen PDF
     doc = SimpleDocTemplate(buffer, pagesize=landscape(A4))
     
@@ -1014,8 +3339,7 @@ def export_stok_pdf():
     # Info filter
     filter_text = "Tanggal: " + datetime.now().strftime("%d-%m-%Y")
     if kategori_id:
-        cur.execute("SELECT nama_kategori FROM kategori_bahan WHERE id = %s", [kategori_id])
-        kategori = cur.fetchone()
+        kategori = next((row for row in ambil_referensi('kategori') if str(row['id']) == str(kategori_id)), None)
         if kategori:
             filter_text += f" | Kategori: {kategori['nama_kategori']}"
     
@@ -1101,6 +3425,22 @@ def export_stok_pdf():
     
     # Build PDF
     doc.build(elements)
+    cur.close()
+
+# Export Laporan Stok ke PDF
+@app.route('/export-stok-pdf')
+@baca_replika
+def export_stok_pdf():
+    if not is_logged_in():
+        return redirect(url_for('login'))
+    
+    # Filter
+    kategori_id = request.args.get('kategori_id', '')
+    stok_minimum = request.args.get('stok_minimum', '')
+    
+    # Buat buffer untuk PDF
+    buffer = io.BytesIO()
+    buat_pdf_stok(buffer, kategori_id, stok_minimum)
     buffer.seek(0)
     
     # Buat nama file
@@ -1113,64 +3453,9 @@ def export_stok_pdf():
         mimetype='application/pdf'
     )
 
-# Export Laporan Distribusi ke Excel
-@app.route('/export-distribusi-excel')
-def export_distribusi_excel():
-    if not is_logged_in():
-        return redirect(url_for('login'))
-    
-    # Filter
-    start_date = request.args.get('start_date', '')
-    end_date = request.args.get('end_date', '')
-    jenis_tujuan = request.args.get('jenis_tujuan', '')
-    
-    cur = mysql.connection.cursor()
-    
-    query = """
-        SELECT p.tanggal, p.no_pengeluaran, b.kode_bahan, b.nama_bahan,
-               p.jumlah, s.nama_satuan, p.jenis_tujuan, p.nama_tujuan,
-               p.alamat_tujuan, p.penerima, p.catatan, p.status
-        FROM pengeluaran p
-        JOIN bahan b ON p.bahan_id = b.id
-        JOIN satuan s ON p.satuan_id = s.id
-        WHERE p.status != 'draft'
-    """
-    params = []
-    
-    if start_date:
-        query += " AND p.tanggal >= %s"
-        params.append(start_date)
-    
-    if end_date:
-        query += " AND p.tanggal <= %s"
-        params.append(end_date)
-    
-    if jenis_tujuan:
-        query += " AND p.jenis_tujuan = %s"
-        params.append(jenis_tujuan)
-    
-    query += " ORDER BY p.tanggal DESC"
-    
-    cur.execute(query, params)
-    data = cur.fetchall()
-    
-    # Konversi Decimal ke float untuk field tertentu
-    for item in data:
-        for key in ['jumlah']:
-            if item.get(key) is not None and isinstance(item[key], Decimal):
-                item[key] = float(item[key])
-    
-    # Buat workbook Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Laporan Distribusi"
-    
-    # Header styles
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="2c3e50", end_color="2c3e50", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Border
+# Named style untuk export Excel. Style didaftarkan sekali di workbook dan dipakai
+# bersama oleh semua sel, bukan membuat objek Font/Border baru untuk setiap sel
+def gaya_excel_distribusi():
     thin_border = Border(
         left=Side(style='thin'),
         right=Side(style='thin'),
@@ -1178,11 +3463,55 @@ def export_distribusi_excel():
         bottom=Side(style='thin')
     )
     
+    return [
+        NamedStyle(name='judul', font=Font(bold=True, size=14),
+                   alignment=Alignment(horizontal="center")),
+        NamedStyle(name='keterangan', font=Font(italic=True, size=10),
+                   alignment=Alignment(horizontal="center")),
+        NamedStyle(name='header', font=Font(bold=True, color="FFFFFF", size=12),
+                   fill=PatternFill(start_color="2c3e50", end_color="2c3e50", fill_type="solid"),
+                   alignment=Alignment(horizontal="center", vertical="center"),
+                   border=thin_border),
+        NamedStyle(name='sel', border=thin_border),
+        NamedStyle(name='total', font=Font(bold=True)),
+        NamedStyle(name='footer', font=Font(size=9, italic=True)),
+    ]
+
+# Kirim isi file per potongan (chunked response), file ditutup setelah selesai
+def stream_file(file, chunk_size):
+    try:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+# Buat Excel laporan distribusi ke file (dipakai route export dan export job)
+# Baris dibaca dengan server-side cursor dan langsung ditulis ke worksheet
+# write-only openpyxl, jadi memori tidak bertambah seiring jumlah baris. Ini bukan
+# streaming: file .xlsx (zip) baru bisa dikirim setelah wb.save() selesai
+def buat_excel_distribusi(file, start_date='', end_date='', jenis_tujuan=''):
+    # Buat workbook Excel (write-only)
+    wb = Workbook(write_only=True)
+    for style in gaya_excel_distribusi():
+        wb.add_named_style(style)
+    ws = wb.create_sheet("Laporan Distribusi")
+    
+    # Set lebar kolom (harus sebelum baris pertama ditulis)
+    column_widths = [5, 12, 18, 12, 25, 10, 8, 12, 20, 15, 10]
+    for i, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    
+    def sel(value, style='sel'):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+    
     # Judul
-    ws.merge_cells('A1:L1')
-    ws['A1'] = "LAPORAN DISTRIBUSI BAHAN SPPG - PROGRAM MBG"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A1'].alignment = Alignment(horizontal="center")
+    ws.merged_cells.add('A1:L1')
+    ws.append([sel("LAPORAN DISTRIBUSI BAHAN SPPG - PROGRAM MBG", 'judul')])
     
     # Filter info
     filter_text = ""
@@ -1191,87 +3520,471 @@ def export_distribusi_excel():
         if end_date:
             filter_text += f" s/d {end_date}"
     
-    ws.merge_cells('A2:L2')
-    ws['A2'] = filter_text if filter_text else "Semua Data"
-    ws['A2'].font = Font(italic=True, size=10)
-    ws['A2'].alignment = Alignment(horizontal="center")
+    ws.merged_cells.add('A2:L2')
+    ws.append([sel(filter_text if filter_text else "Semua Data", 'keterangan')])
+    ws.append([])
     
     # Header tabel
     headers = ['No', 'Tanggal', 'No Pengeluaran', 'Kode Bahan', 'Nama Bahan',
                'Jumlah', 'Satuan', 'Jenis Tujuan', 'Nama Tujuan', 'Penerima', 'Status']
+    ws.append([sel(header, 'header') for header in headers])
+    
+    # Map status
+    status_map = {
+        'draft': 'Draft',
+        'dikirim': 'Dikirim',
+        'diterima': 'Diterima'
+    }
+    
+    # Map jenis tujuan
+    jenis_map = {
+        'sekolah': 'Sekolah',
+        'posyandu': 'Posyandu',
+        'puskesmas': 'Puskesmas',
+        'rumah_sakit': 'Rumah Sakit',
+        'lainnya': 'Lainnya'
+    }
+    
+    # Isi data langsung dari server-side cursor
+    query, params = query_distribusi(KOLOM_DISTRIBUSI_EXPORT, start_date, end_date, jenis_tujuan)
+    
+    cur = mysql.connection.cursor(MySQLdb.cursors.SSCursor)
+    cur.execute(query, params)
     
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thin_border
+    jumlah_baris = 0
+    total_jumlah = 0
+    for item in iter_baris_tuple(cur, 'BarisDistribusi'):
+        jumlah_baris += 1
+        total_jumlah += item.jumlah or 0
+        ws.append([
+            sel(jumlah_baris),
+            sel(str(item.tanggal)),
+            sel(item.no_pengeluaran),
+            sel(item.kode_bahan),
+            sel(item.nama_bahan),
+            sel(item.jumlah),
+            sel(item.nama_satuan),
+            sel(jenis_map.get(item.jenis_tujuan, item.jenis_tujuan)),
+            sel(item.nama_tujuan),
+            sel(item.penerima),
+            sel(status_map.get(item.status, item.status)),
+        ])
     
-    # Isi data
-    for i, item in enumerate(data, 1):
-        row_num = i + 4
-        
-        # Map status
-        status_map = {
-            'draft': 'Draft',
-            'dikirim': 'Dikirim',
-            'diterima': 'Diterima'
-        }
-        
-        # Map jenis tujuan
-        jenis_map = {
-            'sekolah': 'Sekolah',
-            'posyandu': 'Posyandu',
-            'puskesmas': 'Puskesmas',
-            'rumah_sakit': 'Rumah Sakit',
-            'lainnya': 'Lainnya'
-        }
-        
-        ws.cell(row=row_num, column=1, value=i).border = thin_border
-        ws.cell(row=row_num, column=2, value=str(item['tanggal'])).border = thin_border
-        ws.cell(row=row_num, column=3, value=item['no_pengeluaran']).border = thin_border
-        ws.cell(row=row_num, column=4, value=item['kode_bahan']).border = thin_border
-        ws.cell(row=row_num, column=5, value=item['nama_bahan']).border = thin_border
-        ws.cell(row=row_num, column=6, value=item['jumlah']).border = thin_border
-        ws.cell(row=row_num, column=7, value=item['nama_satuan']).border = thin_border
-        ws.cell(row=row_num, column=8, value=jenis_map.get(item['jenis_tujuan'], item['jenis_tujuan'])).border = thin_border
-        ws.cell(row=row_num, column=9, value=item['nama_tujuan']).border = thin_border
-        ws.cell(row=row_num, column=10, value=item['penerima']).border = thin_border
-        ws.cell(row=row_num, column=11, value=status_map.get(item['status'], item['status'])).border = thin_border
+    cur.close()
     
     # Summary
-    summary_row = len(data) + 6
-    ws.merge_cells(f'A{summary_row}:E{summary_row}')
-    ws.cell(row=summary_row, column=1, value="TOTAL DISTRIBUSI:").font = Font(bold=True)
-    ws.cell(row=summary_row, column=6, value=sum(item['jumlah'] for item in data)).font = Font(bold=True)
-    
-    # Set lebar kolom
-    column_widths = [5, 12, 18, 12, 25, 10, 8, 12, 20, 15, 10]
-    for i, width in enumerate(column_widths, 1):
-        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.append([])
+    summary_row = jumlah_baris + 6
+    ws.merged_cells.add(f'A{summary_row}:E{summary_row}')
+    ws.append([sel("TOTAL DISTRIBUSI:", 'total'), None, None, None, None, sel(total_jumlah, 'total')])
     
     # Footer
     current_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-    footer_row = len(data) + 8
-    ws.cell(row=footer_row, column=1, value=f"Dicetak pada: {current_time}")
-    ws.cell(row=footer_row, column=1).font = Font(size=9, italic=True)
+    ws.append([])
+    ws.append([sel(f"Dicetak pada: {current_time}", 'footer')])
     
-    # Simpan ke buffer
-    buffer = io.BytesIO()
-    wb.save(buffer)
+    wb.save(file)
+
+# Export Laporan Distribusi ke Excel
+@app.route('/export-distribusi-excel')
+@baca_replika
+def export_distribusi_excel():
+    if not is_logged_in():
+        return redirect(url_for('login'))
+    
+    # Filter
+    start_date = request.args.get('start_date', '')
+    end_date = request.args.get('end_date', '')
+    jenis_tujuan = request.args.get('jenis_tujuan', '')
+    
+    # Workbook dibuat utuh di file sementara (bukan di memori) sebelum byte pertama
+    # dikirim; stream_file hanya membaca file yang sudah jadi per potongan
+    buffer = tempfile.TemporaryFile()
+    buat_excel_distribusi(buffer, start_date, end_date, jenis_tujuan)
     buffer.seek(0)
     
     # Buat nama file
     filename = f"laporan_distribusi_sppg_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
     
+    return Response(
+        stream_file(buffer, app.config['EXPORT_CHUNK_SIZE']),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# Export Job (latar belakang)
+# Export PDF/Excel dijalankan di thread pool, bukan di thread request. Hasilnya
+# disimpan di EXPORT_CACHE_DIR dengan nama dari hash (jenis, filter, versi data),
+# sehingga export identik berikutnya langsung diambil dari cache. Job ID sama
+# dengan kunci cache, jadi hasil yang sudah selesai bisa diunduh dari worker mana pun.
+EXPORT_JOBS = {
+    'stok_pdf': {
+        'build': buat_pdf_stok,
+        'filters': ['kategori_id', 'stok_minimum'],
+        'versi': ['bahan', 'penerimaan', 'pengeluaran'],
+        'prefix': 'laporan_stok_sppg',
+        'ekstensi': 'pdf',
+        'mimetype': 'application/pdf',
+    },
+    'distribusi_excel': {
+        'build': buat_excel_distribusi,
+        'filters': ['start_date', 'end_date', 'jenis_tujuan'],
+        'versi': ['bahan', 'pengeluaran'],
+        'prefix': 'laporan_distribusi_sppg',
+        'ekstensi': 'xlsx',
+        'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    },
+}
+
+EXPORT_JOB_ID_PATTERN = re.compile(r'^([a-z_]+)-([0-9a-f]{20})$')
+
+_export_jobs = {}
+_export_jobs_lock = threading.Lock()
+_export_executor = None
+
+def get_export_executor():
+    global _export_executor
+    with _export_jobs_lock:
+        if _export_executor is None:
+            _export_executor = ThreadPoolExecutor(max_workers=app.config['EXPORT_WORKERS'],
+                                                  thread_name_prefix='export')
+        return _export_executor
+
+def kunci_export_job(jenis, filters, versi):
+    """Job ID = jenis + hash filter dan versi data"""
+    kunci = json.dumps({'filters': filters, 'versi': versi}, sort_keys=True)
+    return f"{jenis}-{hashlib.sha1(kunci.encode('utf-8')).hexdigest()[:20]}"
+
+def path_export_job(job_id):
+    """Path file hasil export di cache, None jika job ID tidak valid"""
+    match = EXPORT_JOB_ID_PATTERN.match(job_id)
+    if not match or match.group(1) not in EXPORT_JOBS:
+        return None
+    ekstensi = EXPORT_JOBS[match.group(1)]['ekstensi']
+    return os.path.join(app.config['EXPORT_CACHE_DIR'], f"{job_id}.{ekstensi}")
+
+def bersihkan_export_cache():
+    """Hapus hasil export dan catatan job selesai/gagal yang lebih tua dari EXPORT_CACHE_MAX_AGE"""
+    batas = time.time() - app.config['EXPORT_CACHE_MAX_AGE']
+    for filename in os.listdir(app.config['EXPORT_CACHE_DIR']):
+        path = os.path.join(app.config['EXPORT_CACHE_DIR'], filename)
+        try:
+            if os.path.getmtime(path) < batas:
+                os.remove(path)
+        except OSError:
+            pass
+    
+    with _export_jobs_lock:
+        for job_id in [job_id for job_id, job in _export_jobs.items()
+                       if job['status'] in ('selesai', 'gagal') and job['selesai_at'] < batas]:
+            del _export_jobs[job_id]
+
+def _jalankan_export_job(job_id, jenis, filters, versi):
+    path = path_export_job(job_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    
+    with _export_jobs_lock:
+        _export_jobs[job_id]['status'] = 'berjalan'
+    
+    # Koneksi database di thread ini dibuka oleh app context sendiri. Seperti route
+    # @baca_replika, builder membaca dari replika (jatuh ke primary jika replika tidak
+    # sehat/lag), tetapi hanya jika replika sudah memuat versi data yang menjadi kunci
+    # cache; jika belum, file lama akan tersimpan dengan kunci versi baru.
+    with app.app_context():
+        try:
+            g.pakai_replika = True
+            cur = mysql.connection.cursor()
+            versi_replika = ambil_versi_data(cur, list(versi))
+            cur.close()
+            if any(versi_replika.get(nama, 0) < nilai for nama, nilai in versi.items()):
+                g.pakai_replika = False
+            
+            with open(tmp_path, 'wb') as file:
+                EXPORT_JOBS[jenis]['build'](file, **filters)
+            os.replace(tmp_path, path)
+            hasil = {'status': 'selesai'}
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            hasil = {'status': 'gagal', 'error': str(e)}
+    
+    with _export_jobs_lock:
+        _export_jobs[job_id].update(hasil, selesai_at=time.time())
+
+def status_export_job(job_id):
+    """Status job sebagai dict, None jika job tidak dikenal"""
+    path = path_export_job(job_id)
+    if not path:
+        return None
+    
+    if os.path.exists(path):
+        return {
+            'job_id': job_id,
+            'status': 'selesai',
+            'download_url': url_for('download_export_job', job_id=job_id)
+        }
+    
+    with _export_jobs_lock:
+        job = _export_jobs.get(job_id)
+        if job and job['status'] == 'selesai':
+            # File hasil sudah dihapus (kadaluarsa cache atau dibersihkan worker lain)
+            del _export_jobs[job_id]
+            job = None
+        if not job:
+            return None
+        hasil = {'job_id': job_id, 'status': job['status']}
+        if job.get('error'):
+            hasil['error'] = job['error']
+    
+    hasil['status_url'] = url_for('export_job_status', job_id=job_id)
+    return hasil
+
+# Kirim job export
+@app.route('/export-jobs', methods=['POST'])
+def submit_export_job():
+    data = request.get_json(silent=True) or request.form
+    jenis = data.get('jenis', '')
+    
+    if jenis not in EXPORT_JOBS:
+        return jsonify({'error': 'Jenis export tidak dikenal'}), 400
+    
+    spec = EXPORT_JOBS[jenis]
+    filters = {key: str(data.get(key) or '') for key in spec['filters']}
+    
+    cur = mysql.connection.cursor()
+    versi = ambil_versi_data(cur, spec['versi'])
     cur.close()
     
+    job_id = kunci_export_job(jenis, filters, versi)
+    
+    os.makedirs(app.config['EXPORT_CACHE_DIR'], exist_ok=True)
+    bersihkan_export_cache()
+    
+    # Hasil sudah ada di cache atau job yang sama sedang berjalan: tidak perlu job baru.
+    # Job selesai yang filenya sudah hilang dijalankan ulang.
+    if not os.path.exists(path_export_job(job_id)):
+        with _export_jobs_lock:
+            job = _export_jobs.get(job_id)
+            jalankan = not job or job['status'] in ('selesai', 'gagal')
+            if jalankan:
+                _export_jobs[job_id] = {'status': 'menunggu', 'created_at': time.time()}
+        
+        if jalankan:
+            get_export_executor().submit(_jalankan_export_job, job_id, jenis, filters, versi)
+    
+    hasil = status_export_job(job_id)
+    return jsonify(hasil), 200 if hasil['status'] == 'selesai' else 202
+
+# Status job export
+@app.route('/export-jobs/<job_id>')
+def export_job_status(job_id):
+    hasil = status_export_job(job_id)
+    if not hasil:
+        return jsonify({'error': 'Job export tidak ditemukan'}), 404
+    
+    return jsonify(hasil)
+
+# Download hasil job export
+@app.route('/export-jobs/<job_id>/download')
+def download_export_job(job_id):
+    path = path_export_job(job_id)
+    if not path or not os.path.exists(path):
+        return jsonify({'error': 'Hasil export belum tersedia'}), 404
+    
+    spec = EXPORT_JOBS[EXPORT_JOB_ID_PATTERN.match(job_id).group(1)]
+    waktu = datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y%m%d_%H%M%S')
+    
     return send_file(
-        buffer,
+        path,
         as_attachment=True,
-        download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        download_name=f"{spec['prefix']}_{waktu}.{spec['ekstensi']}",
+        mimetype=spec['mimetype']
+    )
+
+# Export CSV / NDJSON (streaming) untuk feed data warehouse
+# Baris dibaca dengan server-side cursor dan dikirim per batch EXPORT_BATCH_SIZE,
+# sehingga byte pertama langsung terkirim dan memori tidak bergantung jumlah baris
+EXPORT_STREAMING = {
+    'penerimaan': (['admin', 'gudang'],
+                   lambda args: query_penerimaan(args.get('start_date', ''),
+                                                 args.get('end_date', ''),
+                                                 args.get('status', ''))),
+    'pengeluaran': (['admin', 'gudang', 'distribusi'],
+                    lambda args: query_pengeluaran(args.get('start_date', ''),
+                                                   args.get('end_date', ''),
+                                                   args.get('status', ''),
+                                                   args.get('jenis_tujuan', ''))),
+    'monitoring': (None,
+                   lambda args: query_monitoring(args.get('start_date', ''),
+                                                 args.get('end_date', ''),
+                                                 args.get('bahan_id', ''))),
+    'stok': (None,
+             lambda args: query_laporan_stok(args.get('kategori_id', ''),
+                                             args.get('stok_minimum', ''))),
+}
+
+EXPORT_MIMETYPE = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def stream_query(query, params, ekstensi):
+    """Generator isi file CSV/NDJSON dari hasil query, satu potongan per batch"""
+    # Baris dibaca sebagai tuple (tanpa dict per baris), nama kolom dari cursor.description
+    cur = mysql.connection.cursor(MySQLdb.cursors.SSCursor)
+    try:
+        cur.execute(query, params)
+        batch_size = app.config['EXPORT_BATCH_SIZE']
+        buffer = io.StringIO()
+        kolom = kolom_cursor(cur)
+        writer = None
+        
+        if ekstensi == 'csv':
+            writer = csv.writer(buffer)
+            writer.writerow(kolom)
+        
+        rows = cur.fetchmany(batch_size)
+        while rows:
+            if writer:
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(zip(kolom, row)), default=json_default) + '\n')
+            
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            rows = cur.fetchmany(batch_size)
+        
+        # Header CSV tetap dikirim walaupun hasilnya kosong
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        cur.close()
+
+@app.route('/export/<jenis>.<ekstensi>')
+@baca_replika
+def export_streaming(jenis, ekstensi):
+    if jenis not in EXPORT_STREAMING or ekstensi not in EXPORT_MIMETYPE:
+        return jsonify({'error': 'Export tidak dikenal'}), 404
+    
+    roles, build_query = EXPORT_STREAMING[jenis]
+    if roles and not check_role(roles):
+        flash('Akses ditolak!', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    query, params = build_query(request.args)
+    
+    filename = f"{jenis}_sppg_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ekstensi}"
+    
+    return Response(
+        stream_with_context(stream_query(query, params, ekstensi)),
+        mimetype=EXPORT_MIMETYPE[ekstensi],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
+# Status pool koneksi database (untuk menyesuaikan jumlah worker dengan max_connections MySQL)
+@app.route('/api/pool-status')
+def api_pool_status():
+    if not check_role(['admin']):
+        return jsonify({'error': 'Akses ditolak'}), 403
+    
+    return jsonify({**mysql.statistik(), 'replika': mysql_replika.statistik()})
+
+# Metrik Prometheus; akses lewat token Bearer (METRICS_TOKEN) atau sesi admin.
+# Alamat asal tidak dipercaya karena di belakang reverse proxy semua request terlihat dari localhost.
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    diizinkan = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not diizinkan and not check_role(['admin']):
+        return Response('Akses ditolak\n', status=403, mimetype='text/plain')
+    
+    return Response(format_metrik_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# Temuan profiler SQL (N+1 dan query lambat) per request, terbaru di atas
+@app.route('/admin/profil-sql')
+def profil_sql():
+    if not check_role(['admin']):
+        flash('Akses ditolak!', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    with _profil_sql_lock:
+        laporan = list(_profil_sql)
+    return render_template('profil_sql.html', laporan=laporan, aktif=app.config['SQL_PROFILER'],
+                           batas_ulang=app.config['SQL_PROFILER_N_PLUS_1'],
+                           batas_lambat=app.config['SQL_PROFILER_SLOW_MS'])
+
+@app.route('/api/profil-sql')
+def api_profil_sql():
+    if not check_role(['admin']):
+        return jsonify({'error': 'Akses ditolak'}), 403
+    
+    with _profil_sql_lock:
+        laporan = list(_profil_sql)
+    return Response(json.dumps({'aktif': app.config['SQL_PROFILER'], 'laporan': laporan}, default=json_default),
+                    mimetype='application/json')
+
+@app.route('/api/profil-sql', methods=['DELETE'])
+def hapus_profil_sql():
+    if not check_role(['admin']):
+        return jsonify({'error': 'Akses ditolak'}), 403
+    
+    with _profil_sql_lock:
+        _profil_sql.clear()
+    return jsonify({'success': True})
+
+# Snapshot saldo stok untuk kartu stok: jalankan tiap awal bulan (mis. lewat cron)
+#   flask --app app snapshot-stok               -> akhir bulan lalu
+#   flask --app app snapshot-stok --semua       -> semua akhir bulan sejak mutasi pertama
+@app.cli.command('snapshot-stok')
+@click.option('--tanggal', help='Tanggal snapshot (YYYY-MM-DD), default akhir bulan lalu')
+@click.option('--semua', is_flag=True, help='Buat snapshot untuk setiap akhir bulan sejak mutasi pertama')
+def snapshot_stok_command(tanggal, semua):
+    """Simpan saldo stok semua bahan ke tabel snapshot_stok"""
+    akhir_bulan_lalu = rentang_bulan()[0] - timedelta(days=1)
+    daftar_tanggal = [datetime.strptime(tanggal, '%Y-%m-%d').date() if tanggal else akhir_bulan_lalu]
+    
+    cur = mysql.connection.cursor()
+    if semua:
+        cur.execute("SELECT MIN(tanggal) as awal FROM mutasi_stok")
+        awal = cur.fetchone()['awal']
+        daftar_tanggal = []
+        while awal and awal <= akhir_bulan_lalu:
+            akhir = rentang_bulan(awal)[1] - timedelta(days=1)
+            daftar_tanggal.append(akhir)
+            awal = akhir + timedelta(days=1)
+    
+    # Urut dari tanggal terlama: tiap snapshot dihitung dari snapshot sebelumnya
+    for item in daftar_tanggal:
+        jumlah = buat_snapshot_stok(cur, item)
+        mysql.connection.commit()
+        click.echo(f"✅ Snapshot stok {item.isoformat()} ({jumlah} baris)")
+    cur.close()
+
+# Bangun ulang rekap harian/bulanan dari tabel transaksi (mis. setelah koreksi data manual)
+#   flask --app app rekap-ulang                     -> seluruh riwayat
+#   flask --app app rekap-ulang --dari 2024-06-01   -> mulai bulan Juni 2024
+@app.cli.command('rekap-ulang')
+@click.option('--dari', help='Hitung ulang mulai bulan tanggal ini (YYYY-MM-DD)')
+def rekap_ulang_command(dari):
+    """Hitung ulang tabel rekap_harian dan rekap_bulanan"""
+    cur = mysql.connection.cursor()
+    try:
+        bangun_ulang_rekap(cur, parse_tanggal(dari))
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cur.close()
+    
+    click.echo("✅ Rekap harian dan bulanan berhasil dibangun ulang")
+
 if __name__ == '__main__':
+    # Server WSGI lain: panggil mysql.warm_up() setelah worker dibuat (bukan sebelum fork)
+    try:
+        mysql.warm_up()
+    except MySQLdb.Error as e:
+        print(f"⚠️ Warm-up pool koneksi gagal: {e}")
     app.run(debug=True, port=5000)
\ No newline at end of file
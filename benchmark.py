@@ -0,0 +1,218 @@
+# benchmark.py
+"""Benchmark route dan export terhadap database lokal memakai Flask test client.
+
+Setiap skenario dijalankan beberapa kali; yang dicatat adalah latensi p50/p95
+(termasuk membaca seluruh body, jadi export streaming ikut terukur), jumlah query,
+waktu SQL, baris yang diambil, ukuran response, dan puncak memori Python
+(satu putaran terpisah dengan tracemalloc). Hasil disimpan sebagai JSON di
+benchmark_results/ untuk dibandingkan antar commit.
+
+Isi database dulu dengan generate_data.py, lalu:
+    python benchmark.py
+    python benchmark.py --iterasi 20 --skenario dashboard laporan_stok
+    python benchmark.py --bandingkan benchmark_results/20261018-101500-abc1234.json
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from flask import g
+
+from app import app, mysql
+
+HASIL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results')
+
+# Tabel yang jumlah barisnya ikut dicatat, supaya hasil hanya dibandingkan pada skala yang sama
+TABEL_DIHITUNG = ['bahan', 'penerimaan', 'pengeluaran', 'monitoring_kualitas', 'mutasi_stok', 'lot_stok']
+
+def daftar_skenario(bahan_id):
+    """(nama, path) setiap skenario; rentang tanggal dihitung dari hari ini"""
+    hari_ini = date.today()
+    sebulan = (hari_ini - timedelta(days=30)).isoformat()
+    setahun = (hari_ini - timedelta(days=365)).isoformat()
+    akhir = hari_ini.isoformat()
+    return [
+        ('dashboard', '/dashboard'),
+        ('api_dashboard', '/api/dashboard'),
+        ('laporan_stok', '/laporan-stok'),
+        ('laporan_distribusi', f'/laporan-distribusi?start_date={sebulan}&end_date={akhir}'),
+        ('laporan_distribusi_setahun', f'/laporan-distribusi?start_date={setahun}&end_date={akhir}'),
+        ('penerimaan', f'/penerimaan?start_date={sebulan}&end_date={akhir}'),
+        ('pengeluaran', f'/pengeluaran?start_date={sebulan}&end_date={akhir}'),
+        ('monitoring', f'/monitoring?start_date={sebulan}&end_date={akhir}'),
+        ('kartu_stok', f'/kartu-stok?bahan_id={bahan_id}'),
+        ('export_stok_pdf', '/export-stok-pdf'),
+        ('export_distribusi_excel', f'/export-distribusi-excel?start_date={sebulan}&end_date={akhir}'),
+        ('export_pengeluaran_csv', f'/export/pengeluaran.csv?start_date={setahun}&end_date={akhir}'),
+    ]
+
+def persentil(nilai, p):
+    """Persentil nearest-rank dari daftar nilai"""
+    urut = sorted(nilai)
+    return urut[max(0, math.ceil(p / 100 * len(urut)) - 1)]
+
+def versi_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+        kotor = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], text=True,
+                                        stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if kotor else '')
+
+def info_database():
+    """Jumlah baris tabel utama dan bahan dengan transaksi terbanyak (untuk kartu stok)"""
+    with app.app_context():
+        cur = mysql.connection.cursor()
+        jumlah = {}
+        for tabel in TABEL_DIHITUNG:
+            cur.execute(f"SELECT COUNT(*) as total FROM {tabel}")
+            jumlah[tabel] = cur.fetchone()['total']
+        cur.execute("""
+            SELECT bahan_id FROM rekap_bulanan
+            GROUP BY bahan_id
+            ORDER BY SUM(jumlah_transaksi) DESC
+            LIMIT 1
+        """)
+        teratas = cur.fetchone()
+        cur.execute("SELECT id, username, nama_lengkap, role FROM users WHERE role = 'admin' ORDER BY id LIMIT 1")
+        admin = cur.fetchone()
+        cur.close()
+    return jumlah, teratas['bahan_id'] if teratas else 1, admin
+
+def jalankan(client, path):
+    """Satu request; body dibaca sampai habis. Hasil: (status, detik, byte, [query, detik SQL, baris])"""
+    # Konteks request dipertahankan (with client) supaya g.metrik_sql masih bisa dibaca
+    # setelah body streaming selesai dikirim
+    with client:
+        mulai = time.perf_counter()
+        response = client.get(path, buffered=False)
+        ukuran = sum(len(potongan) for potongan in response.iter_encoded())
+        response.close()
+        durasi = time.perf_counter() - mulai
+        metrik = list(g.get('metrik_sql') or (0, 0.0, 0))
+    return response.status_code, durasi, ukuran, metrik
+
+def ukur_skenario(client, path, iterasi):
+    latensi, status = [], set()
+    for _ in range(iterasi):
+        kode, durasi, ukuran, metrik = jalankan(client, path)
+        latensi.append(durasi * 1000)
+        status.add(kode)
+
+    # Puncak memori diukur di putaran terpisah karena tracemalloc memperlambat request
+    tracemalloc.start()
+    jalankan(client, path)
+    _, puncak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'path': path,
+        'status': sorted(status),
+        'iterasi': iterasi,
+        'pertama_ms': round(latensi[0], 2),
+        'p50_ms': round(persentil(latensi, 50), 2),
+        'p95_ms': round(persentil(latensi, 95), 2),
+        'maks_ms': round(max(latensi), 2),
+        'query': metrik[0],
+        'sql_ms': round(metrik[1] * 1000, 2),
+        'baris': metrik[2],
+        'bytes': ukuran,
+        'puncak_memori_kb': round(puncak / 1024),
+    }
+
+def bandingkan(lama, baru):
+    """Cetak perubahan p50/p95/query per skenario terhadap hasil sebelumnya"""
+    print(f"\nPerbandingan dengan {lama.get('commit') or '-'} ({lama['waktu']})")
+    if lama.get('jumlah_baris') != baru['jumlah_baris']:
+        print("⚠️  Jumlah baris database berbeda, perbandingan tidak setara")
+
+    def selisih(a, b):
+        return f"{(b - a) / a * 100:+.0f}%" if a else '-'
+
+    print(f"{'skenario':<28} {'p50 lama':>10} {'p50 baru':>10} {'':>6} {'p95 lama':>10} {'p95 baru':>10} "
+          f"{'':>6} {'query':>9}")
+    for nama, hasil in baru['hasil'].items():
+        sebelum = lama['hasil'].get(nama)
+        if not sebelum:
+            continue
+        print(f"{nama:<28} {sebelum['p50_ms']:>10.1f} {hasil['p50_ms']:>10.1f} "
+              f"{selisih(sebelum['p50_ms'], hasil['p50_ms']):>6} {sebelum['p95_ms']:>10.1f} "
+              f"{hasil['p95_ms']:>10.1f} {selisih(sebelum['p95_ms'], hasil['p95_ms']):>6} "
+              f"{sebelum['query']:>4}→{hasil['query']:<4}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark route dan export SPPG")
+    parser.add_argument('--iterasi', type=int, default=10)
+    parser.add_argument('--skenario', nargs='*', help="nama skenario yang dijalankan (default: semua)")
+    parser.add_argument('--output', help="file JSON hasil (default: benchmark_results/<waktu>-<commit>.json)")
+    parser.add_argument('--bandingkan', help="file JSON hasil sebelumnya untuk dibandingkan")
+    args = parser.parse_args()
+
+    jumlah_baris, bahan_id, admin = info_database()
+    if not admin:
+        print("❌ Tidak ada user admin di database")
+        return False
+
+    skenario = daftar_skenario(bahan_id)
+    if args.skenario:
+        dikenal = {nama for nama, _ in skenario}
+        tidak_dikenal = set(args.skenario) - dikenal
+        if tidak_dikenal:
+            print(f"❌ Skenario tidak dikenal: {', '.join(sorted(tidak_dikenal))}. Pilihan: {', '.join(sorted(dikenal))}")
+            return False
+        skenario = [(nama, path) for nama, path in skenario if nama in args.skenario]
+
+    client = app.test_client()
+    with client.session_transaction() as sesi:
+        sesi['logged_in'] = True
+        sesi['user_id'] = admin['id']
+        sesi['username'] = admin['username']
+        sesi['nama_lengkap'] = admin['nama_lengkap']
+        sesi['role'] = admin['role']
+
+    commit = versi_commit()
+    print(f"=== Benchmark {commit or ''}: " + ', '.join(f"{t} {n:,}" for t, n in jumlah_baris.items()) + " ===")
+    print(f"{'skenario':<28} {'p50':>9} {'p95':>9} {'query':>6} {'sql':>9} {'memori':>10}")
+
+    hasil = {}
+    for nama, path in skenario:
+        data = ukur_skenario(client, path, args.iterasi)
+        hasil[nama] = data
+        tanda = '' if all(kode < 400 for kode in data['status']) else f"  ⚠️ status {data['status']}"
+        print(f"{nama:<28} {data['p50_ms']:>7.1f}ms {data['p95_ms']:>7.1f}ms {data['query']:>6} "
+              f"{data['sql_ms']:>7.1f}ms {data['puncak_memori_kb']:>8}KB{tanda}")
+
+    laporan = {
+        'waktu': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'database': app.config['MYSQL_DB'],
+        'jumlah_baris': jumlah_baris,
+        'iterasi': args.iterasi,
+        'maks_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'hasil': hasil,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(HASIL_DIR, exist_ok=True)
+        output = os.path.join(HASIL_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'tanpa-git'}.json")
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(laporan, file, indent=2)
+    print(f"\n✅ Hasil disimpan di {output}")
+
+    if args.bandingkan:
+        with open(args.bandingkan, 'r', encoding='utf-8') as file:
+            bandingkan(json.load(file), laporan)
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,412 @@
+# generate_data.py
+"""Generator data sintetis untuk uji performa di database lokal.
+
+Mengisi bahan, penerimaan, pengeluaran, dan monitoring_kualitas dengan volume
+yang bisa diatur, lalu membangun ulang tabel turunan (stok, harga rata-rata,
+kartu stok, lot FEFO, rekap) supaya konsisten dengan transaksi yang dibuat.
+
+Contoh:
+    python generate_data.py --skala kecil --reset
+    python generate_data.py --skala nasional --reset --seed 7
+    python generate_data.py --bahan 10000 --penerimaan 5000000 --pengeluaran 5000000 --monitoring 1000000 --reset
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import MySQLdb
+import MySQLdb.cursors
+
+from app import app, bangun_ulang_rekap, buat_snapshot_stok
+from migrate import get_connection
+
+SKALA = {
+    'kecil': {'bahan': 500, 'penerimaan': 50_000, 'pengeluaran': 50_000, 'monitoring': 10_000},
+    'sedang': {'bahan': 2_000, 'penerimaan': 500_000, 'pengeluaran': 500_000, 'monitoring': 100_000},
+    'nasional': {'bahan': 10_000, 'penerimaan': 5_000_000, 'pengeluaran': 5_000_000, 'monitoring': 1_000_000},
+}
+
+# Tabel yang dikosongkan oleh --reset (users, kategori, dan satuan dibiarkan)
+TABEL_RESET = ['lot_stok', 'snapshot_stok', 'mutasi_stok', 'rekap_harian', 'rekap_bulanan',
+               'harga_rata_bahan', 'stok', 'monitoring_kualitas', 'penerimaan', 'pengeluaran',
+               'bahan', 'nomor_urut']
+
+# Distribusi MBG: sebagian besar ke sekolah, sisanya ke layanan kesehatan
+BOBOT_JENIS_TUJUAN = {'sekolah': 70, 'posyandu': 12, 'puskesmas': 8, 'rumah_sakit': 5, 'lainnya': 5}
+NAMA_TUJUAN = {
+    'sekolah': ['SDN', 'SMPN', 'SMAN', 'MI', 'MTs'],
+    'posyandu': ['Posyandu'],
+    'puskesmas': ['Puskesmas'],
+    'rumah_sakit': ['RSUD'],
+    'lainnya': ['Panti Asuhan', 'Pondok Pesantren'],
+}
+KOTA = ['Jakarta', 'Bandung', 'Surabaya', 'Semarang', 'Medan', 'Makassar', 'Palembang', 'Denpasar',
+        'Yogyakarta', 'Malang', 'Padang', 'Pontianak', 'Banjarmasin', 'Manado', 'Kupang', 'Mataram',
+        'Ambon', 'Jayapura', 'Pekanbaru', 'Samarinda']
+NAMA_BAHAN = ['Telur Ayam', 'Daging Ayam', 'Ikan Tongkol', 'Tahu', 'Tempe', 'Kacang Hijau', 'Beras',
+              'Jagung', 'Kentang', 'Bayam', 'Wortel', 'Kangkung', 'Pisang', 'Jeruk', 'Pepaya', 'Susu UHT',
+              'Keju', 'Minyak Goreng', 'Gula Pasir', 'Garam']
+PETUGAS = ['Budi Santoso', 'Siti Aminah', 'Agus Salim', 'Dewi Lestari', 'Rudi Hartono', 'Nur Aini']
+SUPPLIER = [f'{badan} {nama}' for badan in ('PT', 'CV', 'UD', 'Koperasi')
+            for nama in ('Sumber Pangan', 'Tani Makmur', 'Nusantara Jaya', 'Segar Abadi', 'Berkah')]
+
+STATUS_PENERIMAAN = {'disetujui': 95, 'draft': 3, 'ditolak': 2}
+STATUS_PENGELUARAN = {'diterima': 90, 'dikirim': 7, 'draft': 3}
+KONDISI_PENERIMAAN = {'baik': 97, 'rusak_sebagian': 2.5, 'rusak_total': 0.5}
+KONDISI_FISIK = {'sangat_baik': 30, 'baik': 55, 'cukup': 12, 'buruk': 3}
+KONDISI_KEMASAN = {'utuh': 92, 'rusak_ringan': 7, 'rusak_berat': 1}
+STATUS_KADALUARSA = {'aman': 85, 'mendekati': 12, 'kadaluarsa': 3}
+
+# Umur simpan (hari) per urutan kategori bawaan sppg_database.sql
+UMUR_SIMPAN = [(3, 30), (30, 180), (180, 540), (3, 14), (5, 21), (7, 90), (90, 365), (180, 730)]
+
+def pilih(bobot, k, rng):
+    return rng.choices(list(bobot), weights=list(bobot.values()), k=k)
+
+def bobot_tanggal(mulai, jumlah_hari):
+    """Bobot kumulatif per hari: hari sekolah ramai, akhir pekan dan libur sekolah sepi,
+    dan volume program naik seiring waktu"""
+    kumulatif, total = [], 0.0
+    for i in range(jumlah_hari):
+        tanggal = mulai + timedelta(days=i)
+        bobot = (1.0, 1.0, 1.0, 1.0, 1.0, 0.3, 0.1)[tanggal.weekday()]
+        if (tanggal.month == 6 and tanggal.day >= 20) or (tanggal.month == 7 and tanggal.day <= 15) \
+                or (tanggal.month == 12 and tanggal.day >= 20):
+            bobot *= 0.4
+        bobot *= 0.5 + 0.5 * i / max(jumlah_hari - 1, 1)
+        total += bobot
+        kumulatif.append(total)
+    return kumulatif
+
+def sisipkan(connection, query, baris_iter, batch_size, label):
+    """INSERT per batch (executemany menjadi multi-row INSERT), commit setiap batch"""
+    cursor = connection.cursor()
+    jumlah, mulai = 0, time.monotonic()
+    batch = []
+    for baris in baris_iter:
+        batch.append(baris)
+        if len(batch) >= batch_size:
+            cursor.executemany(query, batch)
+            connection.commit()
+            jumlah += len(batch)
+            batch = []
+            print(f"\r   {label}: {jumlah:,} baris ({jumlah / (time.monotonic() - mulai):,.0f}/detik)", end='')
+    if batch:
+        cursor.executemany(query, batch)
+        connection.commit()
+        jumlah += len(batch)
+    cursor.close()
+    print(f"\r   {label}: {jumlah:,} baris dalam {time.monotonic() - mulai:.1f} detik" + ' ' * 10)
+    return jumlah
+
+def buat_bahan(connection, jumlah, batch_size, rng):
+    cursor = connection.cursor()
+    cursor.execute("SELECT id FROM kategori_bahan ORDER BY id")
+    kategori = [row['id'] for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM satuan ORDER BY id")
+    satuan = [row['id'] for row in cursor.fetchall()]
+    cursor.close()
+    if not kategori or not satuan:
+        raise SystemExit("❌ Tabel kategori_bahan dan satuan harus berisi data (jalankan sppg_database.sql)")
+
+    def baris():
+        for i in range(1, jumlah + 1):
+            stok_minimum = rng.choice((10, 50, 100, 500, 1000))
+            yield (f"GEN-{i:05d}", f"{rng.choice(NAMA_BAHAN)} {i}", rng.choice(kategori), rng.choice(satuan),
+                   stok_minimum, stok_minimum * 10, round(rng.uniform(0.1, 5), 2),
+                   round(rng.uniform(10, 400), 2), round(rng.uniform(0, 30), 2))
+
+    sisipkan(connection, """
+        INSERT INTO bahan (kode_bahan, nama_bahan, kategori_id, satuan_id, stok_minimum, stok_maksimum,
+                           berat_per_unit, kalori_per_unit, protein_per_unit)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, baris(), batch_size, 'bahan')
+
+    cursor = connection.cursor()
+    cursor.execute("SELECT id, kategori_id, satuan_id FROM bahan ORDER BY id")
+    bahan = cursor.fetchall()
+    cursor.close()
+
+    # Profil per bahan: umur simpan dari kategori, ukuran kiriman, dan harga dasar
+    urutan_kategori = {kategori_id: i for i, kategori_id in enumerate(kategori)}
+    for item in bahan:
+        item['umur_simpan'] = UMUR_SIMPAN[urutan_kategori[item['kategori_id']] % len(UMUR_SIMPAN)]
+        item['ukuran'] = rng.choice((10, 25, 50, 100, 250, 500))
+        item['harga'] = round(rng.lognormvariate(9.5, 0.8), -2)
+    return bahan
+
+def bobot_bahan(bahan):
+    """Popularitas bahan mengikuti distribusi Zipf: sebagian kecil bahan paling sering dipakai"""
+    kumulatif, total = [], 0.0
+    for peringkat in range(1, len(bahan) + 1):
+        total += 1 / peringkat ** 0.8
+        kumulatif.append(total)
+    return kumulatif
+
+def baris_penerimaan(jumlah, bahan, kum_bahan, mulai, kum_tanggal, rng):
+    nomor = 0
+    while nomor < jumlah:
+        k = min(10_000, jumlah - nomor)
+        daftar_bahan = rng.choices(bahan, cum_weights=kum_bahan, k=k)
+        daftar_hari = rng.choices(range(len(kum_tanggal)), cum_weights=kum_tanggal, k=k)
+        daftar_status = pilih(STATUS_PENERIMAAN, k, rng)
+        daftar_kondisi = pilih(KONDISI_PENERIMAAN, k, rng)
+        for item, hari, status, kondisi in zip(daftar_bahan, daftar_hari, daftar_status, daftar_kondisi):
+            nomor += 1
+            tanggal = mulai + timedelta(days=hari)
+            umur_min, umur_maks = item['umur_simpan']
+            yield (f"TRM-{tanggal:%Y%m%d}-G{nomor:07d}", tanggal, item['id'],
+                   round(item['ukuran'] * rng.uniform(0.5, 1.5), 2), item['satuan_id'],
+                   round(item['harga'] * rng.uniform(0.9, 1.1), -1), rng.choice(SUPPLIER),
+                   f"B{tanggal:%y%m}{rng.randint(0, 9999):04d}",
+                   tanggal - timedelta(days=rng.randint(0, umur_min)),
+                   tanggal + timedelta(days=rng.randint(umur_min, umur_maks)),
+                   kondisi, rng.choice(PETUGAS), status, 1,
+                   datetime.combine(tanggal, datetime.min.time()) + timedelta(seconds=rng.randint(25200, 61200)))
+
+def buat_tujuan(jumlah, rng):
+    tujuan = []
+    for jenis in pilih(BOBOT_JENIS_TUJUAN, jumlah, rng):
+        kota = rng.choice(KOTA)
+        tujuan.append((jenis, f"{rng.choice(NAMA_TUJUAN[jenis])} {rng.randint(1, 300):02d} {kota}",
+                       f"Jl. Merdeka No.{rng.randint(1, 200)}, {kota}"))
+    return tujuan
+
+def baris_pengeluaran(jumlah, faktor, bahan, kum_bahan, mulai, kum_tanggal, rng):
+    tujuan = buat_tujuan(min(20_000, max(200, jumlah // 250)), rng)
+    nomor = 0
+    while nomor < jumlah:
+        k = min(10_000, jumlah - nomor)
+        daftar_bahan = rng.choices(bahan, cum_weights=kum_bahan, k=k)
+        daftar_hari = rng.choices(range(len(kum_tanggal)), cum_weights=kum_tanggal, k=k)
+        daftar_status = pilih(STATUS_PENGELUARAN, k, rng)
+        for item, hari, status in zip(daftar_bahan, daftar_hari, daftar_status):
+            nomor += 1
+            tanggal = mulai + timedelta(days=hari)
+            jenis, nama, alamat = rng.choice(tujuan)
+            yield (f"KLR-{tanggal:%Y%m%d}-G{nomor:07d}", tanggal, item['id'],
+                   max(0.01, round(item['ukuran'] * faktor * rng.uniform(0.5, 1.5), 2)), item['satuan_id'],
+                   'distribusi', jenis, nama, alamat, rng.choice(PETUGAS), status, 1,
+                   datetime.combine(tanggal, datetime.min.time()) + timedelta(seconds=rng.randint(21600, 54000)))
+
+def baris_monitoring(jumlah, bahan, kum_bahan, mulai, kum_tanggal, rng):
+    nomor = 0
+    while nomor < jumlah:
+        k = min(10_000, jumlah - nomor)
+        daftar_bahan = rng.choices(bahan, cum_weights=kum_bahan, k=k)
+        daftar_hari = rng.choices(range(len(kum_tanggal)), cum_weights=kum_tanggal, k=k)
+        daftar_fisik = pilih(KONDISI_FISIK, k, rng)
+        daftar_kemasan = pilih(KONDISI_KEMASAN, k, rng)
+        daftar_kadaluarsa = pilih(STATUS_KADALUARSA, k, rng)
+        for item, hari, fisik, kemasan, kadaluarsa in zip(daftar_bahan, daftar_hari, daftar_fisik,
+                                                         daftar_kemasan, daftar_kadaluarsa):
+            nomor += 1
+            yield (item['id'], mulai + timedelta(days=hari),
+                   round(min(35, max(10, rng.gauss(24, 3))), 1), round(min(95, max(30, rng.gauss(65, 8))), 1),
+                   fisik, kemasan, kadaluarsa, rng.choice(PETUGAS), None)
+
+def bangun_ulang_turunan(connection, mulai, akhir):
+    """Hitung ulang stok, harga rata-rata, kartu stok, snapshot, lot FEFO, dan rekap dari transaksi"""
+    cursor = connection.cursor()
+
+    print("   stok...")
+    cursor.execute("DELETE FROM stok")
+    cursor.execute("""
+        INSERT INTO stok (bahan_id, jumlah, satuan_id)
+        SELECT b.id, COALESCE(m.total, 0) - COALESCE(k.total, 0), b.satuan_id
+        FROM bahan b
+        LEFT JOIN (SELECT bahan_id, SUM(jumlah) as total FROM penerimaan
+                   WHERE status = 'disetujui' GROUP BY bahan_id) m ON b.id = m.bahan_id
+        LEFT JOIN (SELECT bahan_id, SUM(jumlah) as total FROM pengeluaran
+                   WHERE status != 'draft' GROUP BY bahan_id) k ON b.id = k.bahan_id
+    """)
+
+    # Bahan yang keluar lebih banyak dari yang masuk diberi penerimaan penyesuaian di
+    # awal periode sampai stoknya sama dengan stok minimum
+    cursor.execute("""
+        INSERT INTO penerimaan (no_penerimaan, tanggal, bahan_id, jumlah, satuan_id, harga_satuan,
+                                supplier, kondisi, penerima, status, created_by, created_at)
+        SELECT CONCAT(%s, LPAD(s.bahan_id, 7, '0')), %s, s.bahan_id, b.stok_minimum - s.jumlah,
+               b.satuan_id, 0, 'Penyesuaian', 'baik', 'Generator', 'disetujui', 1, %s
+        FROM stok s
+        JOIN bahan b ON s.bahan_id = b.id
+        WHERE s.jumlah < 0
+    """, (f"TRM-{mulai:%Y%m%d}-A", mulai, datetime.combine(mulai, datetime.min.time())))
+    cursor.execute("""
+        UPDATE stok s JOIN bahan b ON s.bahan_id = b.id
+        SET s.jumlah = b.stok_minimum
+        WHERE s.jumlah < 0
+    """)
+    connection.commit()
+
+    print("   harga rata-rata...")
+    cursor.execute("DELETE FROM harga_rata_bahan")
+    cursor.execute("""
+        INSERT INTO harga_rata_bahan (bahan_id, total_jumlah, total_nilai, harga_rata)
+        SELECT bahan_id, SUM(jumlah), SUM(jumlah * harga_satuan), SUM(jumlah * harga_satuan) / SUM(jumlah)
+        FROM penerimaan
+        WHERE status = 'disetujui' AND harga_satuan > 0 AND jumlah > 0
+        GROUP BY bahan_id
+    """)
+    connection.commit()
+
+    print("   kartu stok...")
+    cursor.execute("TRUNCATE TABLE snapshot_stok")
+    cursor.execute("TRUNCATE TABLE mutasi_stok")
+    cursor.execute("""
+        INSERT INTO mutasi_stok (bahan_id, tanggal, jenis, jumlah, referensi)
+        SELECT bahan_id, tanggal, 'masuk', jumlah, no_penerimaan
+        FROM penerimaan
+        WHERE status = 'disetujui'
+        ORDER BY tanggal, id
+    """)
+    cursor.execute("""
+        INSERT INTO mutasi_stok (bahan_id, tanggal, jenis, jumlah, referensi)
+        SELECT bahan_id, tanggal, 'keluar', -jumlah, no_pengeluaran
+        FROM pengeluaran
+        WHERE status != 'draft'
+        ORDER BY tanggal, id
+    """)
+    connection.commit()
+
+    # Snapshot akhir setiap bulan, berurutan karena snapshot dibangun dari snapshot sebelumnya
+    akhir_bulan = (mulai.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    while akhir_bulan < akhir:
+        buat_snapshot_stok(cursor, akhir_bulan)
+        connection.commit()
+        akhir_bulan = (akhir_bulan + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+    print("   lot stok (FEFO)...")
+    cursor.execute("TRUNCATE TABLE lot_stok")
+    cursor.execute("SELECT bahan_id, jumlah FROM stok WHERE jumlah > 0")
+    sisa_stok = {row['bahan_id']: float(row['jumlah']) for row in cursor.fetchall()}
+    connection.commit()
+
+    # Stok yang tersisa adalah lot yang paling lambat kadaluarsa (yang lain sudah keluar
+    # lebih dulu secara FEFO), jadi penerimaan dibaca dari kadaluarsa terakhir
+    def baris_lot():
+        koneksi_baca = get_connection()
+        baca = koneksi_baca.cursor(MySQLdb.cursors.SSCursor)
+        try:
+            baca.execute("""
+                SELECT bahan_id, no_penerimaan, no_batch, tanggal_kadaluarsa, jumlah
+                FROM penerimaan
+                WHERE status = 'disetujui'
+                ORDER BY bahan_id, tanggal_kadaluarsa IS NULL DESC, tanggal_kadaluarsa DESC, id DESC
+            """)
+            for bahan_id, no_penerimaan, no_batch, kadaluarsa, jumlah in baca:
+                sisa = sisa_stok.get(bahan_id, 0)
+                if sisa <= 0:
+                    continue
+                ambil = min(float(jumlah), sisa)
+                sisa_stok[bahan_id] = round(sisa - ambil, 2)
+                yield (bahan_id, no_penerimaan, no_batch, kadaluarsa, jumlah, ambil)
+        finally:
+            baca.close()
+            koneksi_baca.close()
+
+    sisipkan(connection, """
+        INSERT INTO lot_stok (bahan_id, no_penerimaan, no_batch, tanggal_kadaluarsa, jumlah_awal, sisa)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, baris_lot(), 5000, 'lot_stok')
+
+    print("   rekap harian/bulanan...")
+    bangun_ulang_rekap(cursor)
+    cursor.execute("UPDATE versi_data SET versi = versi + 1")
+    connection.commit()
+    cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Isi database lokal dengan data sintetis untuk uji performa")
+    parser.add_argument('--skala', choices=list(SKALA), default='kecil')
+    parser.add_argument('--bahan', type=int, help="jumlah bahan (menimpa --skala)")
+    parser.add_argument('--penerimaan', type=int, help="jumlah penerimaan (menimpa --skala)")
+    parser.add_argument('--pengeluaran', type=int, help="jumlah pengeluaran (menimpa --skala)")
+    parser.add_argument('--monitoring', type=int, help="jumlah monitoring (menimpa --skala)")
+    parser.add_argument('--hari', type=int, default=730, help="rentang tanggal transaksi sampai hari ini")
+    parser.add_argument('--batch', type=int, default=5000, help="baris per INSERT")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true',
+                        help=f"kosongkan dulu tabel {', '.join(TABEL_RESET)}")
+    args = parser.parse_args()
+
+    volume = dict(SKALA[args.skala])
+    for kunci in volume:
+        if getattr(args, kunci) is not None:
+            volume[kunci] = getattr(args, kunci)
+
+    rng = random.Random(args.seed)
+    akhir = date.today()
+    mulai = akhir - timedelta(days=args.hari - 1)
+
+    connection = get_connection()
+    cursor = connection.cursor()
+    print(f"=== Generator data: database {app.config['MYSQL_DB']} di {app.config['MYSQL_HOST']} ===")
+
+    if args.reset:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for tabel in TABEL_RESET:
+            cursor.execute(f"TRUNCATE TABLE {tabel}")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        print("🗑️  Tabel transaksi dan turunan dikosongkan")
+    else:
+        cursor.execute("SELECT (SELECT COUNT(*) FROM bahan) + (SELECT COUNT(*) FROM penerimaan) as total")
+        if cursor.fetchone()['total']:
+            print("❌ Database sudah berisi data. Jalankan dengan --reset untuk menggantinya.")
+            return False
+
+    # Foreign key dan unique check dimatikan selama pengisian massal (data dibuat konsisten)
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    cursor.execute("SET UNIQUE_CHECKS = 0")
+    cursor.close()
+    mulai_total = time.monotonic()
+
+    print(f"1. Bahan ({volume['bahan']:,})")
+    bahan = buat_bahan(connection, volume['bahan'], args.batch, rng)
+    kum_bahan = bobot_bahan(bahan)
+    kum_tanggal = bobot_tanggal(mulai, args.hari)
+
+    print(f"2. Transaksi {mulai} s.d. {akhir}")
+    sisipkan(connection, """
+        INSERT INTO penerimaan (no_penerimaan, tanggal, bahan_id, jumlah, satuan_id, harga_satuan, supplier,
+                                no_batch, tanggal_produksi, tanggal_kadaluarsa, kondisi, penerima, status,
+                                created_by, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, baris_penerimaan(volume['penerimaan'], bahan, kum_bahan, mulai, kum_tanggal, rng), args.batch,
+        'penerimaan')
+
+    # Rata-rata jumlah keluar diatur ~80% dari jumlah masuk per bahan, jadi stok tetap positif
+    faktor = 0.8 * volume['penerimaan'] / volume['pengeluaran'] if volume['pengeluaran'] else 0
+    sisipkan(connection, """
+        INSERT INTO pengeluaran (no_pengeluaran, tanggal, bahan_id, jumlah, satuan_id, tujuan, jenis_tujuan,
+                                 nama_tujuan, alamat_tujuan, penerima, status, created_by, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, baris_pengeluaran(volume['pengeluaran'], faktor, bahan, kum_bahan, mulai, kum_tanggal, rng),
+        args.batch, 'pengeluaran')
+
+    sisipkan(connection, """
+        INSERT INTO monitoring_kualitas (bahan_id, tanggal_check, suhu_gudang, kelembaban_gudang, kondisi_fisik,
+                                         kondisi_kemasan, status_kadaluarsa, petugas, catatan)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, baris_monitoring(volume['monitoring'], bahan, kum_bahan, mulai, kum_tanggal, rng), args.batch,
+        'monitoring')
+
+    print("3. Tabel turunan")
+    bangun_ulang_turunan(connection, mulai, akhir)
+
+    cursor = connection.cursor()
+    cursor.execute("SET UNIQUE_CHECKS = 1")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    cursor.execute("ANALYZE TABLE bahan, penerimaan, pengeluaran, monitoring_kualitas, mutasi_stok, "
+                   "lot_stok, rekap_harian, rekap_bulanan")
+    cursor.fetchall()
+    cursor.close()
+    connection.close()
+
+    print(f"✅ Selesai dalam {time.monotonic() - mulai_total:.0f} detik")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
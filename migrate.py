@@ -0,0 +1,187 @@
+# migrate.py
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+import MySQLdb
+import MySQLdb.cursors
+
+from app import (app, rentang_bulan, rentang_tahun, query_penerimaan, query_pengeluaran,
+                 query_monitoring, query_distribusi, query_ringkasan_penerimaan,
+                 query_ringkasan_pengeluaran, query_ringkasan_monitoring,
+                 query_ringkasan_distribusi, query_distribusi_per_tujuan, KOLOM_DISTRIBUSI_LAPORAN,
+                 KOLOM_DISTRIBUSI_EXPORT, QUERY_TOTAL_PENERIMAAN_BULAN,
+                 QUERY_TOTAL_PENGELUARAN_BULAN, QUERY_BAHAN_MENDEKATI_KADALUARSA,
+                 QUERY_STOK_KADALUARSA, QUERY_PENERIMAAN_PER_BULAN)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Nama file migrasi: NNNN_keterangan.sql, dijalankan berurutan sesuai nomor versi
+MIGRATION_PATTERN = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+def get_connection():
+    """Koneksi ke database aplikasi memakai konfigurasi di app.py"""
+    return MySQLdb.connect(
+        host=app.config['MYSQL_HOST'],
+        user=app.config['MYSQL_USER'],
+        passwd=app.config['MYSQL_PASSWORD'],
+        db=app.config['MYSQL_DB'],
+        cursorclass=MySQLdb.cursors.DictCursor
+    )
+
+def ensure_migration_table(cursor):
+    """Membuat tabel pencatat migrasi jika belum ada"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versi VARCHAR(4) PRIMARY KEY,
+            nama VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def list_migrations():
+    """Daftar (versi, nama, path) file migrasi, urut berdasarkan versi"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_PATTERN.match(filename)
+        if match:
+            migrations.append((match.group(1), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+def applied_versions(cursor):
+    cursor.execute("SELECT versi FROM schema_migrations")
+    return {row['versi'] for row in cursor.fetchall()}
+
+def split_statements(sql_script):
+    """Pisahkan isi file SQL per perintah (baris komentar -- diabaikan)"""
+    lines = [line for line in sql_script.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+def migrate():
+    """Jalankan semua migrasi yang belum tercatat di schema_migrations"""
+    connection = get_connection()
+    cursor = connection.cursor()
+    ensure_migration_table(cursor)
+    done = applied_versions(cursor)
+
+    pending = [m for m in list_migrations() if m[0] not in done]
+    if not pending:
+        print("✅ Skema database sudah terbaru")
+
+    for versi, nama, path in pending:
+        with open(path, 'r', encoding='utf-8') as file:
+            statements = split_statements(file.read())
+
+        # Catatan: DDL di MySQL melakukan commit implisit, jadi migrasi yang gagal
+        # di tengah jalan harus diperbaiki manual sebelum dijalankan ulang
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (versi, nama) VALUES (%s, %s)", (versi, nama))
+            connection.commit()
+            print(f"✅ {versi}_{nama} berhasil dijalankan")
+        except MySQLdb.Error as e:
+            connection.rollback()
+            print(f"❌ {versi}_{nama} gagal: {e}")
+            cursor.close()
+            connection.close()
+            return False
+
+    cursor.close()
+    connection.close()
+    return True
+
+def status():
+    """Tampilkan status setiap migrasi"""
+    connection = get_connection()
+    cursor = connection.cursor()
+    ensure_migration_table(cursor)
+    done = applied_versions(cursor)
+
+    for versi, nama, _ in list_migrations():
+        tanda = '✅' if versi in done else '⏳'
+        print(f"{tanda} {versi}_{nama}")
+
+    cursor.close()
+    connection.close()
+
+def route_queries():
+    """Query route yang difilter/diurutkan berdasarkan tanggal, dengan contoh filter.
+
+    Setiap entri: (nama, alias tabel yang difilter tanggal, query, params).
+    """
+    hari_ini = datetime.now().date()
+    start_date = (hari_ini - timedelta(days=30)).isoformat()
+    end_date = hari_ini.isoformat()
+    per_page = app.config['PAGE_SIZE']
+
+    return [
+        ('dashboard: total penerimaan bulan ini', 'rekap_bulanan', QUERY_TOTAL_PENERIMAAN_BULAN, list(rentang_bulan())),
+        ('dashboard: total pengeluaran bulan ini', 'rekap_bulanan', QUERY_TOTAL_PENGELUARAN_BULAN, list(rentang_bulan())),
+        ('dashboard: bahan mendekati kadaluarsa', 'l', QUERY_BAHAN_MENDEKATI_KADALUARSA,
+         [hari_ini, hari_ini + timedelta(days=31)]),
+        ('dashboard: stok kadaluarsa', 'l', QUERY_STOK_KADALUARSA, [hari_ini]),
+        ('api: penerimaan per bulan', 'r', QUERY_PENERIMAAN_PER_BULAN, list(rentang_tahun())),
+        ('penerimaan', 'p', *query_penerimaan(start_date, end_date, limit=per_page)),
+        ('penerimaan: status', 'p', *query_penerimaan(start_date, end_date, 'disetujui', limit=per_page)),
+        ('penerimaan: ringkasan', 'p', *query_ringkasan_penerimaan(start_date, end_date)),
+        ('pengeluaran', 'p', *query_pengeluaran(start_date, end_date, limit=per_page)),
+        ('pengeluaran: jenis tujuan', 'p', *query_pengeluaran(start_date, end_date, jenis_tujuan='sekolah',
+                                                              limit=per_page)),
+        ('pengeluaran: ringkasan', 'p', *query_ringkasan_pengeluaran(start_date, end_date)),
+        ('monitoring', 'mk', *query_monitoring(start_date, end_date, limit=per_page)),
+        ('monitoring: per bahan', 'mk', *query_monitoring(start_date, end_date, bahan_id=1, limit=per_page)),
+        ('monitoring: ringkasan', 'mk', *query_ringkasan_monitoring(start_date, end_date)),
+        ('laporan distribusi', 'p', *query_distribusi(KOLOM_DISTRIBUSI_LAPORAN, start_date, end_date,
+                                                      limit=per_page)),
+        ('laporan distribusi: halaman berikutnya', 'p', *query_distribusi(KOLOM_DISTRIBUSI_LAPORAN,
+                                                                          cursor=f"{end_date}_1000000",
+                                                                          limit=per_page)),
+        ('laporan distribusi: ringkasan', 'r', *query_ringkasan_distribusi(start_date, end_date)),
+        ('laporan distribusi: per tujuan', 'r', *query_distribusi_per_tujuan(start_date, end_date)),
+        ('export distribusi excel', 'p', *query_distribusi(KOLOM_DISTRIBUSI_EXPORT, start_date, end_date, 'sekolah')),
+    ]
+
+def explain():
+    """Jalankan EXPLAIN untuk setiap query route dan pastikan tabel utamanya memakai index.
+
+    Optimizer MySQL bisa memilih full scan pada tabel yang sangat kecil, jadi
+    jalankan pengecekan ini pada database dengan data berukuran realistis.
+    """
+    connection = get_connection()
+    cursor = connection.cursor()
+    gagal = 0
+
+    for nama, tabel, query, params in route_queries():
+        cursor.execute("EXPLAIN " + query, params)
+        plan = cursor.fetchall()
+
+        # Urutan baris EXPLAIN mengikuti urutan join pilihan optimizer, jadi cari
+        # baris tabel yang difilter tanggal berdasarkan aliasnya
+        utama = next((baris for baris in plan if baris['table'] == tabel), None)
+        if utama is None:
+            gagal += 1
+            print(f"❌ {nama}: tabel {tabel} tidak ada di hasil EXPLAIN")
+        elif utama['key']:
+            print(f"✅ {nama}: {utama['table']} memakai {utama['key']} ({utama['type']})")
+        else:
+            gagal += 1
+            print(f"❌ {nama}: {utama['table']} tanpa index (type={utama['type']}, rows={utama['rows']})")
+
+    cursor.close()
+    connection.close()
+    return gagal == 0
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+
+    if command == 'migrate':
+        sys.exit(0 if migrate() else 1)
+    elif command == 'status':
+        status()
+    elif command == 'explain':
+        sys.exit(0 if explain() else 1)
+    else:
+        print("Penggunaan: python migrate.py [migrate|status|explain]")
+        sys.exit(1)
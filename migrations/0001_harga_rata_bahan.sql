@@ -0,0 +1,21 @@
+-- Tabel harga rata-rata tertimbang per bahan (valuasi stok)
+-- Diperbarui setiap penerimaan tersimpan, sehingga laporan stok cukup JOIN ke tabel ini
+CREATE TABLE IF NOT EXISTS harga_rata_bahan (
+    bahan_id INT PRIMARY KEY,
+    total_jumlah DECIMAL(15,2) NOT NULL DEFAULT 0,
+    total_nilai DECIMAL(20,2) NOT NULL DEFAULT 0,
+    harga_rata DECIMAL(15,2) NOT NULL DEFAULT 0,
+    last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (bahan_id) REFERENCES bahan(id)
+);
+
+-- Hitung harga rata-rata awal dari data penerimaan yang sudah ada
+INSERT INTO harga_rata_bahan (bahan_id, total_jumlah, total_nilai, harga_rata)
+SELECT bahan_id, SUM(jumlah), SUM(jumlah * harga_satuan), SUM(jumlah * harga_satuan) / SUM(jumlah)
+FROM penerimaan
+WHERE harga_satuan > 0 AND jumlah > 0
+GROUP BY bahan_id
+ON DUPLICATE KEY UPDATE
+    total_jumlah = VALUES(total_jumlah),
+    total_nilai = VALUES(total_nilai),
+    harga_rata = VALUES(harga_rata);
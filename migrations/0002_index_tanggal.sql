@@ -0,0 +1,28 @@
+-- Index untuk filter dan urutan pada route daftar, laporan, dan export
+-- Urutan kolom mengikuti pola query: kolom kesamaan (status/jenis_tujuan/bahan_id)
+-- di depan, lalu kolom rentang tanggal, lalu id sebagai pemecah urutan
+
+-- Penerimaan: daftar (ORDER BY tanggal DESC), total bulanan, grafik per bulan
+CREATE INDEX idx_penerimaan_tanggal ON penerimaan (tanggal, id);
+CREATE INDEX idx_penerimaan_status_tanggal ON penerimaan (status, tanggal);
+
+-- Penerimaan: bahan mendekati kadaluarsa di dashboard
+CREATE INDEX idx_penerimaan_status_kadaluarsa ON penerimaan (status, tanggal_kadaluarsa);
+
+-- Penerimaan: nomor otomatis per hari
+CREATE INDEX idx_penerimaan_created_at ON penerimaan (created_at);
+
+-- Pengeluaran: daftar, laporan distribusi dan export (status != 'draft' ORDER BY tanggal DESC)
+CREATE INDEX idx_pengeluaran_tanggal ON pengeluaran (tanggal, id);
+CREATE INDEX idx_pengeluaran_status_tanggal ON pengeluaran (status, tanggal);
+CREATE INDEX idx_pengeluaran_jenis_tujuan_tanggal ON pengeluaran (jenis_tujuan, tanggal);
+
+-- Pengeluaran: nomor otomatis per hari
+CREATE INDEX idx_pengeluaran_created_at ON pengeluaran (created_at);
+
+-- Monitoring kualitas: daftar dan filter per bahan
+CREATE INDEX idx_monitoring_tanggal_check ON monitoring_kualitas (tanggal_check, id);
+CREATE INDEX idx_monitoring_bahan_tanggal ON monitoring_kualitas (bahan_id, tanggal_check);
+
+-- Bahan aktif diurutkan per nama (dropdown, master bahan, laporan stok)
+CREATE INDEX idx_bahan_status_nama ON bahan (status, nama_bahan);
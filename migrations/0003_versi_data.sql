@@ -0,0 +1,13 @@
+-- Penanda versi data per domain, dinaikkan di transaksi yang sama dengan setiap penulisan
+-- Dipakai sebagai bagian kunci cache hasil export (dan penanda perubahan data lainnya)
+CREATE TABLE IF NOT EXISTS versi_data (
+    nama VARCHAR(50) PRIMARY KEY,
+    versi BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO versi_data (nama) VALUES
+('bahan'),
+('penerimaan'),
+('pengeluaran'),
+('monitoring');
@@ -0,0 +1,17 @@
+-- Urutan nomor dokumen per prefix (TRM/KLR) dan tanggal
+-- Nomor dialokasikan dengan satu increment atomik, menggantikan COUNT(*) per hari
+CREATE TABLE IF NOT EXISTS nomor_urut (
+    prefix VARCHAR(10) NOT NULL,
+    tanggal DATE NOT NULL,
+    nomor_terakhir INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (prefix, tanggal)
+);
+
+-- Lanjutkan dari nomor yang sudah terpakai hari ini (skema lama: jumlah transaksi hari ini)
+INSERT IGNORE INTO nomor_urut (prefix, tanggal, nomor_terakhir)
+SELECT 'TRM', CURDATE(), COUNT(*) FROM penerimaan
+WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY;
+
+INSERT IGNORE INTO nomor_urut (prefix, tanggal, nomor_terakhir)
+SELECT 'KLR', CURDATE(), COUNT(*) FROM pengeluaran
+WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY;
@@ -0,0 +1,53 @@
+-- Kartu stok: setiap perubahan stok dicatat sebagai mutasi (append-only)
+-- jumlah bertanda: positif untuk barang masuk, negatif untuk barang keluar
+CREATE TABLE IF NOT EXISTS mutasi_stok (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    bahan_id INT NOT NULL,
+    tanggal DATE NOT NULL,
+    jenis ENUM('awal', 'masuk', 'keluar', 'koreksi') NOT NULL,
+    jumlah DECIMAL(12,2) NOT NULL,
+    referensi VARCHAR(50),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_mutasi_stok_bahan_tanggal (bahan_id, tanggal, id),
+    FOREIGN KEY (bahan_id) REFERENCES bahan(id)
+);
+
+-- Snapshot saldo stok per bahan pada akhir tanggal tertentu (dibuat berkala)
+-- Stok pada tanggal X = snapshot terakhir <= X + mutasi setelah snapshot s/d X
+CREATE TABLE IF NOT EXISTS snapshot_stok (
+    bahan_id INT NOT NULL,
+    tanggal DATE NOT NULL,
+    saldo DECIMAL(12,2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (bahan_id, tanggal),
+    FOREIGN KEY (bahan_id) REFERENCES bahan(id)
+);
+
+-- Isi kartu stok dari riwayat penerimaan dan pengeluaran yang sudah ada
+INSERT INTO mutasi_stok (bahan_id, tanggal, jenis, jumlah, referensi)
+SELECT bahan_id, tanggal, 'masuk', jumlah, no_penerimaan
+FROM penerimaan
+WHERE status = 'disetujui'
+ORDER BY tanggal, id;
+
+INSERT INTO mutasi_stok (bahan_id, tanggal, jenis, jumlah, referensi)
+SELECT bahan_id, tanggal, 'keluar', -jumlah, no_pengeluaran
+FROM pengeluaran
+WHERE status != 'draft'
+ORDER BY tanggal, id;
+
+-- Selisih riwayat dengan stok saat ini (stok awal tanpa transaksi) dicatat sebagai
+-- saldo awal, satu hari sebelum mutasi pertama bahan tersebut
+INSERT INTO mutasi_stok (bahan_id, tanggal, jenis, jumlah, referensi)
+SELECT s.bahan_id,
+       COALESCE(m.tanggal_pertama - INTERVAL 1 DAY, CURDATE()),
+       'awal',
+       s.jumlah - COALESCE(m.total, 0),
+       'SALDO-AWAL'
+FROM stok s
+LEFT JOIN (
+    SELECT bahan_id, MIN(tanggal) as tanggal_pertama, SUM(jumlah) as total
+    FROM mutasi_stok
+    GROUP BY bahan_id
+) m ON s.bahan_id = m.bahan_id
+WHERE s.jumlah != COALESCE(m.total, 0);
@@ -0,0 +1,47 @@
+-- Stok per lot (no_batch + tanggal kadaluarsa) untuk pengeluaran FEFO
+-- Tabel hanya berisi lot yang masih bersisa: lot yang habis dihapus, riwayatnya
+-- tetap ada di penerimaan dan mutasi_stok. Dengan begitu query kadaluarsa hanya
+-- menyentuh lot yang benar-benar masih ada di gudang.
+CREATE TABLE IF NOT EXISTS lot_stok (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    bahan_id INT NOT NULL,
+    no_penerimaan VARCHAR(50),
+    no_batch VARCHAR(100),
+    tanggal_kadaluarsa DATE,
+    jumlah_awal DECIMAL(10,2) NOT NULL,
+    sisa DECIMAL(10,2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_lot_stok_fefo (bahan_id, tanggal_kadaluarsa, id),
+    INDEX idx_lot_stok_kadaluarsa (tanggal_kadaluarsa),
+    FOREIGN KEY (bahan_id) REFERENCES bahan(id)
+);
+
+-- Isi lot dari penerimaan yang sudah disetujui. Dengan asumsi barang keluar secara
+-- FEFO, stok saat ini berada di lot dengan kadaluarsa paling akhir: sisa tiap lot
+-- adalah stok dikurangi jumlah lot yang kadaluarsanya lebih akhir (tanpa tanggal
+-- kadaluarsa dianggap paling akhir).
+INSERT INTO lot_stok (bahan_id, no_penerimaan, no_batch, tanggal_kadaluarsa, jumlah_awal, sisa)
+SELECT p.bahan_id, p.no_penerimaan, p.no_batch, p.tanggal_kadaluarsa, p.jumlah,
+       LEAST(p.jumlah, s.jumlah - COALESCE((
+           SELECT SUM(q.jumlah) FROM penerimaan q
+           WHERE q.bahan_id = p.bahan_id AND q.status = 'disetujui'
+             AND (COALESCE(q.tanggal_kadaluarsa, '9999-12-31') > COALESCE(p.tanggal_kadaluarsa, '9999-12-31')
+                  OR (COALESCE(q.tanggal_kadaluarsa, '9999-12-31') = COALESCE(p.tanggal_kadaluarsa, '9999-12-31')
+                      AND q.id > p.id))
+       ), 0)) as sisa
+FROM penerimaan p
+JOIN stok s ON p.bahan_id = s.bahan_id
+WHERE p.status = 'disetujui'
+HAVING sisa > 0;
+
+-- Stok yang tidak berasal dari penerimaan (stok awal) dicatat sebagai lot tanpa kadaluarsa
+INSERT INTO lot_stok (bahan_id, no_penerimaan, no_batch, tanggal_kadaluarsa, jumlah_awal, sisa)
+SELECT s.bahan_id, NULL, 'SALDO-AWAL', NULL,
+       s.jumlah - COALESCE(l.total, 0), s.jumlah - COALESCE(l.total, 0)
+FROM stok s
+LEFT JOIN (
+    SELECT bahan_id, SUM(sisa) as total
+    FROM lot_stok
+    GROUP BY bahan_id
+) l ON s.bahan_id = l.bahan_id
+WHERE s.jumlah > COALESCE(l.total, 0);
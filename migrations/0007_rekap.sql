@@ -0,0 +1,46 @@
+-- Rekap harian dan bulanan penerimaan/pengeluaran per bahan dan jenis tujuan
+-- Diperbarui dalam transaksi yang sama dengan setiap penerimaan/pengeluaran, sehingga
+-- grafik dan ringkasan laporan cukup membaca baris rekap. Rekap per kategori
+-- didapat dengan JOIN ke bahan. Bangun ulang: flask --app app rekap-ulang
+-- jenis_tujuan diisi '' untuk penerimaan.
+CREATE TABLE IF NOT EXISTS rekap_harian (
+    jenis ENUM('penerimaan', 'pengeluaran') NOT NULL,
+    tanggal DATE NOT NULL,
+    bahan_id INT NOT NULL,
+    jenis_tujuan VARCHAR(20) NOT NULL DEFAULT '',
+    jumlah DECIMAL(14,2) NOT NULL DEFAULT 0,
+    jumlah_transaksi INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (jenis, tanggal, bahan_id, jenis_tujuan),
+    FOREIGN KEY (bahan_id) REFERENCES bahan(id)
+);
+
+-- bulan = tanggal 1 pada bulan tersebut
+CREATE TABLE IF NOT EXISTS rekap_bulanan (
+    jenis ENUM('penerimaan', 'pengeluaran') NOT NULL,
+    bulan DATE NOT NULL,
+    bahan_id INT NOT NULL,
+    jenis_tujuan VARCHAR(20) NOT NULL DEFAULT '',
+    jumlah DECIMAL(14,2) NOT NULL DEFAULT 0,
+    jumlah_transaksi INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (jenis, bulan, bahan_id, jenis_tujuan),
+    FOREIGN KEY (bahan_id) REFERENCES bahan(id)
+);
+
+-- Isi rekap dari riwayat transaksi yang sudah ada
+INSERT INTO rekap_harian (jenis, tanggal, bahan_id, jenis_tujuan, jumlah, jumlah_transaksi)
+SELECT 'penerimaan', tanggal, bahan_id, '', SUM(jumlah), COUNT(*)
+FROM penerimaan
+WHERE status = 'disetujui'
+GROUP BY tanggal, bahan_id;
+
+INSERT INTO rekap_harian (jenis, tanggal, bahan_id, jenis_tujuan, jumlah, jumlah_transaksi)
+SELECT 'pengeluaran', tanggal, bahan_id, COALESCE(jenis_tujuan, ''), SUM(jumlah), COUNT(*)
+FROM pengeluaran
+WHERE status != 'draft'
+GROUP BY tanggal, bahan_id, COALESCE(jenis_tujuan, '');
+
+INSERT INTO rekap_bulanan (jenis, bulan, bahan_id, jenis_tujuan, jumlah, jumlah_transaksi)
+SELECT jenis, tanggal - INTERVAL (DAY(tanggal) - 1) DAY, bahan_id, jenis_tujuan,
+       SUM(jumlah), SUM(jumlah_transaksi)
+FROM rekap_harian
+GROUP BY jenis, tanggal - INTERVAL (DAY(tanggal) - 1) DAY, bahan_id, jenis_tujuan;
@@ -19,7 +19,7 @@ def create_database():
             cursor = connection.cursor()
             
             # Baca file SQL
-            with open('database.sql', 'r', encoding='utf-8') as file:
+            with open('sppg_database.sql', 'r', encoding='utf-8') as file:
                 sql_script = file.read()
             
             # Eksekusi perintah SQL
@@ -44,6 +44,13 @@ def install_dependencies():
     except subprocess.CalledProcessError as e:
         print(f"❌ Error install dependencies: {e}")
 
+def run_migrations():
+    """Menjalankan migrasi skema (folder migrations/)"""
+    try:
+        subprocess.check_call([sys.executable, "migrate.py"])
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Error migrasi database: {e}")
+
 def create_folders():
     """Membuat folder yang diperlukan"""
     folders = ['static/css', 'static/js', 'templates']
@@ -66,6 +73,9 @@ if __name__ == "__main__":
     print("\n3. Membuat database...")
     create_database()
     
+    print("\n4. Menjalankan migrasi database...")
+    run_migrations()
+    
     print("\n" + "="*40)
     print("✅ Setup selesai!")
     print("\nJalankan aplikasi dengan:")
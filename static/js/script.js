@@ -1,16 +1,14 @@
 // Dashboard Charts
 document.addEventListener('DOMContentLoaded', function() {
-    // Inisialisasi semua chart jika kita berada di dashboard
+    // Inisialisasi semua chart jika kita berada di dashboard, lalu perbarui berkala
     if (document.getElementById('chartStokKategori')) {
-        loadStokKategoriChart();
+        loadDashboard();
+        setInterval(loadDashboard, DASHBOARD_POLL_INTERVAL);
     }
     
-    if (document.getElementById('chartDistribusiTujuan')) {
-        loadDistribusiTujuanChart();
-    }
-    
-    if (document.getElementById('chartPenerimaanBulanan')) {
-        loadPenerimaanBulananChart();
+    // Perbarui angka stok/KPI di halaman secara langsung dari server (SSE)
+    if (document.querySelector('[data-kpi], [data-stok-bahan]')) {
+        sambungkanSiaran();
     }
     
     // Datepicker untuk filter tanggal
@@ -83,57 +81,174 @@ function formatNumber(value) {
     return new Intl.NumberFormat('id-ID').format(value);
 }
 
-// Load chart stok per kategori
-function loadStokKategoriChart() {
-    fetch('/api/stok-per-kategori')
+// Data dashboard diambil dari satu endpoint /api/dashboard. Respons membawa ETag,
+// jadi polling saat data belum berubah hanya dijawab 304 oleh server.
+const DASHBOARD_POLL_INTERVAL = 60000;
+const dashboardCharts = {};
+let versiDashboard = null;
+
+function loadDashboard() {
+    fetch('/api/dashboard')
         .then(response => response.json())
         .then(data => {
-            const ctx = document.getElementById('chartStokKategori').getContext('2d');
-            new Chart(ctx, {
-                type: 'doughnut',
-                data: {
-                    labels: data.labels,
-                    datasets: [{
-                        label: 'Stok per Kategori',
-                        data: data.values,
-                        backgroundColor: [
-                            '#3498db', '#2ecc71', '#e74c3c', '#f39c12',
-                            '#9b59b6', '#1abc9c', '#34495e', '#95a5a6'
-                        ],
-                        borderWidth: 1
-                    }]
-                },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    plugins: {
-                        legend: {
-                            display: true,
-                            position: 'right'
-                        },
-                        tooltip: {
-                            callbacks: {
-                                label: function(context) {
-                                    return context.label + ': ' + formatNumber(context.raw);
-                                }
-                            }
-                        }
-                    }
+            // Respons 304 diteruskan browser sebagai respons lama: tidak perlu digambar ulang
+            if (data.versi === versiDashboard) {
+                return;
+            }
+            versiDashboard = data.versi;
+            
+            Object.entries(data.kpi).forEach(([nama, nilai]) => {
+                const el = document.querySelector(`[data-kpi="${nama}"]`);
+                if (el) {
+                    el.dataset.nilai = nilai;
+                    el.textContent = formatNumber(nilai);
                 }
             });
+            
+            renderStokKategoriChart(data.stok_per_kategori);
+            renderDistribusiTujuanChart(data.distribusi_per_tujuan);
+            renderPenerimaanBulananChart(data.penerimaan_per_bulan);
         });
 }
 
-// Load chart distribusi per tujuan
-function loadDistribusiTujuanChart() {
-    // Data dari backend (kita bisa buat API juga, tapi untuk sekarang pakai data statis)
-    const data = {
-        labels: ['Sekolah', 'Posyandu', 'Puskesmas', 'Rumah Sakit', 'Lainnya'],
-        values: [45, 25, 15, 10, 5]
+// Event dari /api/stream:
+// - kpi: selisih angka KPI dari transaksi yang baru di-commit
+// - stok: stok terbaru satu bahan
+// - monitoring: hasil monitoring kualitas baru
+// - versi: data berubah (termasuk dari worker lain) atau event terlewat saat tersambung ulang,
+//   chart dashboard dimuat ulang
+function sambungkanSiaran() {
+    if (!window.EventSource) {
+        return;
+    }
+    
+    const sumber = new EventSource('/api/stream');
+    
+    sumber.addEventListener('kpi', function(e) {
+        const data = JSON.parse(e.data);
+        Object.entries(data.delta).forEach(([nama, selisih]) => {
+            const el = document.querySelector(`[data-kpi="${nama}"]`);
+            if (el) {
+                el.dataset.nilai = (parseFloat(el.dataset.nilai) || 0) + selisih;
+                el.textContent = formatNumber(el.dataset.nilai);
+            }
+        });
+    });
+    
+    sumber.addEventListener('stok', function(e) {
+        const data = JSON.parse(e.data);
+        document.querySelectorAll(`[data-stok-bahan="${data.bahan_id}"]`).forEach(el => {
+            el.textContent = formatNumber(data.jumlah);
+            el.style.backgroundColor = data.delta < 0 ? '#fdecea' : '#e8f8f0';
+            setTimeout(() => { el.style.backgroundColor = ''; }, 2000);
+        });
+    });
+    
+    sumber.addEventListener('monitoring', function(e) {
+        tambahBarisMonitoring(JSON.parse(e.data));
+    });
+    
+    sumber.addEventListener('versi', function() {
+        if (document.getElementById('chartStokKategori')) {
+            loadDashboard();
+        }
+    });
+}
+
+const BADGE_KONDISI_FISIK = {
+    sangat_baik: ['bg-success', 'Sangat Baik'],
+    baik: ['bg-primary', 'Baik'],
+    cukup: ['bg-warning', 'Cukup'],
+    buruk: ['bg-danger', 'Buruk']
+};
+
+const BADGE_STATUS_KADALUARSA = {
+    aman: ['bg-success', 'Aman'],
+    mendekati: ['bg-warning', 'Mendekati'],
+    kadaluarsa: ['bg-danger', 'Kadaluarsa']
+};
+
+// Tambahkan hasil monitoring baru di atas tabel monitoring dashboard (maksimal 5 baris)
+function tambahBarisMonitoring(data) {
+    const tbody = document.getElementById('monitoring-terbaru');
+    if (!tbody) {
+        return;
+    }
+    
+    const badge = (peta, nilai) => {
+        const [kelas, label] = peta[nilai] || ['bg-danger', nilai];
+        const span = document.createElement('span');
+        span.className = 'badge ' + kelas;
+        span.textContent = label;
+        return span;
     };
     
-    const ctx = document.getElementById('chartDistribusiTujuan').getContext('2d');
-    new Chart(ctx, {
+    const row = tbody.insertRow(0);
+    row.insertCell().textContent = data.tanggal_check;
+    row.insertCell().textContent = data.nama_bahan;
+    row.insertCell().appendChild(badge(BADGE_KONDISI_FISIK, data.kondisi_fisik));
+    row.insertCell().appendChild(badge(BADGE_STATUS_KADALUARSA, data.status_kadaluarsa));
+    row.insertCell().textContent = data.petugas;
+    
+    while (tbody.rows.length > 5) {
+        tbody.deleteRow(-1);
+    }
+}
+
+// Buat chart baru, atau ganti datanya jika chart sudah ada
+function tampilkanChart(id, config) {
+    const canvas = document.getElementById(id);
+    if (!canvas) {
+        return;
+    }
+    
+    if (dashboardCharts[id]) {
+        dashboardCharts[id].data = config.data;
+        dashboardCharts[id].update();
+    } else {
+        dashboardCharts[id] = new Chart(canvas.getContext('2d'), config);
+    }
+}
+
+// Chart stok per kategori
+function renderStokKategoriChart(data) {
+    tampilkanChart('chartStokKategori', {
+        type: 'doughnut',
+        data: {
+            labels: data.labels,
+            datasets: [{
+                label: 'Stok per Kategori',
+                data: data.values,
+                backgroundColor: [
+                    '#3498db', '#2ecc71', '#e74c3c', '#f39c12',
+                    '#9b59b6', '#1abc9c', '#34495e', '#95a5a6'
+                ],
+                borderWidth: 1
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: {
+                    display: true,
+                    position: 'right'
+                },
+                tooltip: {
+                    callbacks: {
+                        label: function(context) {
+                            return context.label + ': ' + formatNumber(context.raw);
+                        }
+                    }
+                }
+            }
+        }
+    });
+}
+
+// Chart distribusi per tujuan
+function renderDistribusiTujuanChart(data) {
+    tampilkanChart('chartDistribusiTujuan', {
         type: 'bar',
         data: {
             labels: data.labels,
@@ -168,55 +283,50 @@ function loadDistribusiTujuanChart() {
     });
 }
 
-// Load chart penerimaan bulanan
-function loadPenerimaanBulananChart() {
-    fetch('/api/penerimaan-per-bulan')
-        .then(response => response.json())
-        .then(data => {
-            const ctx = document.getElementById('chartPenerimaanBulanan').getContext('2d');
-            new Chart(ctx, {
-                type: 'line',
-                data: {
-                    labels: data.labels,
-                    datasets: [{
-                        label: 'Penerimaan Bulanan',
-                        data: data.values,
-                        borderColor: '#3498db',
-                        backgroundColor: 'rgba(52, 152, 219, 0.1)',
-                        borderWidth: 3,
-                        fill: true,
-                        tension: 0.4
-                    }]
+// Chart penerimaan bulanan
+function renderPenerimaanBulananChart(data) {
+    tampilkanChart('chartPenerimaanBulanan', {
+        type: 'line',
+        data: {
+            labels: data.labels,
+            datasets: [{
+                label: 'Penerimaan Bulanan',
+                data: data.values,
+                borderColor: '#3498db',
+                backgroundColor: 'rgba(52, 152, 219, 0.1)',
+                borderWidth: 3,
+                fill: true,
+                tension: 0.4
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: {
+                    display: true,
+                    position: 'top'
                 },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    plugins: {
-                        legend: {
-                            display: true,
-                            position: 'top'
-                        },
-                        tooltip: {
-                            callbacks: {
-                                label: function(context) {
-                                    return formatNumber(context.raw);
-                                }
-                            }
+                tooltip: {
+                    callbacks: {
+                        label: function(context) {
+                            return formatNumber(context.raw);
                         }
-                    },
-                    scales: {
-                        y: {
-                            beginAtZero: true,
-                            ticks: {
-                                callback: function(value) {
-                                    return formatNumber(value);
-                                }
-                            }
+                    }
+                }
+            },
+            scales: {
+                y: {
+                    beginAtZero: true,
+                    ticks: {
+                        callback: function(value) {
+                            return formatNumber(value);
                         }
                     }
                 }
-            });
-        });
+            }
+        }
+    });
 }
 
 // Fungsi untuk print laporan
@@ -263,6 +373,101 @@ function exportToCSV() {
     document.body.removeChild(link);
 }
 
+// Export di latar belakang: kirim job, pantau statusnya, lalu unduh hasilnya.
+// Jika job gagal atau tidak ditemukan, pakai link export biasa.
+function jalankanExportJob(link) {
+    const url = new URL(link.href, window.location.origin);
+    const body = new FormData();
+    body.append('jenis', link.dataset.exportJob);
+    url.searchParams.forEach((value, key) => body.append(key, value));
+    
+    const labelAsli = link.innerHTML;
+    link.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Memproses...';
+    
+    function pantau(job) {
+        if (job.status === 'selesai') {
+            link.innerHTML = labelAsli;
+            window.location = job.download_url;
+            return;
+        }
+        if (job.status === 'gagal' || !job.status_url) {
+            throw new Error(job.error || 'Export gagal');
+        }
+        return new Promise(resolve => setTimeout(resolve, 1000))
+            .then(() => fetch(job.status_url))
+            .then(response => response.json())
+            .then(pantau);
+    }
+    
+    fetch('/export-jobs', { method: 'POST', body: body })
+        .then(response => response.json())
+        .then(pantau)
+        .catch(() => {
+            link.innerHTML = labelAsli;
+            window.location = link.href;
+        });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-export-job]').forEach(link => {
+        link.addEventListener('click', function(e) {
+            e.preventDefault();
+            jalankanExportJob(this);
+        });
+    });
+});
+
+// Autocomplete bahan: input [data-cari-bahan] mengisi <select name="bahan_id"> di
+// wadah yang sama dengan hasil /api/bahan/cari, jadi pilihan dimuat saat mengetik.
+// data-cari-bahan="stok" menampilkan stok saat ini di setiap pilihan.
+function cariBahan(input) {
+    const select = input.closest('td, .form-group').querySelector('select[name="bahan_id"]');
+    const url = new URL('/api/bahan/cari', window.location.origin);
+    url.searchParams.set('q', input.value);
+    if (input.dataset.cariBahan === 'stok') {
+        url.searchParams.set('stok', '1');
+    }
+    
+    fetch(url)
+        .then(response => response.json())
+        .then(hasil => {
+            // Abaikan hasil lama jika pengguna sudah mengetik lagi
+            if (input.value !== url.searchParams.get('q')) {
+                return;
+            }
+            
+            select.innerHTML = '';
+            select.add(new Option(hasil.data.length ? 'Pilih Bahan' : 'Bahan tidak ditemukan', ''));
+            hasil.data.forEach(bahan => {
+                const option = new Option(`${bahan.kode_bahan} - ${bahan.nama_bahan}`, bahan.id);
+                option.dataset.satuan = bahan.nama_satuan;
+                option.dataset.satuanId = bahan.satuan_id;
+                if ('stok_sekarang' in bahan) {
+                    option.dataset.stok = bahan.stok_sekarang;
+                    option.text += ` (Stok: ${formatNumber(bahan.stok_sekarang)} ${bahan.nama_satuan})`;
+                }
+                select.add(option);
+            });
+            
+            if (hasil.data.length === 1) {
+                select.value = hasil.data[0].id;
+            }
+            select.dispatchEvent(new Event('change', { bubbles: true }));
+        });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    let timer = null;
+    document.addEventListener('input', function(e) {
+        if (e.target.matches('[data-cari-bahan]')) {
+            clearTimeout(timer);
+            timer = setTimeout(() => cariBahan(e.target), 200);
+        }
+    });
+    
+    document.querySelectorAll('[data-cari-bahan]').forEach(cariBahan);
+});
+
 // Validasi form
 function validateForm(formId) {
     const form = document.getElementById(formId);
@@ -0,0 +1,145 @@
+# tests/conftest.py
+"""Fixture bersama: aplikasi Flask dengan koneksi database palsu.
+
+Test tidak membutuhkan server MySQL. FakeConnection mencatat setiap query dan
+meneruskannya ke `handler(query, args)` milik test, yang mengembalikan daftar
+baris (SELECT) atau jumlah baris terpengaruh (int, untuk UPDATE/DELETE).
+"""
+import pytest
+
+import app as aplikasi
+
+
+def rapikan(query):
+    return ' '.join(query.split())
+
+
+class FakeCursor:
+    def __init__(self, koneksi):
+        self.koneksi = koneksi
+        self.rows = []
+        self.rowcount = 0
+        self.lastrowid = koneksi.lastrowid
+        self.description = None
+
+    def _jalankan(self, query, args):
+        hasil = self.koneksi.handler(query, args)
+        if isinstance(hasil, int):
+            return [], hasil
+        rows = list(hasil or [])
+        return rows, len(rows)
+
+    def execute(self, query, args=None):
+        query = rapikan(query)
+        self.koneksi.log.append((query, args))
+        self.rows, self.rowcount = self._jalankan(query, args)
+        self.lastrowid = self.koneksi.lastrowid
+        return self.rowcount
+
+    def executemany(self, query, args):
+        query, args = rapikan(query), list(args)
+        self.koneksi.log.append((query, args))
+        self.rows, self.rowcount = [], sum(self._jalankan(query, item)[1] for item in args)
+        return self.rowcount
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def __iter__(self):
+        while self.rows:
+            yield self.rows.pop(0)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.handler = lambda query, args: []
+        self.log = []
+        self.lastrowid = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+    def query(self, awalan):
+        """Query di log yang diawali `awalan` (sudah dirapikan), beserta argumennya"""
+        return [(query, args) for query, args in self.log if query.startswith(awalan)]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Koneksi primary palsu; routing replika di MySQLPool.connection tetap berjalan"""
+    koneksi = FakeConnection()
+    monkeypatch.setattr(aplikasi.MySQL, 'connection', property(lambda self: koneksi))
+    monkeypatch.setitem(aplikasi.app.config, 'TESTING', True)
+    aplikasi._referensi_cache.clear()
+    return koneksi
+
+
+@pytest.fixture
+def replika(db, monkeypatch):
+    """Replika baca palsu di belakang pool mysql_replika; lag diatur lewat koneksi.lag"""
+    koneksi = FakeConnection()
+    koneksi.lag = 0
+    
+    def handler(query, args):
+        return []
+    koneksi.handler_replika = handler
+    
+    def jawab(query, args):
+        if query == 'SHOW REPLICA STATUS':
+            return [{'Seconds_Behind_Source': koneksi.lag}]
+        return koneksi.handler_replika(query, args)
+    koneksi.handler = jawab
+    
+    pool = aplikasi.mysql_replika
+    monkeypatch.setitem(aplikasi.app.config, 'MYSQL_REPLICA_HOST', 'replika.test')
+    monkeypatch.setattr(pool, '_buka_koneksi', lambda: (koneksi, aplikasi.time.monotonic()))
+    for nama, nilai in (('_idle', aplikasi.deque()), ('_terbuka', 0), ('_dipakai', 0),
+                        ('_statistik', dict.fromkeys(pool._statistik, 0)),
+                        ('_status', {'sehat': False, 'lag': None, 'error': None, 'dicek': None}),
+                        ('_cek_berikutnya', 0.0)):
+        monkeypatch.setattr(pool, nama, nilai)
+    return koneksi
+
+
+@pytest.fixture
+def client(db):
+    return aplikasi.app.test_client()
+
+
+@pytest.fixture
+def masuk(client):
+    """Login sebagai role tertentu lewat session test client"""
+    def login(role='admin'):
+        with client.session_transaction() as sesi:
+            sesi['logged_in'] = True
+            sesi['user_id'] = 1
+            sesi['username'] = role
+            sesi['nama_lengkap'] = role.title()
+            sesi['role'] = role
+        return client
+    return login
@@ -0,0 +1,98 @@
+# tests/test_cari_bahan.py
+import pytest
+
+import app as aplikasi
+
+BAHAN = [
+    ('GLA-01', 'Gula Pasir'),
+    ('BRS', 'Beras Merah'),
+    ('TPG', 'Tepung Beras'),
+    ('BRS-2', 'Beras Putih'),
+    ('SYR', 'Sayur Bayam'),
+    ('MNY', 'Minyak Goreng'),
+]
+
+
+@pytest.fixture
+def bahan(db):
+    rows = [{'id': nomor, 'kode_bahan': kode, 'nama_bahan': nama, 'satuan_id': 1}
+            for nomor, (kode, nama) in enumerate(BAHAN, start=1)]
+
+    def handler(query, args):
+        if query.startswith('SELECT * FROM bahan WHERE status'):
+            return rows
+        if query.startswith('SELECT b.*'):
+            ids = set(args or []) or {row['id'] for row in rows}
+            return [dict(row, stok_sekarang=0, stok_minimum=0) for row in rows if row['id'] in ids]
+        return []
+    db.handler = handler
+    return rows
+
+
+def nama(hasil):
+    return [row['nama_bahan'] for row in hasil]
+
+
+def test_peringkat_kode_sama_awalan_awal_kata_lalu_potongan(bahan):
+    # BRS: kode persis; BRS-2: awalan kode; "Beras ..." tidak cocok "brs"
+    assert nama(aplikasi.cari_bahan('brs')) == ['Beras Merah', 'Beras Putih']
+    # Awalan nama (Beras Merah, Beras Putih) sebelum awal kata (Tepung Beras)
+    assert nama(aplikasi.cari_bahan('beras')) == ['Beras Merah', 'Beras Putih', 'Tepung Beras']
+    # Potongan di tengah kata paling akhir, urut sesuai data
+    assert nama(aplikasi.cari_bahan('ya')) == ['Sayur Bayam', 'Minyak Goreng']
+
+
+def test_cari_tanpa_beda_huruf_besar_dan_spasi(bahan):
+    assert nama(aplikasi.cari_bahan('  GULA   pasir ')) == ['Gula Pasir']
+
+
+def test_kata_tanpa_trigram_cocok(bahan):
+    assert aplikasi.cari_bahan('xyz') == []
+    assert aplikasi.cari_bahan('%%%') == []
+
+
+def test_limit_dan_kata_kosong(bahan):
+    assert nama(aplikasi.cari_bahan('beras', 2)) == ['Beras Merah', 'Beras Putih']
+    assert len(aplikasi.cari_bahan('   ')) == len(BAHAN)
+    assert len(aplikasi.cari_bahan('', 3)) == 3
+
+
+def test_indeks_dibangun_ulang_saat_referensi_dimuat_ulang(db, bahan):
+    assert aplikasi.cari_bahan('kedelai') == []
+    bahan.append({'id': 7, 'kode_bahan': 'KDL', 'nama_bahan': 'Kedelai', 'satuan_id': 1})
+
+    aplikasi.invalidasi_referensi('bahan_aktif')
+
+    assert nama(aplikasi.cari_bahan('kedelai')) == ['Kedelai']
+
+
+def test_master_bahan_kata_kunci_spasi_tanpa_filter(db, bahan, masuk):
+    respons = masuk('gudang').get('/master-bahan?keyword=%20%20')
+
+    assert respons.status_code == 200
+    [(query, params)] = db.query('SELECT b.*')
+    assert 'b.id IN' not in query
+    assert params == []
+
+
+def test_master_bahan_memfilter_id_hasil_pencarian(db, bahan, masuk):
+    respons = masuk('gudang').get('/master-bahan?keyword=beras')
+
+    assert respons.status_code == 200
+    [(query, params)] = db.query('SELECT b.*')
+    assert 'b.id IN (%s, %s, %s)' in query
+    assert params == [2, 4, 3]
+
+
+def test_master_bahan_tanpa_hasil_tidak_query(db, bahan, masuk):
+    respons = masuk('gudang').get('/master-bahan?keyword=xyz')
+
+    assert respons.status_code == 200
+    assert db.query('SELECT b.*') == []
+
+
+def test_api_cari_limit_dibatasi(db, bahan, masuk):
+    client = masuk('gudang')
+
+    assert len(client.get('/api/bahan/cari?q=beras&limit=-1').get_json()['data']) == 1
+    assert len(client.get('/api/bahan/cari?q=beras&limit=2').get_json()['data']) == 2
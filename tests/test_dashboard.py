@@ -0,0 +1,149 @@
+# tests/test_dashboard.py
+import pytest
+
+import app as aplikasi
+
+
+@pytest.fixture
+def snapshot(db, monkeypatch):
+    monkeypatch.setattr(aplikasi, '_dashboard_snapshot', {'data': {}, 'built_at': None, 'tanggal': None,
+                                                          'dirty': set(), 'versi': {}, 'membangun': 0})
+    dipanggil = []
+    
+    def bagian(nama):
+        def hitung(cur):
+            # Query bagian dashboard tidak boleh berjalan sambil memegang lock proses
+            assert not aplikasi._dashboard_lock.locked()
+            dipanggil.append(nama)
+            return 10
+        return hitung
+    
+    monkeypatch.setattr(aplikasi, 'DASHBOARD_SECTIONS', {nama: bagian(nama) for nama in aplikasi.DASHBOARD_SECTIONS})
+    return dipanggil
+
+
+def test_snapshot_dibangun_sekali_lalu_dipakai_ulang(snapshot):
+    with aplikasi.app.test_request_context():
+        data = aplikasi.get_dashboard_snapshot()
+        assert set(data) == set(aplikasi.DASHBOARD_SECTIONS)
+        assert len(snapshot) == len(aplikasi.DASHBOARD_SECTIONS)
+        
+        aplikasi.get_dashboard_snapshot()
+        assert len(snapshot) == len(aplikasi.DASHBOARD_SECTIONS)
+
+
+def test_delta_dan_bagian_dirty(snapshot):
+    with aplikasi.app.test_request_context():
+        aplikasi.get_dashboard_snapshot()
+        snapshot.clear()
+        
+        aplikasi.perbarui_snapshot_dashboard({'total_stok': 5}, ['bahan_hampir_habis'])
+        data = aplikasi.get_dashboard_snapshot()
+    
+    assert data['total_stok'] == 15
+    assert snapshot == ['bahan_hampir_habis']
+
+
+def test_perubahan_selama_dibangun_tetap_dirty(snapshot, monkeypatch):
+    asli = aplikasi.DASHBOARD_SECTIONS['total_bahan']
+    
+    def commit_bersamaan(cur):
+        aplikasi.perbarui_snapshot_dashboard({'total_stok': 3}, ['monitoring_terbaru'])
+        return asli(cur)
+    monkeypatch.setitem(aplikasi.DASHBOARD_SECTIONS, 'total_bahan', commit_bersamaan)
+    
+    with aplikasi.app.test_request_context():
+        aplikasi.get_dashboard_snapshot()
+    
+    # Hasil query bisa belum memuat transaksi tadi, jadi dihitung ulang saat dibuka berikutnya
+    assert aplikasi._dashboard_snapshot['dirty'] == {'total_stok', 'monitoring_terbaru'}
+    assert aplikasi._dashboard_snapshot['membangun'] == 0
+
+
+def test_gagal_membangun_bagian_tetap_dirty(snapshot, monkeypatch):
+    with aplikasi.app.test_request_context():
+        aplikasi.get_dashboard_snapshot()
+        aplikasi.perbarui_snapshot_dashboard(sections=['monitoring_terbaru'])
+        
+        def rusak(cur):
+            raise RuntimeError('koneksi putus')
+        monkeypatch.setitem(aplikasi.DASHBOARD_SECTIONS, 'monitoring_terbaru', rusak)
+        with pytest.raises(RuntimeError):
+            aplikasi.get_dashboard_snapshot()
+    
+    assert aplikasi._dashboard_snapshot['dirty'] == {'monitoring_terbaru'}
+    assert aplikasi._dashboard_snapshot['membangun'] == 0
+
+
+@pytest.fixture
+def api_dashboard(db, snapshot, monkeypatch):
+    """versi_data di memori; bagian dashboard palsu mengembalikan data berbentuk benar"""
+    versi = dict.fromkeys(aplikasi.SECTIONS_PER_VERSI, 1)
+    
+    def handler(query, args):
+        if query.startswith('SELECT nama, versi FROM versi_data'):
+            return [{'nama': nama, 'versi': versi[nama]} for nama in args]
+        if query.startswith('UPDATE versi_data SET versi = versi + 1'):
+            for nama in args:
+                versi[nama] += 1
+            return len(args)
+        return []
+    db.handler = handler
+    
+    kpi = ('total_bahan', 'total_stok', 'total_penerimaan', 'total_pengeluaran')
+    for nama in aplikasi.DASHBOARD_SECTIONS:
+        if nama not in kpi:
+            monkeypatch.setitem(aplikasi.DASHBOARD_SECTIONS, nama,
+                                lambda cur, nama=nama: snapshot.append(nama) or [])
+    return versi
+
+
+def test_api_dashboard_etag_dan_304(api_dashboard, snapshot, masuk):
+    client = masuk('admin')
+    
+    respons = client.get('/api/dashboard')
+    assert respons.status_code == 200
+    etag = respons.headers['ETag'].strip('"')
+    assert etag == respons.get_json()['versi']
+    assert etag.endswith('-1-1-1-1')
+    assert respons.headers['Cache-Control'] == 'private, no-cache'
+    
+    snapshot.clear()
+    respons = client.get('/api/dashboard', headers={'If-None-Match': f'"{etag}"'})
+    assert respons.status_code == 304
+    assert respons.get_data() == b''
+    assert respons.headers['ETag'].strip('"') == etag
+    # Polling tanpa perubahan tidak membangun bagian dashboard apa pun
+    assert snapshot == []
+
+
+def test_api_dashboard_etag_baru_setelah_tulis(api_dashboard, snapshot, masuk):
+    client = masuk('admin')
+    etag = client.get('/api/dashboard').headers['ETag']
+    
+    respons = client.post('/tambah-bahan', data={'kode_bahan': 'GLA', 'nama_bahan': 'Gula',
+                                                  'kategori_id': '1', 'satuan_id': '1'})
+    assert respons.status_code == 302
+    assert api_dashboard['bahan'] == 2
+    
+    snapshot.clear()
+    respons = client.get('/api/dashboard', headers={'If-None-Match': etag})
+    assert respons.status_code == 200
+    assert respons.headers['ETag'] != etag
+    assert respons.headers['ETag'].strip('"').endswith('-2-1-1-1')
+    # Bagian yang bergantung pada versi bahan dihitung ulang dari database
+    assert sorted(snapshot) == sorted(aplikasi.SECTIONS_PER_VERSI['bahan'])
+
+
+def test_api_dashboard_versi_dari_worker_lain(api_dashboard, snapshot, masuk):
+    client = masuk('admin')
+    etag = client.get('/api/dashboard').headers['ETag']
+    snapshot.clear()
+    
+    # Worker lain menulis monitoring: hanya bagian yang bergantung pada versi itu dibangun ulang
+    api_dashboard['monitoring'] += 1
+    respons = client.get('/api/dashboard', headers={'If-None-Match': etag})
+    
+    assert respons.status_code == 200
+    assert respons.headers['ETag'] != etag
+    assert snapshot == ['monitoring_terbaru']
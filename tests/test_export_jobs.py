@@ -0,0 +1,161 @@
+# tests/test_export_jobs.py
+import os
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import app as aplikasi
+
+
+class ExecutorLangsung:
+    """Executor yang menjalankan job saat itu juga, supaya test tidak menunggu thread"""
+    
+    def submit(self, fungsi, *args):
+        future = Future()
+        future.set_result(fungsi(*args))
+        return future
+
+
+@pytest.fixture
+def export(db, tmp_path, monkeypatch):
+    monkeypatch.setitem(aplikasi.app.config, 'EXPORT_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(aplikasi, '_export_jobs', {})
+    monkeypatch.setattr(aplikasi, 'get_export_executor', lambda: ExecutorLangsung())
+    
+    versi = {'bahan': 1, 'penerimaan': 1, 'pengeluaran': 1}
+    db.handler = lambda query, args: ([{'nama': nama, 'versi': versi[nama]} for nama in args]
+                                      if query.startswith('SELECT nama, versi FROM versi_data') else [])
+    
+    dibuat = []
+    def buat(file, **filters):
+        dibuat.append(filters)
+        file.write(b'%PDF-palsu')
+    monkeypatch.setitem(aplikasi.EXPORT_JOBS['stok_pdf'], 'build', buat)
+    return {'versi': versi, 'dibuat': dibuat, 'dir': tmp_path}
+
+
+def test_kunci_job_dari_jenis_filter_dan_versi():
+    kunci = aplikasi.kunci_export_job
+    filters = {'kategori_id': '1', 'stok_minimum': ''}
+    
+    assert kunci('stok_pdf', filters, {'bahan': 1}) == kunci('stok_pdf', dict(reversed(filters.items())), {'bahan': 1})
+    assert kunci('stok_pdf', filters, {'bahan': 1}) != kunci('stok_pdf', filters, {'bahan': 2})
+    assert kunci('stok_pdf', filters, {'bahan': 1}) != kunci('stok_pdf', {**filters, 'kategori_id': '2'}, {'bahan': 1})
+    assert aplikasi.EXPORT_JOB_ID_PATTERN.match(kunci('stok_pdf', filters, {'bahan': 1})).group(1) == 'stok_pdf'
+
+
+def test_permintaan_sama_memakai_cache(masuk, export):
+    client = masuk('admin')
+    
+    pertama = client.post('/export-jobs', data={'jenis': 'stok_pdf', 'kategori_id': '1'})
+    kedua = client.post('/export-jobs', data={'jenis': 'stok_pdf', 'kategori_id': '1'})
+    
+    assert pertama.status_code == kedua.status_code == 200
+    assert pertama.get_json()['job_id'] == kedua.get_json()['job_id']
+    assert export['dibuat'] == [{'kategori_id': '1', 'stok_minimum': ''}]
+    
+    download = client.get(pertama.get_json()['download_url'])
+    assert download.status_code == 200
+    assert download.data == b'%PDF-palsu'
+
+
+def test_versi_data_baru_membuat_job_baru(masuk, export):
+    client = masuk('admin')
+    
+    lama = client.post('/export-jobs', data={'jenis': 'stok_pdf'}).get_json()['job_id']
+    export['versi']['penerimaan'] += 1
+    baru = client.post('/export-jobs', data={'jenis': 'stok_pdf'}).get_json()['job_id']
+    
+    assert lama != baru
+    assert len(export['dibuat']) == 2
+
+
+def test_job_gagal_menghapus_file_sementara(masuk, export, monkeypatch):
+    def rusak(file, **filters):
+        file.write(b'setengah')
+        raise RuntimeError('query gagal')
+    monkeypatch.setitem(aplikasi.EXPORT_JOBS['stok_pdf'], 'build', rusak)
+    
+    response = masuk('admin').post('/export-jobs', data={'jenis': 'stok_pdf'})
+    
+    assert response.status_code == 202
+    assert response.get_json()['status'] == 'gagal'
+    assert response.get_json()['error'] == 'query gagal'
+    assert os.listdir(export['dir']) == []
+
+
+def test_job_lama_dibersihkan(export):
+    sekarang = time.time()
+    batas = sekarang - aplikasi.app.config['EXPORT_CACHE_MAX_AGE']
+    aplikasi._export_jobs.update({
+        'selesai_lama': {'status': 'selesai', 'created_at': batas - 10, 'selesai_at': batas - 5},
+        'gagal_lama': {'status': 'gagal', 'created_at': batas - 10, 'selesai_at': batas - 5},
+        'gagal_baru': {'status': 'gagal', 'created_at': batas - 10, 'selesai_at': sekarang},
+        'berjalan_lama': {'status': 'berjalan', 'created_at': batas - 10},
+    })
+    file_lama = export['dir'] / 'stok_pdf-lama.pdf'
+    file_lama.write_bytes(b'lama')
+    os.utime(file_lama, (batas - 5, batas - 5))
+    
+    aplikasi.bersihkan_export_cache()
+    
+    assert sorted(aplikasi._export_jobs) == ['berjalan_lama', 'gagal_baru']
+    assert not file_lama.exists()
+
+
+def test_file_hilang_status_404_dan_dijalankan_ulang(masuk, export):
+    client = masuk('admin')
+    job_id = client.post('/export-jobs', data={'jenis': 'stok_pdf'}).get_json()['job_id']
+    os.remove(aplikasi.path_export_job(job_id))
+    
+    assert client.get(f'/export-jobs/{job_id}').status_code == 404
+    assert client.get(f'/export-jobs/{job_id}/download').status_code == 404
+    assert client.post('/export-jobs', data={'jenis': 'stok_pdf'}).status_code == 200
+    assert len(export['dibuat']) == 2
+
+
+@pytest.fixture
+def export_replika(export, replika, monkeypatch):
+    """Builder yang menjalankan query lewat mysql.connection; replika punya versi_data sendiri"""
+    versi_replika = dict(export['versi'])
+    replika.handler_replika = lambda query, args: (
+        [{'nama': nama, 'versi': versi_replika[nama]} for nama in args]
+        if query.startswith('SELECT nama, versi FROM versi_data') else [])
+    
+    def buat(file, **filters):
+        cur = aplikasi.mysql.connection.cursor()
+        cur.execute("SELECT * FROM bahan")
+        cur.close()
+        file.write(b'%PDF-palsu')
+    monkeypatch.setitem(aplikasi.EXPORT_JOBS['stok_pdf'], 'build', buat)
+    return versi_replika
+
+
+def test_job_export_membaca_dari_replika(masuk, db, replika, export_replika):
+    response = masuk('admin').post('/export-jobs', data={'jenis': 'stok_pdf'})
+    
+    assert response.get_json()['status'] == 'selesai'
+    assert replika.query('SELECT * FROM bahan')
+    assert not db.query('SELECT * FROM bahan')
+    # Versi kunci cache tetap dibaca dari primary saat job dikirim
+    assert db.query('SELECT nama, versi FROM versi_data')
+
+
+def test_job_export_ke_primary_jika_replika_belum_memuat_versi(masuk, db, replika, export, export_replika):
+    export['versi']['pengeluaran'] += 1
+    
+    response = masuk('admin').post('/export-jobs', data={'jenis': 'stok_pdf'})
+    
+    assert response.get_json()['status'] == 'selesai'
+    assert db.query('SELECT * FROM bahan')
+    assert not replika.query('SELECT * FROM bahan')
+
+
+def test_job_export_ke_primary_jika_lag_replika_tinggi(masuk, db, replika, export_replika):
+    replika.lag = aplikasi.app.config['MYSQL_REPLICA_MAX_LAG'] + 1
+    
+    masuk('admin').post('/export-jobs', data={'jenis': 'stok_pdf'})
+    
+    assert db.query('SELECT * FROM bahan')
+    assert not replika.query('SELECT * FROM bahan')
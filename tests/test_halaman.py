@@ -0,0 +1,80 @@
+# tests/test_halaman.py
+from datetime import date
+
+import pytest
+
+import app as aplikasi
+
+
+@pytest.mark.parametrize('cursor', [
+    None, '', 'abc', '2024-05-01', '2024-05-01_', '2024-13-40_7', 'kemarin_7',
+    '2024-05-01_abc', '2024-05-01_-3', '2024-05-01_²', '2024-05-01_7_8',
+])
+def test_decode_cursor_tidak_valid(cursor):
+    assert aplikasi.decode_cursor(cursor) is None
+
+
+def test_decode_cursor_kebalikan_encode():
+    cursor = aplikasi.encode_cursor(date(2024, 5, 1), 42)
+    assert cursor == '2024-05-01_42'
+    assert aplikasi.decode_cursor(cursor) == (date(2024, 5, 1), 42)
+
+
+def test_filter_halaman_memakai_id_untuk_tanggal_yang_sama():
+    params = []
+    query = aplikasi.filter_halaman("SELECT * FROM penerimaan p WHERE 1=1", params,
+                                    'p.tanggal', 'p.id', '2024-05-01_42', 10)
+
+    assert "AND (p.tanggal < %s OR (p.tanggal = %s AND p.id < %s))" in query
+    assert query.endswith("ORDER BY p.tanggal DESC, p.id DESC LIMIT %s")
+    assert params == [date(2024, 5, 1), date(2024, 5, 1), 42, 11]
+
+
+def test_filter_halaman_cursor_rusak_menjadi_halaman_pertama():
+    params = []
+    query = aplikasi.filter_halaman("SELECT * FROM penerimaan p WHERE 1=1", params,
+                                    'p.tanggal', 'p.id', '2024-05-01_x', 10)
+
+    assert "p.tanggal <" not in query
+    assert params == [11]
+
+
+def baris(tanggal, id):
+    return {'tanggal': date(2024, 5, tanggal), 'id': id}
+
+
+def test_potong_halaman_cursor_dari_baris_terakhir():
+    # Dua baris bertanggal sama: cursor harus membawa id agar baris id=4 tidak terlewat
+    data, cursor = aplikasi.potong_halaman([baris(2, 9), baris(1, 5), baris(1, 4)], 2, 'tanggal')
+
+    assert data == [baris(2, 9), baris(1, 5)]
+    assert cursor == '2024-05-01_5'
+
+
+def test_potong_halaman_terakhir_tanpa_cursor():
+    data, cursor = aplikasi.potong_halaman([baris(2, 9), baris(1, 5)], 2, 'tanggal')
+
+    assert data == [baris(2, 9), baris(1, 5)]
+    assert cursor is None
+
+
+def test_api_cursor_rusak_mengembalikan_halaman_pertama(db, masuk):
+    db.handler = lambda query, args: [{'id': 3, 'tanggal': date(2024, 5, 1)}]
+    client = masuk('admin')
+
+    respons = client.get('/api/penerimaan?cursor=2024-05-01_%C2%B2&per_page=5')
+
+    assert respons.status_code == 200
+    assert respons.get_json()['next_cursor'] is None
+    query, params = db.query('SELECT p.*')[0]
+    assert "p.tanggal <" not in query
+    assert params == [6]
+
+
+def test_query_penerimaan_tanpa_kolom_ganda():
+    # total_harga adalah kolom generated di tabel penerimaan, sudah ikut di p.*;
+    # alias tambahan membuat export CSV/rows punya dua kolom total_harga
+    query, _ = aplikasi.query_penerimaan('2024-05-01', '2024-05-31')
+
+    assert 'p.*' in query
+    assert 'total_harga' not in query
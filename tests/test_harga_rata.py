@@ -0,0 +1,83 @@
+# tests/test_harga_rata.py
+from datetime import date
+
+import pytest
+
+import app as aplikasi
+
+
+class HargaRataPalsu:
+    """Tabel harga_rata_bahan di memori, mengikuti upsert di catat_harga_penerimaan"""
+    
+    def __init__(self):
+        self.baris = {}
+    
+    def __call__(self, query, args):
+        if query.startswith('INSERT INTO harga_rata_bahan'):
+            bahan_id, jumlah, nilai, harga = int(args[0]), args[1], args[2], args[3]
+            if bahan_id not in self.baris:
+                self.baris[bahan_id] = {'total_jumlah': jumlah, 'total_nilai': nilai, 'harga_rata': harga}
+            else:
+                # Assignment MySQL dievaluasi kiri ke kanan: harga_rata memakai total yang baru
+                item = self.baris[bahan_id]
+                item['total_jumlah'] += jumlah
+                item['total_nilai'] += nilai
+                item['harga_rata'] = item['total_nilai'] / item['total_jumlah']
+            return 1
+        return []
+
+
+@pytest.fixture
+def harga(db):
+    harga = HargaRataPalsu()
+    db.handler = harga
+    return harga
+
+
+def test_rata_rata_tertimbang(db, harga):
+    cur = db.cursor()
+    aplikasi.catat_harga_penerimaan(cur, 1, 10, 5000)
+    assert harga.baris[1]['harga_rata'] == 5000
+    
+    aplikasi.catat_harga_penerimaan(cur, 1, 30, 7000)
+    assert harga.baris[1] == {'total_jumlah': 40, 'total_nilai': 260000, 'harga_rata': 6500}
+    
+    [(query, _), _] = db.query('INSERT INTO harga_rata_bahan')
+    assert query.index('total_nilai = total_nilai +') < query.index('harga_rata = total_nilai / total_jumlah')
+
+
+@pytest.mark.parametrize('jumlah, harga_satuan', [(0, 5000), (10, 0), (-5, 5000), (10, None)])
+def test_jumlah_atau_harga_nol_diabaikan(db, harga, jumlah, harga_satuan):
+    aplikasi.catat_harga_penerimaan(db.cursor(), 1, jumlah, harga_satuan)
+    
+    assert db.log == []
+
+
+def test_penerimaan_disetujui_memperbarui_harga_rata(masuk, db, harga):
+    harga.baris[1] = {'total_jumlah': 10, 'total_nilai': 50000, 'harga_rata': 5000}
+    db.lastrowid = 1
+    client = masuk('gudang')
+    
+    client.post('/tambah-penerimaan', data={'tanggal': '2026-10-01', 'bahan_id': '1', 'jumlah': '10',
+                                            'satuan_id': '1', 'harga_satuan': '6000'})
+    assert harga.baris[1]['harga_rata'] == 5500
+    
+    # Barang tanpa harga (hibah) tidak mengubah harga rata-rata
+    client.post('/tambah-penerimaan', data={'tanggal': '2026-10-01', 'bahan_id': '1', 'jumlah': '10',
+                                            'satuan_id': '1', 'harga_satuan': '0'})
+    assert harga.baris[1] == {'total_jumlah': 20, 'total_nilai': 110000, 'harga_rata': 5500}
+    assert db.commits == 2
+
+
+def test_import_satu_update_per_bahan(db, harga):
+    def baris(bahan_id, jumlah, harga_satuan):
+        return {'tanggal': date(2026, 10, 1), 'bahan_id': bahan_id, 'jumlah': jumlah, 'satuan_id': 1,
+                'harga_satuan': harga_satuan, 'supplier': None, 'no_batch': None, 'tanggal_produksi': None,
+                'tanggal_kadaluarsa': None, 'kondisi': 'baik', 'catatan': None}
+    db.lastrowid = 4
+    
+    aplikasi.simpan_import_penerimaan(db.cursor(), [baris(1, 10, 5000), baris(2, 5, 0), baris(1, 30, 7000),
+                                                    baris(1, 20, 0)], 'petugas')
+    
+    assert len(db.query('INSERT INTO harga_rata_bahan')) == 1
+    assert harga.baris == {1: {'total_jumlah': 40, 'total_nilai': 260000, 'harga_rata': 6500}}
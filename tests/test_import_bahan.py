@@ -0,0 +1,53 @@
+# tests/test_import_bahan.py
+import io
+
+import app as aplikasi
+
+
+def baris_bahan(kode, satuan_id=1):
+    return (kode, f'Bahan {kode}', 1, satuan_id, 10, 100, None, None, None, 'aktif', None)
+
+
+def test_stok_awal_hanya_untuk_bahan_yang_diimport(db, monkeypatch):
+    monkeypatch.setitem(aplikasi.app.config, 'IMPORT_BATCH_SIZE', 2)
+    # Anggap setiap batch punya satu bahan baru tanpa baris stok
+    db.handler = lambda query, args: 1 if query.startswith('INSERT INTO stok') else []
+    
+    baru = aplikasi.upsert_bahan(db.cursor(), [baris_bahan('B01'), baris_bahan('B02'), baris_bahan('B03')])
+    
+    insert_stok = db.query('INSERT INTO stok')
+    assert [args for _, args in insert_stok] == [['B01', 'B02'], ['B03']]
+    for query, args in insert_stok:
+        assert 'b.kode_bahan IN ({})'.format(', '.join(['%s'] * len(args))) in query
+    assert baru == 2
+
+
+def test_satuan_stok_ikut_diperbarui(db):
+    aplikasi.upsert_bahan(db.cursor(), [baris_bahan('B01', satuan_id=3)])
+    
+    [(query, args)] = db.query('UPDATE stok s JOIN bahan b')
+    assert 'SET s.satuan_id = b.satuan_id' in query
+    assert args == ['B01']
+    
+    # Urutan: upsert bahan dulu, lalu satuan stok, lalu stok awal
+    awalan = [query[:18] for query, _ in db.log]
+    assert awalan == ['INSERT INTO bahan ', 'UPDATE stok s JOIN', 'INSERT INTO stok (']
+
+
+def test_import_bahan_melaporkan_jumlah_bahan_baru(masuk, db):
+    def handler(query, args):
+        if query.startswith('SELECT') and 'FROM kategori_bahan' in query:
+            return [{'id': 1, 'nama_kategori': 'Sayur'}]
+        if query.startswith('SELECT') and 'FROM satuan' in query:
+            return [{'id': 1, 'nama_satuan': 'kg'}]
+        if query.startswith('INSERT INTO stok'):
+            return 1
+        return []
+    db.handler = handler
+    csv = 'kode_bahan,nama_bahan,kategori,satuan\nB01,Bayam,Sayur,kg\nB02,Wortel,Sayur,kg\n'
+    
+    response = masuk('admin').post('/import-bahan', data={'file': (io.BytesIO(csv.encode()), 'bahan.csv')},
+                                   content_type='multipart/form-data', follow_redirects=True)
+    
+    assert '2 bahan berhasil diimport, 1 bahan baru dibuatkan stok awal.' in response.get_data(as_text=True)
+    assert db.commits == 1
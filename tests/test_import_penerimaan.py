@@ -0,0 +1,62 @@
+# tests/test_import_penerimaan.py
+from datetime import date
+
+import app as aplikasi
+
+
+def baris_penerimaan(bahan_id, jumlah, harga_satuan):
+    return {'tanggal': date(2026, 10, 1), 'bahan_id': bahan_id, 'jumlah': jumlah, 'satuan_id': 1,
+            'harga_satuan': harga_satuan, 'supplier': 'CV Tani', 'no_batch': 'B-01',
+            'tanggal_produksi': None, 'tanggal_kadaluarsa': date(2026, 12, 1),
+            'kondisi': 'baik', 'catatan': None}
+
+
+def test_import_tidak_mengisi_kolom_generated(db):
+    baris = [baris_penerimaan(1, 10, 5000), baris_penerimaan(2, 4, 0), baris_penerimaan(1, 6, 7000)]
+    db.lastrowid = 3
+    
+    nomor = aplikasi.simpan_import_penerimaan(db.cursor(), baris, 'petugas')
+    
+    assert len(nomor) == 3
+    [(query, data)] = db.query('INSERT INTO penerimaan')
+    # total_harga adalah kolom generated (jumlah * harga_satuan), MySQL menolak nilai eksplisit
+    assert 'total_harga' not in query
+    kolom = query[query.index('(') + 1:query.index(')')].split(', ')
+    assert len(data) == 3
+    for item in data:
+        assert len(item) == query.count('%s') == len(kolom) - 1  # status diisi literal
+    assert [item[0] for item in data] == nomor
+
+
+def test_import_dipecah_per_batch(db, monkeypatch):
+    monkeypatch.setitem(aplikasi.app.config, 'IMPORT_BATCH_SIZE', 2)
+    db.lastrowid = 5
+    
+    aplikasi.simpan_import_penerimaan(db.cursor(), [baris_penerimaan(1, 1, 0)] * 5, 'petugas')
+    
+    assert [len(data) for _, data in db.query('INSERT INTO penerimaan')] == [2, 2, 1]
+
+
+def test_stok_dan_lot_ditambah_per_bahan(db):
+    db.lastrowid = 3
+    
+    aplikasi.simpan_import_penerimaan(db.cursor(), [baris_penerimaan(1, 10, 0), baris_penerimaan(2, 4, 0),
+                                                    baris_penerimaan(1, 6, 0)], 'petugas')
+    
+    [(_, update_stok)] = db.query('UPDATE stok')
+    assert sorted(update_stok) == [(4, 2), (16, 1)]
+    [(_, lot)] = db.query('INSERT INTO lot_stok')
+    assert sum(item[-1] for item in lot) == 20
+
+
+def test_form_tambah_penerimaan_tanpa_total_harga(masuk, db):
+    db.lastrowid = 1
+    
+    response = masuk('gudang').post('/tambah-penerimaan', data={
+        'tanggal': '2026-10-01', 'bahan_id': '1', 'jumlah': '10', 'satuan_id': '1', 'harga_satuan': '5000'})
+    
+    assert response.status_code == 302
+    [(query, args)] = db.query('INSERT INTO penerimaan')
+    assert 'total_harga' not in query
+    assert len(args) == query.count('%s')
+    assert db.commits == 1
@@ -0,0 +1,76 @@
+# tests/test_kartu_stok.py
+from datetime import date, timedelta
+
+import pytest
+
+import app as aplikasi
+
+PERINGATAN = 'Rentang tanggal tidak valid, menampilkan bulan berjalan'
+
+
+@pytest.fixture
+def data_kartu(db):
+    def handler(query, args):
+        if query.startswith('SELECT b.id, b.kode_bahan'):
+            return [{'id': 1, 'kode_bahan': 'B01', 'nama_bahan': 'Beras', 'nama_satuan': 'kg'}]
+        if query.startswith('SELECT COALESCE(SUM(jumlah), 0) as total FROM mutasi_stok'):
+            return [{'total': 0}]
+        return []
+    db.handler = handler
+    return db
+
+
+def rentang_mutasi(db):
+    [(_, args)] = db.query('SELECT tanggal, jenis, jumlah, referensi FROM mutasi_stok')
+    return args[1], args[2]
+
+
+def bulan_berjalan():
+    awal, akhir = aplikasi.rentang_bulan()
+    return awal, akhir - timedelta(days=1)
+
+
+def test_rentang_valid_dipakai(masuk, data_kartu):
+    response = masuk('gudang').get('/kartu-stok?bahan_id=1&start_date=2026-01-05&end_date=2026-01-20')
+    
+    assert response.status_code == 200
+    assert rentang_mutasi(data_kartu) == (date(2026, 1, 5), date(2026, 1, 20))
+    assert PERINGATAN not in response.get_data(as_text=True)
+
+
+def test_tanpa_filter_memakai_bulan_berjalan(masuk, data_kartu):
+    response = masuk('gudang').get('/kartu-stok?bahan_id=1')
+    
+    assert response.status_code == 200
+    assert rentang_mutasi(data_kartu) == bulan_berjalan()
+    assert PERINGATAN not in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('query', [
+    'start_date=bukan-tanggal',
+    'start_date=2026-13-01&end_date=2026-12-31',
+    'start_date=2026-01-01&end_date=2026-02-30',
+    "end_date=2026-01-31' OR 1=1",
+    'start_date=2026-03-01&end_date=2026-02-01',
+])
+def test_tanggal_tidak_valid_kembali_ke_bulan_berjalan(masuk, data_kartu, query):
+    response = masuk('gudang').get(f'/kartu-stok?bahan_id=1&{query}')
+    
+    assert response.status_code == 200
+    assert PERINGATAN in response.get_data(as_text=True)
+    assert rentang_mutasi(data_kartu) == bulan_berjalan()
+    # Saldo awal dihitung sampai sehari sebelum periode
+    [(_, args)] = data_kartu.query('SELECT tanggal, saldo FROM snapshot_stok')
+    assert args == ('1', bulan_berjalan()[0] - timedelta(days=1))
+
+
+def test_api_stok_pada_tanggal(masuk, data_kartu):
+    client = masuk('gudang')
+    
+    response = client.get('/api/stok-pada-tanggal/1?tanggal=2026-02-30')
+    assert response.status_code == 400
+    assert client.get('/api/stok-pada-tanggal/1').status_code == 400
+    
+    response = client.get('/api/stok-pada-tanggal/1?tanggal=2026-02-28')
+    assert response.status_code == 200
+    assert response.get_json() == {'bahan_id': 1, 'tanggal': '2026-02-28', 'saldo': 0}
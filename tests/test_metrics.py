@@ -0,0 +1,49 @@
+# tests/test_metrics.py
+import pytest
+
+import app as aplikasi
+
+TOKEN = 'rahasia-scraper'
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setitem(aplikasi.app.config, 'METRICS_TOKEN', TOKEN)
+    return TOKEN
+
+
+@pytest.fixture
+def tanpa_token(monkeypatch):
+    monkeypatch.setitem(aplikasi.app.config, 'METRICS_TOKEN', '')
+
+
+def test_tanpa_token_localhost_ditolak(client, tanpa_token):
+    # Di belakang reverse proxy lokal semua request datang dari 127.0.0.1
+    for alamat in ('127.0.0.1', '::1'):
+        response = client.get('/metrics', environ_base={'REMOTE_ADDR': alamat})
+        assert response.status_code == 403
+
+
+def test_tanpa_token_header_apa_pun_ditolak(client, tanpa_token):
+    for header in ('Bearer ', 'Bearer', ''):
+        assert client.get('/metrics', headers={'Authorization': header}).status_code == 403
+
+
+def test_token_benar_diizinkan(client, token):
+    response = client.get('/metrics', headers={'Authorization': f'Bearer {token}'})
+    
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE sppg_http_requests_total counter' in response.get_data(as_text=True)
+
+
+def test_token_salah_ditolak(client, token):
+    for header in (f'Bearer {token}x', token, f'Basic {token}'):
+        response = client.get('/metrics', headers={'Authorization': header},
+                              environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        assert response.status_code == 403
+
+
+@pytest.mark.parametrize('role, status', [('admin', 200), ('gudang', 403), ('distribusi', 403)])
+def test_sesi_hanya_admin(masuk, tanpa_token, role, status):
+    assert masuk(role).get('/metrics').status_code == status
@@ -0,0 +1,34 @@
+# tests/test_migrate.py
+import migrate
+
+
+def jalankan_explain(db, monkeypatch, buat_plan):
+    """Jalankan migrate.explain() dengan hasil EXPLAIN dari buat_plan(query)"""
+    monkeypatch.setattr(migrate, 'get_connection', lambda: db)
+    db.handler = lambda query, args: buat_plan(query) if query.startswith('EXPLAIN') else []
+    return migrate.explain()
+
+
+def plan_join(tabel, key):
+    """Plan dengan tabel lookup (memakai PRIMARY) di baris pertama, tabel yang dicek di baris kedua"""
+    return [
+        {'table': 'b', 'key': 'PRIMARY', 'type': 'eq_ref', 'rows': 1},
+        {'table': tabel, 'key': key, 'type': 'range' if key else 'ALL', 'rows': 5000},
+    ]
+
+
+def test_explain_mencari_baris_tabel_berdasarkan_alias(db, monkeypatch, capsys):
+    # Tabel penerimaan/pengeluaran (alias p) tidak di baris pertama dan tidak memakai index
+    assert not jalankan_explain(db, monkeypatch, lambda query: plan_join('p', None))
+
+    keluaran = capsys.readouterr().out
+    assert "❌ penerimaan: p tanpa index" in keluaran
+    assert "❌ laporan distribusi: p tanpa index" in keluaran
+    assert "❌ monitoring: tabel mk tidak ada di hasil EXPLAIN" in keluaran
+
+
+def test_explain_lolos_bila_tabel_utama_memakai_index(db, monkeypatch, capsys):
+    alias = {" ".join(query.split()): tabel for _, tabel, query, _ in migrate.route_queries()}
+    assert jalankan_explain(db, monkeypatch,
+                            lambda query: plan_join(alias[query[len('EXPLAIN '):]], 'idx_tanggal'))
+    assert '❌' not in capsys.readouterr().out
@@ -0,0 +1,64 @@
+# tests/test_nomor.py
+from datetime import date
+
+import pytest
+
+import app as aplikasi
+
+TANGGAL = date(2024, 5, 1)
+
+
+@pytest.fixture
+def nomor_urut(db):
+    """Tabel nomor_urut di memori: meniru INSERT ... ON DUPLICATE KEY UPDATE + LAST_INSERT_ID"""
+    penghitung = {}
+
+    def handler(query, args):
+        if query.startswith('INSERT INTO nomor_urut'):
+            prefix, tanggal, awal, tambah = args
+            kunci = (prefix, tanggal)
+            penghitung[kunci] = penghitung[kunci] + tambah if kunci in penghitung else awal
+            db.lastrowid = penghitung[kunci]
+            return 1
+        if query.startswith('SELECT nomor_terakhir FROM nomor_urut'):
+            kunci = tuple(args)
+            return [{'nomor_terakhir': penghitung[kunci]}] if kunci in penghitung else []
+        return []
+    db.handler = handler
+    return penghitung
+
+
+def test_format_nomor():
+    assert aplikasi.format_nomor('TRM', TANGGAL, 7) == 'TRM-20240501-007'
+    assert aplikasi.format_nomor('KLR', TANGGAL, 1234) == 'KLR-20240501-1234'
+
+
+def test_alokasi_pertama_untuk_prefix_dan_tanggal_baru(db, nomor_urut):
+    cur = db.cursor()
+
+    assert aplikasi.alokasi_nomor(cur, 'TRM', tanggal=TANGGAL) == ['TRM-20240501-001']
+    assert nomor_urut == {('TRM', TANGGAL): 1}
+    query, args = db.query('INSERT INTO nomor_urut')[0]
+    assert 'LAST_INSERT_ID(nomor_terakhir + %s)' in query
+    assert args == ('TRM', TANGGAL, 1, 1)
+
+
+def test_alokasi_batch_mendapat_rentang_berurutan(db, nomor_urut):
+    cur = db.cursor()
+    aplikasi.alokasi_nomor(cur, 'KLR', tanggal=TANGGAL)
+
+    nomor = aplikasi.alokasi_nomor(cur, 'KLR', 3, tanggal=TANGGAL)
+
+    assert nomor == ['KLR-20240501-002', 'KLR-20240501-003', 'KLR-20240501-004']
+    # Satu INSERT untuk seluruh batch, bukan satu per nomor
+    assert len(db.query('INSERT INTO nomor_urut')) == 2
+    assert aplikasi.lihat_nomor_berikutnya(cur, 'KLR', TANGGAL) == 'KLR-20240501-005'
+
+
+def test_penghitung_terpisah_per_prefix_dan_tanggal(db, nomor_urut):
+    cur = db.cursor()
+    aplikasi.alokasi_nomor(cur, 'TRM', 2, tanggal=TANGGAL)
+
+    assert aplikasi.alokasi_nomor(cur, 'KLR', tanggal=TANGGAL) == ['KLR-20240501-001']
+    assert aplikasi.alokasi_nomor(cur, 'TRM', tanggal=date(2024, 5, 2)) == ['TRM-20240502-001']
+    assert aplikasi.lihat_nomor_berikutnya(cur, 'TRM', TANGGAL) == 'TRM-20240501-003'
@@ -0,0 +1,168 @@
+# tests/test_pool.py
+"""MySQLPool dengan MySQLdb.connect palsu (fixture `db` tidak dipakai: ia melewati pool)"""
+import threading
+from collections import deque
+
+import pytest
+
+import app as aplikasi
+
+
+class KoneksiPalsu:
+    def __init__(self, nomor):
+        self.nomor = nomor
+        self.putus = False
+        self.rollback_gagal = False
+        self.ping_count = 0
+        self.rollbacks = 0
+        self.ditutup = False
+
+    def ping(self, *args):
+        self.ping_count += 1
+        if self.putus:
+            raise aplikasi.MySQLdb.OperationalError(2006, 'MySQL server has gone away')
+
+    def rollback(self):
+        if self.rollback_gagal:
+            raise aplikasi.MySQLdb.OperationalError(2013, 'Lost connection')
+        self.rollbacks += 1
+
+    def cursor(self, *args):
+        return None
+
+    def close(self):
+        self.ditutup = True
+
+
+@pytest.fixture
+def dibuat(monkeypatch):
+    """Koneksi yang dibuka MySQLdb.connect palsu, urut pembuatan"""
+    daftar = []
+
+    def connect(**kwargs):
+        daftar.append(KoneksiPalsu(len(daftar) + 1))
+        return daftar[-1]
+    monkeypatch.setattr(aplikasi.MySQLdb, 'connect', connect)
+    for kunci, nilai in {'MYSQL_POOL_MIN_SIZE': 1, 'MYSQL_POOL_MAX_SIZE': 2, 'MYSQL_POOL_TIMEOUT': 0.05,
+                         'MYSQL_POOL_RECYCLE': 3600, 'MYSQL_POOL_PRE_PING': True}.items():
+        monkeypatch.setitem(aplikasi.app.config, kunci, nilai)
+    return daftar
+
+
+@pytest.fixture
+def pool(dibuat):
+    pool = aplikasi.MySQLPool()
+    pool.app = aplikasi.app
+    return pool
+
+
+def test_warm_up_membuka_koneksi_minimum(pool, dibuat):
+    aplikasi.app.config['MYSQL_POOL_MIN_SIZE'] = 2
+    pool.warm_up()
+    pool.warm_up()
+
+    assert len(dibuat) == 2
+    assert pool.statistik()['ukuran'] == 2 and pool.statistik()['idle'] == 2
+
+
+def test_pinjam_memakai_ulang_koneksi_idle_dengan_ping(pool, dibuat):
+    pool.warm_up()
+
+    koneksi = pool.pinjam()
+    assert koneksi._koneksi is dibuat[0]
+    assert dibuat[0].ping_count == 1
+    koneksi.close()
+    koneksi.close()
+
+    assert dibuat[0].rollbacks == 1
+    assert len(dibuat) == 1
+    assert pool.statistik()['idle'] == 1 and pool.statistik()['dipakai'] == 0
+
+
+def test_koneksi_putus_dibuang_saat_ping(pool, dibuat):
+    pool.warm_up()
+    dibuat[0].putus = True
+
+    koneksi = pool.pinjam()
+
+    assert koneksi._koneksi is dibuat[1]
+    assert dibuat[0].ditutup
+    statistik = pool.statistik()
+    assert statistik['dibuang'] == 1 and statistik['dibuat'] == 2 and statistik['ukuran'] == 1
+
+
+def test_koneksi_tua_didaur_ulang_tanpa_ping(pool, dibuat):
+    pool.warm_up()
+    koneksi, waktu = pool._idle.pop()
+    pool._idle.append((koneksi, waktu - 3601))
+
+    assert pool.pinjam()._koneksi is dibuat[1]
+    assert dibuat[0].ditutup and dibuat[0].ping_count == 0
+
+
+def test_pinjam_timeout_saat_pool_penuh(pool, dibuat):
+    pertama, kedua = pool.pinjam(), pool.pinjam()
+
+    with pytest.raises(aplikasi.PoolHabis):
+        pool.pinjam()
+
+    statistik = pool.statistik()
+    assert statistik['timeout'] == 1
+    assert statistik['dipakai'] == 2 and statistik['ukuran'] == 2
+    assert len(dibuat) == 2
+
+
+def test_pinjam_menunggu_koneksi_dikembalikan(pool, dibuat):
+    aplikasi.app.config['MYSQL_POOL_TIMEOUT'] = 2
+    pertama, kedua = pool.pinjam(), pool.pinjam()
+    threading.Timer(0.05, pertama.close).start()
+
+    ketiga = pool.pinjam()
+
+    assert ketiga._koneksi is dibuat[0]
+    statistik = pool.statistik()
+    assert statistik['checkout'] == 3 and statistik['timeout'] == 0
+    assert 0 < statistik['tunggu_maks'] < 2
+    assert statistik['tunggu_rata'] == pytest.approx(statistik['tunggu_total'] / 3)
+
+
+def test_rollback_gagal_saat_dikembalikan_membuang_koneksi(pool, dibuat):
+    koneksi = pool.pinjam()
+    dibuat[0].rollback_gagal = True
+
+    koneksi.close()
+
+    assert dibuat[0].ditutup
+    statistik = pool.statistik()
+    assert statistik['idle'] == 0 and statistik['ukuran'] == 0 and statistik['dipakai'] == 0
+
+
+def test_gagal_membuka_koneksi_tidak_memakan_slot(pool, monkeypatch):
+    def connect(**kwargs):
+        raise aplikasi.MySQLdb.OperationalError(2003, "Can't connect")
+    monkeypatch.setattr(aplikasi.MySQLdb, 'connect', connect)
+
+    with pytest.raises(aplikasi.MySQLdb.OperationalError):
+        pool.pinjam()
+
+    statistik = pool.statistik()
+    assert statistik['ukuran'] == 0 and statistik['dipakai'] == 0
+
+
+def test_koneksi_dikembalikan_saat_request_error(dibuat, monkeypatch):
+    # Pool global dipakai lewat teardown_appcontext; state-nya dipulihkan setelah test
+    mysql = aplikasi.mysql
+    monkeypatch.setattr(mysql, '_idle', deque())
+    monkeypatch.setattr(mysql, '_terbuka', 0)
+    monkeypatch.setattr(mysql, '_dipakai', 0)
+    monkeypatch.setattr(mysql, '_statistik', dict.fromkeys(mysql._statistik, 0))
+
+    with pytest.raises(RuntimeError):
+        with aplikasi.app.app_context():
+            mysql.connection
+            assert mysql.statistik()['dipakai'] == 1
+            raise RuntimeError('view gagal')
+
+    assert dibuat[0].rollbacks == 1 and not dibuat[0].ditutup
+    statistik = mysql.statistik()
+    assert statistik['dipakai'] == 0 and statistik['idle'] == 1 and statistik['checkout'] == 1
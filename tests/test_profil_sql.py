@@ -0,0 +1,83 @@
+# tests/test_profil_sql.py
+from collections import deque
+
+import pytest
+from flask import g
+
+import app as aplikasi
+
+
+@pytest.fixture
+def profiler(db, monkeypatch):
+    monkeypatch.setitem(aplikasi.app.config, 'SQL_PROFILER', True)
+    monkeypatch.setitem(aplikasi.app.config, 'SQL_PROFILER_SLOW_MS', 0)
+    monkeypatch.setattr(aplikasi, '_profil_sql', deque())
+    
+    def handler(query, args):
+        if query.startswith('EXPLAIN'):
+            return [{'id': 1, 'table': 'bahan', 'type': 'ALL'}]
+        return []
+    db.handler = handler
+    return db
+
+
+def jalankan_request(perintah):
+    """Jalankan perintah(cursor) di satu request, kembalikan laporan profiler terbaru"""
+    with aplikasi.app.test_request_context('/uji'):
+        aplikasi.mulai_profil_sql()
+        perintah(aplikasi.CursorTerukur(aplikasi.mysql.connection.cursor()))
+        aplikasi.simpan_profil_sql()
+        assert 'profil_sql' not in g
+    return aplikasi._profil_sql[0]
+
+
+def lambat_per_query(laporan):
+    return {item['query'].split()[0]: item for item in laporan['lambat']}
+
+
+def test_explain_select_tanpa_parameter(profiler):
+    laporan = jalankan_request(lambda cur: cur.execute("SELECT COUNT(*) FROM bahan"))
+    
+    [item] = laporan['lambat']
+    assert item['explain'] == [{'id': 1, 'table': 'bahan', 'type': 'ALL'}]
+    assert profiler.query('EXPLAIN') == [('EXPLAIN SELECT COUNT(*) FROM bahan', None)]
+
+
+def test_explain_hanya_untuk_select(profiler):
+    def perintah(cur):
+        cur.execute("\n  SELECT * FROM bahan WHERE id = %s", (1,))
+        cur.execute("UPDATE stok SET jumlah = 0")
+        cur.executemany("INSERT INTO satuan (nama_satuan) VALUES (%s)", [('kg',), ('liter',)])
+    
+    lambat = lambat_per_query(jalankan_request(perintah))
+    
+    assert lambat['SELECT']['explain'] is not None
+    assert lambat['UPDATE']['explain'] is None
+    assert lambat['INSERT']['explain'] is None
+    assert [args for _, args in profiler.query('EXPLAIN')] == [(1,)]
+
+
+def test_explain_gagal_tidak_menggagalkan_teardown(profiler):
+    def putus(query, args):
+        raise RuntimeError('koneksi putus')
+    
+    def perintah(cur):
+        cur.execute("SELECT * FROM bahan")
+        profiler.handler = putus
+    
+    [item] = jalankan_request(perintah)['lambat']
+    assert item['explain'] == [{'error': 'koneksi putus'}]
+
+
+def test_n_plus_1_terdeteksi(profiler, monkeypatch):
+    monkeypatch.setitem(aplikasi.app.config, 'SQL_PROFILER_SLOW_MS', 10_000)
+    
+    def perintah(cur):
+        for bahan_id in range(4):
+            cur.execute("SELECT * FROM stok WHERE bahan_id = %s", (bahan_id,))
+    
+    laporan = jalankan_request(perintah)
+    
+    assert laporan['lambat'] == []
+    [kelompok] = laporan['n_plus_1']
+    assert kelompok['jumlah'] == 4
@@ -0,0 +1,65 @@
+# tests/test_referensi.py
+import pytest
+
+import app as aplikasi
+
+
+@pytest.fixture
+def referensi(db):
+    """Jumlah query per tabel referensi; isi bahan_aktif bisa diganti lewat data['bahan']"""
+    data = {'bahan': [{'id': 1, 'kode_bahan': 'BRS', 'nama_bahan': 'Beras'}], 'query': []}
+
+    def handler(query, args):
+        if query.startswith('SELECT * FROM bahan WHERE status'):
+            data['query'].append('bahan_aktif')
+            return list(data['bahan'])
+        if query.startswith('SELECT * FROM satuan'):
+            data['query'].append('satuan')
+            return [{'id': 1, 'nama_satuan': 'kg'}]
+        return []
+    db.handler = handler
+    return data
+
+
+def test_cache_hit_tidak_query_ulang(db, referensi):
+    pertama = aplikasi.ambil_referensi('satuan')
+
+    assert aplikasi.ambil_referensi('satuan') is pertama
+    assert pertama == ({'id': 1, 'nama_satuan': 'kg'},)
+    assert referensi['query'] == ['satuan']
+
+
+def test_cache_kadaluarsa_setelah_ttl(db, referensi):
+    aplikasi.ambil_referensi('satuan')
+    dimuat, data = aplikasi._referensi_cache['satuan']
+    aplikasi._referensi_cache['satuan'] = (dimuat - aplikasi.app.config['REFERENSI_CACHE_TTL'], data)
+
+    aplikasi.ambil_referensi('satuan')
+
+    assert referensi['query'] == ['satuan', 'satuan']
+
+
+def test_invalidasi_hanya_nama_yang_diberikan(db, referensi):
+    aplikasi.ambil_referensi('satuan')
+    aplikasi.ambil_referensi('bahan_aktif')
+
+    aplikasi.invalidasi_referensi('bahan_aktif')
+    aplikasi.ambil_referensi('satuan')
+    aplikasi.ambil_referensi('bahan_aktif')
+    assert referensi['query'] == ['satuan', 'bahan_aktif', 'bahan_aktif']
+
+    aplikasi.invalidasi_referensi()
+    assert aplikasi._referensi_cache == {}
+
+
+def test_tambah_bahan_mengosongkan_cache_bahan_aktif(db, referensi, masuk):
+    assert len(aplikasi.ambil_referensi('bahan_aktif')) == 1
+    referensi['bahan'].append({'id': 2, 'kode_bahan': 'GLA', 'nama_bahan': 'Gula'})
+
+    respons = masuk('gudang').post('/tambah-bahan', data={
+        'kode_bahan': 'GLA', 'nama_bahan': 'Gula', 'kategori_id': '1', 'satuan_id': '1'})
+
+    assert respons.status_code == 302
+    assert db.commits == 1
+    assert [row['nama_bahan'] for row in aplikasi.ambil_referensi('bahan_aktif')] == ['Beras', 'Gula']
+    assert [row['nama_bahan'] for row in aplikasi.cari_bahan('gul')] == ['Gula']
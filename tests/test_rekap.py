@@ -0,0 +1,103 @@
+# tests/test_rekap.py
+from datetime import date
+
+import pytest
+
+import app as aplikasi
+
+
+class RekapPalsu:
+    """Tabel transaksi dan rekap di memori untuk query catat_rekap/bangun_ulang_rekap"""
+
+    def __init__(self):
+        self.penerimaan = []
+        self.pengeluaran = []
+        self.rekap = {'rekap_harian': {}, 'rekap_bulanan': {}}
+
+    def _tambah(self, tabel, kunci, jumlah, transaksi):
+        total = self.rekap[tabel].setdefault(kunci, [0, 0])
+        total[0] += jumlah
+        total[1] += transaksi
+
+    def _hapus(self, tabel, dari):
+        self.rekap[tabel] = {kunci: total for kunci, total in self.rekap[tabel].items() if kunci[1] < dari}
+
+    def __call__(self, query, args):
+        if 'VALUES (%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE' in query:
+            jenis, kunci, bahan_id, jenis_tujuan, jumlah, transaksi = args
+            self._tambah(query.split()[2], (jenis, kunci, bahan_id, jenis_tujuan), jumlah, transaksi)
+        elif query.startswith('DELETE FROM rekap_harian WHERE tanggal >= %s'):
+            self._hapus('rekap_harian', args[0])
+        elif query.startswith('DELETE FROM rekap_bulanan WHERE bulan >= %s'):
+            self._hapus('rekap_bulanan', args[0])
+        elif "SELECT 'penerimaan'" in query:
+            for item in self.penerimaan:
+                if item['status'] == 'disetujui' and item['tanggal'] >= args[0]:
+                    self._tambah('rekap_harian', ('penerimaan', item['tanggal'], item['bahan_id'], ''),
+                                 item['jumlah'], 1)
+        elif "SELECT 'pengeluaran'" in query:
+            for item in self.pengeluaran:
+                if item['status'] != 'draft' and item['tanggal'] >= args[0]:
+                    self._tambah('rekap_harian', ('pengeluaran', item['tanggal'], item['bahan_id'],
+                                                  item['jenis_tujuan'] or ''), item['jumlah'], 1)
+        elif query.startswith('INSERT INTO rekap_bulanan') and 'FROM rekap_harian' in query:
+            for (jenis, tanggal, bahan_id, jenis_tujuan), (jumlah, transaksi) in list(self.rekap['rekap_harian'].items()):
+                if tanggal >= args[0]:
+                    self._tambah('rekap_bulanan', (jenis, tanggal.replace(day=1), bahan_id, jenis_tujuan),
+                                 jumlah, transaksi)
+        else:
+            raise AssertionError(f'Query tidak dikenal: {query}')
+        return 1
+
+
+@pytest.fixture
+def rekap(db):
+    rekap = RekapPalsu()
+    db.handler = rekap
+    return rekap
+
+
+def test_rekap_inkremental_sama_dengan_bangun_ulang(db, rekap):
+    cur = db.cursor()
+    # Transaksi lintas dua bulan, dicatat per batch seperti route penerimaan/pengeluaran/surat jalan
+    batch = [
+        ('penerimaan', [('2026-09-30', 1, None, 10.5), ('2026-09-30', 1, None, 4), ('2026-10-01', 2, None, 8)]),
+        ('pengeluaran', [(date(2026, 9, 30), '1', 'sekolah', 3), (date(2026, 9, 30), 1, 'sekolah', 1.25)]),
+        ('pengeluaran', [('2026-10-02', 1, None, 2), ('2026-10-02', 2, 'posyandu', 0.5)]),
+        ('penerimaan', [('2026-10-15', 1, '', 6)]),
+    ]
+    for jenis, baris in batch:
+        aplikasi.catat_rekap(cur, jenis, baris)
+        for tanggal, bahan_id, jenis_tujuan, jumlah in baris:
+            item = {'tanggal': aplikasi.parse_tanggal(tanggal) if isinstance(tanggal, str) else tanggal,
+                    'bahan_id': int(bahan_id), 'jenis_tujuan': jenis_tujuan, 'jumlah': jumlah}
+            getattr(rekap, jenis).append(dict(item, status='disetujui' if jenis == 'penerimaan' else 'dikirim'))
+    # Transaksi yang tidak masuk rekap (draft) tidak dicatat catat_rekap maupun bangun ulang
+    rekap.penerimaan.append({'tanggal': date(2026, 10, 3), 'bahan_id': 1, 'jenis_tujuan': None,
+                             'jumlah': 99, 'status': 'draft'})
+    inkremental = {tabel: dict(isi) for tabel, isi in rekap.rekap.items()}
+
+    assert inkremental['rekap_bulanan'][('penerimaan', date(2026, 9, 1), 1, '')] == [14.5, 2]
+    assert inkremental['rekap_harian'][('pengeluaran', date(2026, 10, 2), 1, '')] == [2, 1]
+
+    # Bangun ulang sebagian (mulai Oktober) di atas rekap yang rusak
+    rekap.rekap['rekap_harian'][('pengeluaran', date(2026, 10, 2), 1, '')] = [999, 9]
+    aplikasi.bangun_ulang_rekap(cur, date(2026, 10, 20))
+    assert rekap.rekap == inkremental
+
+    # Bangun ulang penuh dari rekap kosong
+    rekap.rekap = {'rekap_harian': {}, 'rekap_bulanan': {}}
+    aplikasi.bangun_ulang_rekap(cur)
+    assert rekap.rekap == inkremental
+
+
+def test_catat_rekap_satu_upsert_per_kunci_urut(db, rekap):
+    aplikasi.catat_rekap(db.cursor(), 'pengeluaran', [
+        ('2026-10-02', 2, 'sekolah', 1), ('2026-10-01', 1, 'sekolah', 2), ('2026-10-02', 2, 'sekolah', 3)])
+
+    [(_, harian)] = db.query('INSERT INTO rekap_harian')
+    assert harian == [('pengeluaran', date(2026, 10, 1), 1, 'sekolah', 2, 1),
+                      ('pengeluaran', date(2026, 10, 2), 2, 'sekolah', 4, 2)]
+    [(_, bulanan)] = db.query('INSERT INTO rekap_bulanan')
+    assert bulanan == [('pengeluaran', date(2026, 10, 1), 1, 'sekolah', 2, 1),
+                       ('pengeluaran', date(2026, 10, 1), 2, 'sekolah', 4, 2)]
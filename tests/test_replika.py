@@ -0,0 +1,94 @@
+# tests/test_replika.py
+import time
+
+import pytest
+
+import app as aplikasi
+
+
+@pytest.fixture
+def data(db, replika):
+    """Primary dan replika sama-sama menjawab query daftar penerimaan dan laporan stok"""
+    def handler(query, args):
+        if query.startswith('SELECT * FROM kategori_bahan'):
+            return [{'id': 1, 'nama_kategori': 'Pokok'}]
+        return []
+    db.handler = replika.handler_replika = handler
+
+
+def test_route_baca_replika_memakai_replika(masuk, db, replika, data):
+    response = masuk('admin').get('/api/penerimaan')
+    
+    assert response.status_code == 200
+    assert replika.query('SHOW REPLICA STATUS')
+    assert replika.query('SELECT p.*')
+    assert not db.query('SELECT p.*')
+    assert aplikasi.mysql_replika.statistik()['sehat']
+
+
+@pytest.mark.parametrize('lag, error', [(6, None), (None, 'Replikasi berhenti')])
+def test_replika_tertinggal_jatuh_ke_primary(masuk, db, replika, data, lag, error):
+    replika.lag = lag
+    
+    masuk('admin').get('/api/penerimaan')
+    
+    assert db.query('SELECT p.*')
+    assert not replika.query('SELECT p.*')
+    status = aplikasi.mysql_replika.statistik()
+    assert not status['sehat'] and status['error'] == error
+
+
+def test_replika_tidak_bisa_dihubungi_dicoba_lagi_nanti(masuk, db, replika, data, monkeypatch):
+    def gagal():
+        raise aplikasi.MySQLdb.OperationalError(2003, "Can't connect to MySQL server")
+    monkeypatch.setattr(aplikasi.mysql_replika, '_buka_koneksi', gagal)
+    
+    masuk('admin').get('/api/penerimaan')
+    
+    assert db.query('SELECT p.*')
+    assert "Can't connect" in aplikasi.mysql_replika.statistik()['error']
+    jeda = aplikasi.mysql_replika._cek_berikutnya - time.monotonic()
+    assert jeda > aplikasi.app.config['MYSQL_REPLICA_CHECK_INTERVAL']
+
+
+def test_referensi_di_route_replika_dibaca_dari_primary(masuk, db, replika, data):
+    response = masuk('admin').get('/laporan-stok')
+    
+    assert response.status_code == 200
+    assert len(replika.log) > len(replika.query('SHOW REPLICA STATUS'))
+    assert db.query('SELECT * FROM kategori_bahan')
+    assert not replika.query('SELECT * FROM kategori_bahan')
+
+
+def test_request_tulis_tidak_memakai_replika(db, replika):
+    view = aplikasi.baca_replika(lambda: aplikasi.mysql.connection)
+    
+    with aplikasi.app.test_request_context('/api/penerimaan', method='POST'):
+        assert view() is db
+    with aplikasi.app.test_request_context('/api/penerimaan'):
+        assert view() is not db
+    assert not replika.query('SELECT')
+
+
+def test_sesi_yang_baru_menulis_membaca_dari_primary(masuk, db, replika, data, monkeypatch):
+    # Sesi ditandai oleh KoneksiPool.commit, jadi primary palsu dibungkus seperti koneksi pool
+    monkeypatch.setattr(aplikasi.MySQL, 'connection',
+                        property(lambda self: aplikasi.KoneksiPool(aplikasi.mysql, db, 0)))
+    client = masuk('admin')
+    
+    response = client.post('/tambah-bahan', data={'kode_bahan': 'GLA', 'nama_bahan': 'Gula',
+                                                   'kategori_id': '1', 'satuan_id': '1'})
+    assert response.status_code == 302
+    assert db.query('INSERT INTO bahan') and not replika.query('INSERT')
+    with client.session_transaction() as sesi:
+        assert time.time() - sesi['tulis_terakhir'] < 5
+    
+    client.get('/api/penerimaan')
+    assert db.query('SELECT p.*')
+    assert not replika.query('SELECT p.*')
+    
+    # Setelah MYSQL_REPLICA_MAX_LAG detik, sesi itu kembali membaca dari replika
+    with client.session_transaction() as sesi:
+        sesi['tulis_terakhir'] -= aplikasi.app.config['MYSQL_REPLICA_MAX_LAG'] + 1
+    client.get('/api/penerimaan')
+    assert replika.query('SELECT p.*')
@@ -0,0 +1,50 @@
+# tests/test_siaran.py
+from collections import deque
+
+import pytest
+
+import app as aplikasi
+
+
+@pytest.fixture
+def siaran(monkeypatch):
+    # Thread pemantau tidak dijalankan; event dikirim langsung lewat siarkan()
+    monkeypatch.setitem(aplikasi._siaran, 'events', deque())
+    monkeypatch.setitem(aplikasi._siaran, 'id', 0)
+    monkeypatch.setitem(aplikasi._siaran, 'pelanggan', 0)
+    monkeypatch.setitem(aplikasi._siaran, 'pemantau', object())
+    monkeypatch.setitem(aplikasi.app.config, 'SSE_HEARTBEAT', 0.01)
+    monkeypatch.setitem(aplikasi.app.config, 'SSE_BUFFER_SIZE', 4)
+    for nomor in range(6):
+        aplikasi.siarkan('kpi', {'nomor': nomor})
+    return aplikasi._siaran
+
+
+def awal_siaran(event_terakhir, jumlah):
+    generator = aplikasi.langganan_siaran(event_terakhir)
+    pesan = [next(generator) for _ in range(jumlah)]
+    generator.close()
+    return pesan[1:]  # lewati "retry:"
+
+
+def test_pelanggan_baru_mulai_dari_event_terbaru(siaran):
+    assert awal_siaran(0, 2) == [': ping\n\n']
+
+
+def test_tersambung_ulang_melanjutkan_dari_buffer(siaran):
+    assert awal_siaran(4, 3) == ['id: 5\nevent: kpi\ndata: {"nomor": 4}\n\n',
+                                 'id: 6\nevent: kpi\ndata: {"nomor": 5}\n\n']
+
+
+@pytest.mark.parametrize('event_terakhir', [
+    99,  # dari worker lain atau sebelum proses restart
+    1,   # event 2 sudah keluar dari buffer (hanya 3..6 yang tersimpan)
+])
+def test_last_event_id_tidak_dikenal_minta_muat_ulang(siaran, event_terakhir):
+    assert awal_siaran(event_terakhir, 3) == ['id: 6\nevent: versi\ndata: {"muat_ulang": true}\n\n',
+                                              ': ping\n\n']
+
+
+def test_jumlah_pelanggan_dikembalikan(siaran):
+    awal_siaran(0, 2)
+    assert siaran['pelanggan'] == 0
@@ -0,0 +1,163 @@
+# tests/test_stok_fefo.py
+from datetime import date
+
+import pytest
+
+import app as aplikasi
+
+
+class GudangPalsu:
+    """Tabel stok, lot_stok, dan mutasi_stok di memori untuk query layanan stok"""
+    
+    def __init__(self, lot):
+        self.lot = [dict(id=nomor, no_penerimaan=f'TRM-{nomor}', no_batch=None, **item)
+                    for nomor, item in enumerate(lot, start=1)]
+        self.stok = {}
+        for item in self.lot:
+            self.stok[item['bahan_id']] = self.stok.get(item['bahan_id'], 0) + item['sisa']
+        self.mutasi = []
+    
+    def sisa_lot(self, bahan_id):
+        return sum(item['sisa'] for item in self.lot if item['bahan_id'] == bahan_id)
+    
+    def _kurangi_stok(self, bahan_id, jumlah):
+        if self.stok.get(int(bahan_id), 0) < jumlah:
+            return 0
+        self.stok[int(bahan_id)] -= jumlah
+        return 1
+    
+    def __call__(self, query, args):
+        if query.startswith('UPDATE stok s JOIN ('):
+            return sum(self._kurangi_stok(bahan_id, jumlah) for bahan_id, jumlah in zip(args[::2], args[1::2]))
+        if query.startswith('UPDATE stok SET jumlah = jumlah - %s'):
+            return self._kurangi_stok(args[1], args[0])
+        if query.startswith('SELECT id, bahan_id, no_penerimaan, no_batch, tanggal_kadaluarsa, sisa FROM lot_stok'):
+            bahan = set(args)
+            lot = [dict(item) for item in self.lot if item['bahan_id'] in bahan]
+            return sorted(lot, key=lambda item: (item['bahan_id'], item['tanggal_kadaluarsa'] is None,
+                                                 item['tanggal_kadaluarsa'] or date.min, item['id']))
+        if query.startswith('UPDATE lot_stok SET sisa = sisa - %s WHERE id = %s'):
+            [item] = [item for item in self.lot if item['id'] == args[1]]
+            item['sisa'] -= args[0]
+            return 1
+        if query.startswith('DELETE FROM lot_stok WHERE id = %s'):
+            self.lot = [item for item in self.lot if item['id'] != args[0]]
+            return 1
+        if query.startswith('INSERT INTO mutasi_stok'):
+            self.mutasi.append(args)
+            return 1
+        if query.startswith('SELECT bahan_id, jumlah FROM stok WHERE bahan_id IN'):
+            return [{'bahan_id': bahan_id, 'jumlah': self.stok[bahan_id]} for bahan_id in args if bahan_id in self.stok]
+        if query.startswith('SELECT id, nama_bahan, satuan_id FROM bahan'):
+            return [{'id': bahan_id, 'nama_bahan': f'Bahan {bahan_id}', 'satuan_id': 1} for bahan_id in args]
+        return 0
+
+
+@pytest.fixture
+def gudang(db):
+    gudang = GudangPalsu([
+        {'bahan_id': 1, 'tanggal_kadaluarsa': date(2026, 12, 1), 'sisa': 10},
+        {'bahan_id': 1, 'tanggal_kadaluarsa': None, 'sisa': 20},
+        {'bahan_id': 1, 'tanggal_kadaluarsa': date(2026, 11, 1), 'sisa': 5},
+        {'bahan_id': 2, 'tanggal_kadaluarsa': date(2027, 1, 1), 'sisa': 8},
+    ])
+    db.handler = gudang
+    return gudang
+
+
+def test_pilih_lot_fefo_berhenti_saat_terpenuhi():
+    lot = [{'id': 1, 'sisa': 5}, {'id': 2, 'sisa': 10}, {'id': 3, 'sisa': 20}]
+    
+    assert [(item['id'], ambil) for item, ambil in aplikasi.pilih_lot_fefo(lot, 12)] == [(1, 5), (2, 7)]
+    assert [(item['id'], ambil) for item, ambil in aplikasi.pilih_lot_fefo(lot, 5)] == [(1, 5)]
+    assert aplikasi.pilih_lot_fefo(lot, 0) == []
+
+
+def test_kurangi_banyak_menjaga_stok_dan_lot_tetap_sama(db, gudang):
+    tanggal = date(2026, 10, 1)
+    mutasi = [(1, 7, tanggal, 'KLR-1'), (2, 3, tanggal, 'KLR-1'), (1, 6, tanggal, 'KLR-2')]
+    
+    assert aplikasi.kurangi_stok_banyak(db.cursor(), mutasi)
+    
+    assert gudang.stok == {1: 22, 2: 5}
+    for bahan_id, jumlah in gudang.stok.items():
+        assert gudang.sisa_lot(bahan_id) == jumlah
+    # FEFO: lot kadaluarsa paling awal habis dulu, lot tanpa tanggal kadaluarsa terakhir
+    assert [(item['id'], item['sisa']) for item in gudang.lot if item['bahan_id'] == 1] == [(1, 2), (2, 20)]
+    assert sorted(jumlah for _, _, _, jumlah, _ in gudang.mutasi) == [-7, -6, -3]
+
+
+def test_kurangi_banyak_gagal_jika_salah_satu_bahan_kurang(db, gudang):
+    mutasi = [(1, 30, date(2026, 10, 1), 'KLR-1'), (2, 9, date(2026, 10, 1), 'KLR-1')]
+    
+    assert not aplikasi.kurangi_stok_banyak(db.cursor(), mutasi)
+    # Lot dan kartu stok tidak disentuh; stok bahan yang sempat dikurangi dibatalkan rollback pemanggil
+    assert db.query('SELECT id, bahan_id, no_penerimaan') == []
+    assert gudang.mutasi == []
+    assert gudang.sisa_lot(1) == 35 and gudang.sisa_lot(2) == 8
+
+
+def test_kurangi_banyak_menolak_jumlah_tidak_positif(db, gudang):
+    assert not aplikasi.kurangi_stok_banyak(db.cursor(), [])
+    assert not aplikasi.kurangi_stok_banyak(db.cursor(), [(1, 0, date(2026, 10, 1), 'KLR-1')])
+    assert db.log == []
+
+
+def test_kurangi_stok_tunggal_menghabiskan_lot_terurut(db, gudang):
+    assert aplikasi.kurangi_stok(db.cursor(), 1, 35, date(2026, 10, 1), 'KLR-1')
+    
+    assert gudang.stok[1] == 0
+    assert gudang.sisa_lot(1) == 0
+    assert [item['bahan_id'] for item in gudang.lot] == [2]
+    assert not aplikasi.kurangi_stok(db.cursor(), 1, 1, date(2026, 10, 1), 'KLR-2')
+
+
+def test_kurangi_stok_memakai_update_bersyarat(db, gudang):
+    assert not aplikasi.kurangi_stok(db.cursor(), 2, 9, date(2026, 10, 1), 'KLR-1')
+    
+    [(query, args)] = db.query('UPDATE stok')
+    assert query.endswith('WHERE bahan_id = %s AND jumlah >= %s')
+    assert args == (9, 2, 9)
+    # Stok tidak cukup: tidak ada lot atau kartu stok yang disentuh
+    assert db.log == [(query, args)]
+
+
+def test_kurangi_banyak_satu_update_untuk_semua_bahan(db, gudang):
+    tanggal = date(2026, 10, 1)
+    mutasi = [(1, 7, tanggal, 'KLR-1'), (2, 3, tanggal, 'KLR-1'), (1, 6, tanggal, 'KLR-2')]
+    
+    assert aplikasi.kurangi_stok_banyak(db.cursor(), mutasi)
+    
+    [(query, args)] = db.query('UPDATE stok')
+    assert query.count('UNION ALL') == 1
+    assert 'WHERE s.jumlah >= k.jumlah' in query
+    # Baris bahan yang sama dijumlahkan dulu: satu baris permintaan per bahan
+    assert args == [1, 13, 2, 3]
+
+
+def test_cari_stok_kurang(db, gudang):
+    gudang.stok[2] = 8
+    
+    assert aplikasi.cari_stok_kurang(db.cursor(), {1: 30, 2: 9, 3: 1}) == {2: 8, 3: 0}
+
+
+def test_surat_jalan_rollback_dan_sebut_bahan_yang_kurang(db, gudang, monkeypatch):
+    stok_awal = dict(gudang.stok)
+    
+    def rollback():
+        gudang.stok = dict(stok_awal)
+        db.rollbacks += 1
+    monkeypatch.setattr(db, 'rollback', rollback)
+    header = {'tanggal': date(2026, 10, 1), 'tujuan': 'sekolah', 'jenis_tujuan': 'sekolah',
+              'nama_tujuan': 'SDN 1', 'alamat_tujuan': '', 'penerima': '', 'catatan': ''}
+    baris = [{'bahan_id': 1, 'jumlah': 30, 'satuan_id': None},
+             {'bahan_id': 2, 'jumlah': 9, 'satuan_id': None}]
+    
+    with aplikasi.app.test_request_context('/'):
+        hasil = aplikasi.simpan_surat_jalan(header, baris)
+    
+    # Bahan 1 sempat dikurangi (sisa 5 < 30) sebelum rollback, tetapi tidak boleh dilaporkan kurang
+    assert hasil == {'errors': ['Stok Bahan 2 tidak mencukupi (tersedia 8, diminta 9)']}
+    assert db.rollbacks == 1 and db.commits == 0
+    assert gudang.stok == stok_awal
+    assert db.query('INSERT INTO pengeluaran') == []
@@ -0,0 +1,92 @@
+# tests/test_surat_jalan.py
+import pytest
+
+import app as aplikasi
+
+HEADER = {'tanggal': '2026-10-01', 'tujuan': 'distribusi', 'jenis_tujuan': 'sekolah',
+          'nama_tujuan': 'SDN 01', 'alamat_tujuan': '', 'penerima': '', 'catatan': ''}
+
+
+@pytest.fixture
+def gudang(db):
+    """Stok cukup untuk semua bahan; set gudang['gagal'] untuk membuat INSERT pengeluaran error"""
+    keadaan = {'gagal': None}
+
+    def handler(query, args):
+        if query.startswith('SELECT id, nama_bahan, satuan_id FROM bahan'):
+            return [{'id': bahan_id, 'nama_bahan': f'Bahan {bahan_id}', 'satuan_id': 1} for bahan_id in args]
+        if query.startswith('UPDATE stok s JOIN'):
+            return len(args) // 2
+        if query.startswith('INSERT INTO pengeluaran') and keadaan['gagal']:
+            raise keadaan['gagal']
+        return []
+    db.handler = handler
+    return keadaan
+
+
+def test_api_menyimpan_surat_jalan(db, gudang, masuk):
+    respons = masuk('distribusi').post('/api/surat-jalan', json={
+        **HEADER, 'items': [{'bahan_id': 1, 'jumlah': 5}, {'bahan_id': 2, 'jumlah': 3}]})
+
+    assert respons.status_code == 201
+    assert respons.get_json()['total_baris'] == 2
+    assert db.commits == 1
+    [(_, baris)] = db.query('INSERT INTO pengeluaran')
+    assert [item[5:8] for item in baris] == [('distribusi', 'sekolah', 'SDN 01')] * 2
+
+
+@pytest.mark.parametrize('ubah, pesan', [
+    ({'tujuan': ''}, 'tujuan wajib diisi'),
+    ({'nama_tujuan': '   '}, 'nama_tujuan wajib diisi'),
+    ({'jenis_tujuan': 'kantor'}, 'jenis_tujuan harus salah satu dari'),
+    ({'nama_tujuan': 'x' * 201}, 'nama_tujuan maksimal 200 karakter'),
+    ({'tujuan': ['distribusi']}, 'tujuan harus berupa teks'),
+    ({'tanggal': '01-10-2026'}, 'tanggal wajib diisi dengan format YYYY-MM-DD'),
+])
+def test_api_menolak_header_tidak_valid(db, gudang, masuk, ubah, pesan):
+    respons = masuk('distribusi').post('/api/surat-jalan', json={
+        **HEADER, **ubah, 'items': [{'bahan_id': 1, 'jumlah': 5}]})
+
+    assert respons.status_code == 400
+    assert any(error.startswith(pesan) for error in respons.get_json()['errors'])
+    assert db.log == []
+
+
+def test_api_body_bukan_objek(db, gudang, masuk):
+    respons = masuk('distribusi').post('/api/surat-jalan', json=[HEADER])
+
+    assert respons.status_code == 400
+    assert db.log == []
+
+
+def test_api_error_database_menjadi_json(db, gudang, masuk):
+    gudang['gagal'] = aplikasi.MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded')
+
+    respons = masuk('distribusi').post('/api/surat-jalan', json={
+        **HEADER, 'items': [{'bahan_id': 1, 'jumlah': 5}]})
+
+    assert respons.status_code == 500
+    assert respons.get_json()['error'] == 'Surat jalan tidak disimpan'
+    assert 'Lock wait timeout' in respons.get_json()['errors'][0]
+    assert db.rollbacks == 1 and db.commits == 0
+
+
+def test_form_menolak_header_tidak_valid(db, gudang, masuk):
+    respons = masuk('distribusi').post('/tambah-surat-jalan', data={
+        **HEADER, 'jenis_tujuan': 'kantor', 'nama_tujuan': '',
+        'bahan_id': ['1'], 'jumlah': ['5'], 'satuan_id': ['']})
+
+    assert respons.status_code == 200
+    halaman = respons.get_data(as_text=True)
+    assert 'nama_tujuan wajib diisi' in halaman
+    assert 'jenis_tujuan harus salah satu dari' in halaman
+    assert db.query('INSERT INTO pengeluaran') == []
+
+
+def test_form_menyimpan_surat_jalan(db, gudang, masuk):
+    respons = masuk('distribusi').post('/tambah-surat-jalan', data={
+        **HEADER, 'bahan_id': ['1', '2'], 'jumlah': ['5', '3'], 'satuan_id': ['', '']})
+
+    assert respons.status_code == 302
+    assert db.commits == 1
+    assert len(db.query('INSERT INTO pengeluaran')[0][1]) == 2